@@ -0,0 +1,143 @@
+import sqlite3
+import numpy as np
+import pandas as pd
+import partition
+import snapshot
+
+FETCH_SIZE = 65536
+ROW_DTYPE = np.dtype([("expense_id", np.int64), ("category_id", np.int64), ("amount", np.float64), ("date", np.int64)]) # Day numbers, which are datetime64[D] values
+
+
+class ExpenseColumns:
+    def __init__(self, expense_ids, category_codes, amounts, dates, category_ids, category_names):
+        self.expense_ids = expense_ids  # int64
+        self.category_codes = category_codes  # int32 index into category_ids/category_names
+        self.amounts = amounts  # float64
+        self.dates = dates  # datetime64[D]
+        self.category_ids = category_ids
+        self.category_names = category_names
+
+    def __len__(self):
+        return len(self.amounts)
+
+
+def load_columns(expense, use_snapshot=True): # Non-deleted expenses as typed column arrays, memory-mapped from the snapshot by default
+    if use_snapshot:
+        try:
+            return snapshot.load(expense)
+        except (sqlite3.Error, OSError, ValueError) as e:
+            print(f"An error occurred while refreshing the analytics snapshot: {e}")
+            return None
+    try:
+        expense.check_dates()
+        conn = expense.db.connection()
+        cursor = conn.execute(f'''
+            SELECT E.expense_id, E.category_id, E.amount, E.date
+            FROM {partition.source(conn)} E
+            JOIN Categories C ON C.category_id = E.category_id
+            WHERE E.is_deleted = 0 AND E.tenant_id = ?
+            ORDER BY E.date, E.expense_id
+        ''', (expense.tenant_id,))
+        chunks = []
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            chunks.append(np.array(rows, dtype=ROW_DTYPE))
+        names = dict(conn.execute('SELECT category_id, category_name FROM Categories WHERE tenant_id = ?', (expense.tenant_id,)).fetchall())
+    except sqlite3.Error as e:
+        print(f"An error occurred while loading expenses for analytics: {e}")
+        return None
+    table = np.concatenate(chunks) if chunks else np.empty(0, dtype=ROW_DTYPE)
+    category_ids, codes = np.unique(table["category_id"], return_inverse=True)
+    return ExpenseColumns(
+        table["expense_id"],
+        codes.astype(np.int32),
+        table["amount"],
+        table["date"].astype("datetime64[D]"),
+        category_ids,
+        np.array([names[category_id] for category_id in category_ids], dtype=object),
+    )
+
+
+def monthly_trend(columns): # Total amount per month (rows) and category (columns), months without expenses included
+    month_index, month_codes = _period_codes(columns.dates, "M")
+    totals = _grouped_sum(month_codes, columns.category_codes, columns.amounts, len(month_index), len(columns.category_ids))
+    return pd.DataFrame(totals, index=pd.PeriodIndex(month_index, freq="M"), columns=columns.category_names)
+
+
+def rolling_average(columns, window=7, category_id=None): # Rolling mean of daily totals, days without expenses count as 0
+    amounts, dates = _select_category(columns, category_id)
+    if not len(dates):
+        return pd.Series(dtype=np.float64)
+    first = dates.min()
+    days = (dates - first).astype(np.int64)
+    daily = np.bincount(days, weights=amounts)
+    cumulative = np.concatenate(([0.0], np.cumsum(daily)))
+    window_sums = cumulative[window:] - cumulative[:-window] if len(daily) >= window else np.empty(0)
+    averages = np.full(len(daily), np.nan)
+    averages[window - 1:] = window_sums / window
+    return pd.Series(averages, index=pd.DatetimeIndex(first + np.arange(len(daily))), name=f"rolling_{window}d")
+
+
+def category_percentiles(columns, percentiles=(50, 90, 99)): # Amount percentiles per category
+    order = np.argsort(columns.category_codes, kind="stable") # np.percentile partitions each slice itself
+    amounts = columns.amounts[order]
+    bounds = np.searchsorted(columns.category_codes[order], np.arange(len(columns.category_ids) + 1))
+    values = np.array([np.percentile(amounts[start:end], percentiles) for start, end in zip(bounds[:-1], bounds[1:])])
+    return pd.DataFrame(values.reshape(len(columns.category_ids), len(percentiles)),
+                        index=columns.category_names, columns=[f"p{p}" for p in percentiles])
+
+
+def budget_burn_rate(columns, budget, month, today=None, category_id=None): # Spending pace against a monthly budget
+    month_start = np.datetime64(month, "M").astype("datetime64[D]")
+    next_month = (np.datetime64(month, "M") + 1).astype("datetime64[D]")
+    today = np.datetime64(today or "today", "D")
+    elapsed_days = int(np.clip((today - month_start).astype(np.int64) + 1, 1, (next_month - month_start).astype(np.int64)))
+    month_days = int((next_month - month_start).astype(np.int64))
+    amounts, dates = _select_category(columns, category_id)
+    spent = float(amounts[(dates >= month_start) & (dates < next_month)].sum())
+    daily_rate = spent / elapsed_days
+    return {
+        "spent": spent,
+        "budget": budget,
+        "used_fraction": spent / budget if budget else np.inf,
+        "daily_rate": daily_rate,
+        "projected_total": daily_rate * month_days,
+        "days_until_exhausted": (budget - spent) / daily_rate if daily_rate > 0 else np.inf,
+    }
+
+
+def year_over_year(columns): # Yearly totals per category with the change from the previous year
+    year_index, year_codes = _period_codes(columns.dates, "Y")
+    totals = _grouped_sum(year_codes, columns.category_codes, columns.amounts, len(year_index), len(columns.category_ids))
+    previous = np.vstack((np.full((1, totals.shape[1]), np.nan), totals[:-1])) if len(totals) else totals
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pct_change = (totals - previous) / previous * 100
+    index = pd.Index(year_index.astype(int) + 1970, name="year")
+    return pd.concat({
+        "total": pd.DataFrame(totals, index=index, columns=columns.category_names),
+        "delta": pd.DataFrame(totals - previous, index=index, columns=columns.category_names),
+        "pct_change": pd.DataFrame(pct_change, index=index, columns=columns.category_names),
+    }, axis=1)
+
+
+def _period_codes(dates, unit): # Contiguous period range covering the dates, and each date's offset in it
+    periods = dates.astype(f"datetime64[{unit}]")
+    if not len(periods):
+        return periods, np.empty(0, dtype=np.int64)
+    first = periods.min()
+    codes = (periods - first).astype(np.int64)
+    return first + np.arange(codes.max() + 1), codes
+
+
+def _grouped_sum(row_codes, column_codes, amounts, rows, cols): # Dense rows x cols matrix of summed amounts
+    flat = np.bincount(row_codes.astype(np.int64) * cols + column_codes, weights=amounts, minlength=rows * cols)
+    return flat.reshape(rows, cols)
+
+
+def _select_category(columns, category_id):
+    if category_id is None:
+        return columns.amounts, columns.dates
+    mask = columns.category_ids[columns.category_codes] == category_id
+    return columns.amounts[mask], columns.dates[mask]
@@ -0,0 +1,172 @@
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import synthetic
+import dates
+
+DATA_DIR = "benchmark_data"
+SIZES = (1_000, 10_000, 100_000)
+
+
+def _month(ctx):
+    return {"From": f"{ctx['month']}-01", "To": f"{ctx['month']}-28"}
+
+def _new_expense(ctx):
+    return {"category_id": ctx["category_id"], "amount": 99.0, "date": f"{ctx['month']}-15", "description": "benchmark store0001"}
+
+# name: (writes to the database, run(category, expense, ctx)); every public Category and Expense method
+OPERATIONS = {
+    "Category.get_all_categories": (False, lambda category, expense, ctx: category.get_all_categories()),
+    "Category.get_category": (False, lambda category, expense, ctx: category.get_category(ctx["category_id"])),
+    "Category.get_category_id_map": (False, lambda category, expense, ctx: category.get_category_id_map()),
+    "Category.add_category": (True, lambda category, expense, ctx: category.add_category(f"Benchmark {time.perf_counter_ns()}")),
+    "Category.soft_delete_category": (True, lambda category, expense, ctx: category.soft_delete_category(ctx["spare_category_id"])),
+    "Category.soft_delete_categories": (True, lambda category, expense, ctx: category.soft_delete_categories([ctx["spare_category_id"]], cascade=True)),
+    "Category.restore_categories": (True, lambda category, expense, ctx: category.restore_categories([ctx["spare_category_id"]], cascade=True)),
+    "Expense.get_all_expenses": (False, lambda category, expense, ctx: expense.get_all_expenses()),
+    "Expense.get_all_expenses_page": (False, lambda category, expense, ctx: expense.get_all_expenses_page(None, 50)),
+    "Expense.iter_all_expenses": (False, lambda category, expense, ctx: sum(1 for _ in expense.iter_all_expenses())),
+    "Expense.get_expense": (False, lambda category, expense, ctx: expense.get_expense(ctx["expense_id"])),
+    "Expense.get_expenses_by_date": (False, lambda category, expense, ctx: expense.get_expenses_by_date(_month(ctx))),
+    "Expense.get_expenses_by_date_page": (False, lambda category, expense, ctx: expense.get_expenses_by_date_page(_month(ctx), None, 50)),
+    "Expense.get_expenses_by_category": (False, lambda category, expense, ctx: expense.get_expenses_by_category(ctx["category_id"])),
+    "Expense.get_expenses_by_category_page": (False, lambda category, expense, ctx: expense.get_expenses_by_category_page(ctx["category_id"], None, 50)),
+    "Expense.query": (False, lambda category, expense, ctx: expense.query().filter(category_id=ctx["category_id"], from_to=_month(ctx), min_amount=100).order_by("-amount").limit(50).all()),
+    "Expense.query.aggregate": (False, lambda category, expense, ctx: expense.query().filter(from_to=_month(ctx)).aggregate("total", "count", by=("category_name",)).all()),
+    "Expense.search_expenses": (False, lambda category, expense, ctx: expense.search_expenses("coffee", _month(ctx))),
+    "Expense.get_category_totals": (False, lambda category, expense, ctx: expense.get_category_totals()),
+    "Expense.get_daily_totals": (False, lambda category, expense, ctx: expense.get_daily_totals(_month(ctx))),
+    "Expense.get_monthly_totals": (False, lambda category, expense, ctx: expense.get_monthly_totals()),
+    "Expense.get_partitions": (False, lambda category, expense, ctx: expense.get_partitions()),
+    "Expense.verify_rollups": (False, lambda category, expense, ctx: expense.verify_rollups()),
+    "Expense.plot_expenses_amount_by_category": (False, lambda category, expense, ctx: expense.plot_expenses_amount_by_category("png", tempfile.mkdtemp(dir=ctx["scratch_dir"]))),
+    "Expense.add_expenses": (True, lambda category, expense, ctx: expense.add_expenses(_new_expense(ctx))),
+    "Expense.add_expenses_bulk": (True, lambda category, expense, ctx: expense.add_expenses_bulk([_new_expense(ctx)] * 1000)),
+    "Expense.soft_delete_expense": (True, lambda category, expense, ctx: expense.soft_delete_expense(ctx["expense_id"])),
+    "Expense.soft_delete_expenses": (True, lambda category, expense, ctx: expense.soft_delete_expenses(from_to=_month(ctx))),
+    "Expense.restore_expenses": (True, lambda category, expense, ctx: expense.restore_expenses(from_to=_month(ctx))),
+    "Expense.rebuild_rollups": (True, lambda category, expense, ctx: expense.rebuild_rollups()),
+}
+
+
+def dataset(size, seed=0, data_dir=DATA_DIR): # Path of the synthetic database of a size, created on first use
+    os.makedirs(data_dir, exist_ok=True)
+    db_name = os.path.join(data_dir, f"expenses_{size}_{seed}.db")
+    if not os.path.exists(db_name):
+        tmp_name = f"{db_name}.tmp"
+        synthetic.create_dataset(tmp_name, size, seed)
+        from connection import ConnectionManager
+        ConnectionManager.for_database(tmp_name).close()
+        os.replace(tmp_name, db_name) # An interrupted run does not leave a half filled dataset behind
+    return db_name
+
+
+def scratch_copy(db_name): # Writes go to a copy, so the dataset stays the same between runs
+    scratch_name = f"{os.path.splitext(db_name)[0]}_scratch.db"
+    source, target = sqlite3.connect(db_name), sqlite3.connect(scratch_name)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+    return scratch_name
+
+
+def run_benchmark(sizes=SIZES, operations=None, repeat=5, seed=0, data_dir=DATA_DIR): # {size: {operation: {p50_ms, p99_ms, peak_rss_mb}}}
+    operations = operations or list(OPERATIONS)
+    results = {}
+    # One fresh process per operation, so its peak RSS is its own and caches do not carry over
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context, max_tasks_per_child=1) as executor:
+        for size in sizes:
+            db_name = dataset(size, seed, data_dir)
+            scratch_name = scratch_copy(db_name)
+            jobs = [(scratch_name if OPERATIONS[name][0] else db_name, name, repeat) for name in operations]
+            results[str(size)] = dict(zip(operations, executor.map(_run_operation, jobs)))
+    return results
+
+
+def _run_operation(job): # Worker process: warm up once, then time repeat calls
+    import resource
+    from category import Category
+    from expense import Expense
+    db_name, name, repeat = job
+    category, expense = Category(db_name), Expense(db_name)
+    conn = expense.db.connection()
+    ctx = {
+        "category_id": min(category.get_category_id_map().values()),
+        "spare_category_id": category.add_category("Benchmark spare")[0] if OPERATIONS[name][0] else None,
+        "expense_id": (conn.execute('SELECT MAX(expense_id) FROM Expenses').fetchone()[0] or 0) // 2,
+        "month": (conn.execute(f"SELECT {dates.sql_text('MAX(date)')} FROM Expenses").fetchone()[0] or "2024-12-31")[:7],
+        "scratch_dir": tempfile.mkdtemp(),
+    }
+    run = OPERATIONS[name][1]
+    run(category, expense, ctx)
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run(category, expense, ctx)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    shutil.rmtree(ctx["scratch_dir"], ignore_errors=True)
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "p50_ms": timings[len(timings) // 2] * 1000,
+        "p99_ms": timings[max(0, math.ceil(len(timings) * 0.99) - 1)] * 1000,
+        "peak_rss_mb": peak_rss / (1024 * 1024 if sys.platform == "darwin" else 1024), # bytes on macOS, KiB on Linux
+    }
+
+
+def compare(results, baseline, tolerance=0.25, rss_tolerance=0.25, min_ms=1.0): # Regressions against a baseline, as messages
+    regressions = []
+    for size, operations in results.items():
+        for name, result in operations.items():
+            base = baseline.get(size, {}).get(name)
+            if base is None:
+                continue
+            # Sub-millisecond timings are mostly noise, so a regression must also cost min_ms
+            if result["p50_ms"] > max(base["p50_ms"] * (1 + tolerance), base["p50_ms"] + min_ms):
+                regressions.append(f"{name} at {size} rows: p50 {result['p50_ms']:.2f} ms, baseline {base['p50_ms']:.2f} ms")
+            if result["peak_rss_mb"] > base["peak_rss_mb"] * (1 + rss_tolerance):
+                regressions.append(f"{name} at {size} rows: peak RSS {result['peak_rss_mb']:.0f} MB, baseline {base['peak_rss_mb']:.0f} MB")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time every Category/Expense operation on synthetic datasets")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES), help="expenses per dataset, e.g. 100000 1000000 10000000")
+    parser.add_argument('--operations', nargs='+', choices=list(OPERATIONS), default=None)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', default=DATA_DIR, help="datasets are created once and reused")
+    parser.add_argument('--baseline', help="JSON results of an earlier run; a regression fails the run")
+    parser.add_argument('--save-baseline', help="write the results to this JSON file")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed p50 slowdown, 0.25 = 25%%")
+    parser.add_argument('--rss-tolerance', type=float, default=0.25)
+    args = parser.parse_args(argv)
+    results = run_benchmark(args.sizes, args.operations, args.repeat, args.seed, args.data_dir)
+    print(f"{'operation':<42}{'rows':>10}{'p50 ms':>12}{'p99 ms':>12}{'peak MB':>10}")
+    for size, operations in results.items():
+        for name, result in operations.items():
+            print(f"{name:<42}{size:>10}{result['p50_ms']:>12.2f}{result['p99_ms']:>12.2f}{result['peak_rss_mb']:>10.0f}")
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as file:
+            regressions = compare(results, json.load(file), args.tolerance, args.rss_tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
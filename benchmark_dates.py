@@ -0,0 +1,105 @@
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+from connection import ConnectionManager
+import dates
+import synthetic
+
+# The pre-migration layout: dates as 'yyyy-mm-dd' TEXT, same indexes
+TEXT_TABLE = '''
+    CREATE TABLE Expenses (
+        expense_id INTEGER PRIMARY KEY, category_id INTEGER, amount REAL NOT NULL, date TEXT NOT NULL,
+        description TEXT, is_deleted INTEGER DEFAULT 0, tenant_id TEXT NOT NULL DEFAULT ''
+    )
+'''
+INDEXES = ("idx_expenses_date", "idx_expenses_category_date")
+QUERIES = {
+    "month range": "SELECT COUNT(*), SUM(amount) FROM Expenses WHERE tenant_id = '' AND is_deleted = 0 AND date BETWEEN ? AND ?",
+    "category + month range": "SELECT COUNT(*), SUM(amount) FROM Expenses WHERE category_id = ? AND is_deleted = 0 AND date BETWEEN ? AND ?",
+}
+
+
+def text_copy(db_name): # Same expenses with TEXT dates, as a database from before the migration stored them
+    text_name = f"{os.path.splitext(db_name)[0]}_text.db"
+    if os.path.exists(text_name):
+        return text_name
+    source, target = sqlite3.connect(db_name), sqlite3.connect(text_name)
+    try:
+        target.execute(TEXT_TABLE)
+        target.executemany('INSERT INTO Expenses VALUES (?, ?, ?, ?, ?, ?, ?)', source.execute(f'''
+            SELECT expense_id, category_id, amount, {dates.sql_text('date')}, description, is_deleted, tenant_id FROM Expenses
+        '''))
+        for name in INDEXES:
+            target.execute(source.execute("SELECT sql FROM sqlite_master WHERE name = ?", (name,)).fetchone()[0])
+        target.commit()
+        target.execute('VACUUM')
+    finally:
+        source.close()
+        target.close()
+    return text_name
+
+
+def sizes(db_name): # {table or index: bytes}, None where SQLite was built without the dbstat table
+    conn = sqlite3.connect(db_name)
+    try:
+        return dict(conn.execute(f'''
+            SELECT name, SUM(pgsize) FROM dbstat WHERE name IN ('Expenses', {", ".join("?" * len(INDEXES))}) GROUP BY name
+        ''', INDEXES).fetchall())
+    except sqlite3.OperationalError:
+        return {}
+    finally:
+        conn.close()
+
+
+def time_query(db_name, sql, params_list, repeat): # Median seconds of sql over the parameter sets
+    conn = sqlite3.connect(db_name)
+    try:
+        timings = []
+        for _ in range(repeat):
+            for params in params_list:
+                started = time.perf_counter()
+                conn.execute(sql, params).fetchall()
+                timings.append(time.perf_counter() - started)
+        timings.sort()
+        return timings[len(timings) // 2]
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare day-number dates with the old TEXT dates: index size and range queries")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--db', default='benchmark_dates.db', help="reused if it exists")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    if not os.path.exists(args.db):
+        started = time.perf_counter()
+        synthetic.create_dataset(args.db, args.rows, args.seed)
+        ConnectionManager.close_all()
+        sqlite3.connect(args.db).execute('VACUUM')
+        print(f"Created {args.rows} expenses in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    text_name = text_copy(args.db)
+
+    day_sizes, text_sizes = sizes(args.db), sizes(text_name)
+    print(f"{'':<28}{'TEXT':>12}{'day number':>12}")
+    for name in ("Expenses", *INDEXES):
+        if name in day_sizes and name in text_sizes:
+            print(f"{name + ' MB':<28}{text_sizes[name] / 2**20:>12.1f}{day_sizes[name] / 2**20:>12.1f}")
+
+    rng = random.Random(args.seed)
+    months = [f"{rng.randint(2019, 2024)}-{rng.randint(1, 12):02d}" for _ in range(20)]
+    ranges = [(f"{month}-01", f"{month}-28") for month in months]
+    category_id = sqlite3.connect(args.db).execute('SELECT MIN(category_id) FROM Categories').fetchone()[0]
+    for label, sql in QUERIES.items():
+        prefix = (category_id,) if "category" in label else ()
+        text_ms = time_query(text_name, sql, [(*prefix, first, last) for first, last in ranges], args.repeat) * 1000
+        day_ms = time_query(args.db, sql, [(*prefix, dates.to_day(first), dates.to_day(last)) for first, last in ranges], args.repeat) * 1000
+        print(f"{label + ' ms':<28}{text_ms:>12.2f}{day_ms:>12.2f}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,53 @@
+import argparse
+import os
+import sys
+import time
+from itertools import chain
+from category import Category
+from connection import ConnectionManager
+from expense import Expense
+import benchmark
+import synthetic
+
+
+def incoming(category_ids, rows, seed): # Half a re-import of the dataset's first expenses, half new ones
+    # generate_expenses yields the same expenses for the same seed, so this repeats the first rows // 2 of the dataset
+    return list(chain(synthetic.generate_expenses(category_ids, rows // 2, seed), synthetic.generate_expenses(category_ids, rows - rows // 2, seed + 1)))
+
+
+def time_import(db_name, rows, policy, window_days, chunk_size): # (seconds, result of add_expenses_bulk) on a fresh copy
+    scratch_name = benchmark.scratch_copy(db_name)
+    try:
+        expense = Expense(scratch_name)
+        started = time.perf_counter()
+        result = expense.add_expenses_bulk(rows, chunk_size, policy, window_days)
+        return time.perf_counter() - started, result
+    finally:
+        ConnectionManager.for_database(scratch_name).close()
+        os.remove(scratch_name)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import throughput with each duplicate policy, into a database that already holds --rows expenses")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--import-rows', type=int, default=100_000, help="half of them repeat existing expenses")
+    parser.add_argument('--window-days', type=int, default=3)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', default=benchmark.DATA_DIR)
+    args = parser.parse_args(argv)
+    db_name = benchmark.dataset(args.rows, args.seed, args.data_dir)
+    category_ids = Category(db_name).get_category_id_map()
+    ConnectionManager.for_database(db_name).close()
+    rows = incoming(category_ids, args.import_rows, args.seed)
+
+    print(f"{'policy':<16}{'window':>8}{'rows/s':>12}{'inserted':>10}{'duplicates':>12}")
+    for policy, window_days in (("allow", 0), ("reject", 0), ("merge", 0), ("merge", args.window_days), ("flag", args.window_days)):
+        seconds, result = time_import(db_name, rows, policy, window_days, args.chunk_size)
+        inserted = sum(last - first + 1 for first, last in result["inserted"])
+        duplicates = len(result["merged"]) + len(result["flagged"]) + len(result["rejected"])
+        print(f"{policy:<16}{window_days:>8}{len(rows) / seconds:>12,.0f}{inserted:>10}{duplicates:>12}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,52 @@
+import argparse
+import os
+import sys
+import time
+from expense import Expense
+from connection import ConnectionManager
+import synthetic
+
+
+def like_scan(expense, word, limit): # What finding expenses by text costs without the index
+    return expense.db.connection().execute('''
+        SELECT expense_id FROM Expenses WHERE is_deleted = 0 AND description LIKE ? LIMIT ?
+    ''', (f"%{word}%", limit)).fetchall()
+
+
+def time_queries(run, words, repeat): # Median seconds of run(word) over the words
+    timings = []
+    for _ in range(repeat):
+        for word in words:
+            started = time.perf_counter()
+            run(word)
+            timings.append(time.perf_counter() - started)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare search_expenses (FTS5) with a LIKE scan")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--db', default='benchmark_search.db', help="reused if it exists")
+    parser.add_argument('--limit', type=int, default=50, help="rows per page")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+    if not os.path.exists(args.db):
+        started = time.perf_counter()
+        synthetic.create_dataset(args.db, args.rows)
+        print(f"Created {args.rows} expenses in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    expense = Expense(args.db)
+    words = ["coffee", "lunch", "taxi", "rent", "pharmacy", "movie", "internet", "shoes"]
+    fts = time_queries(lambda word: expense.search_expenses(word, limit=args.limit), words, args.repeat)
+    like = time_queries(lambda word: like_scan(expense, word, args.limit), words, args.repeat)
+    # A rare merchant makes LIKE scan most of the table for its page, the index goes straight to the matches
+    rare_merchants = [synthetic.merchant_name(rank) for rank in range(synthetic.MERCHANTS - 3, synthetic.MERCHANTS)]
+    rare = time_queries(lambda word: expense.search_expenses(word, limit=args.limit), rare_merchants, args.repeat)
+    rare_like = time_queries(lambda word: like_scan(expense, word, args.limit), rare_merchants, args.repeat)
+    print(f"common word: FTS5 {fts * 1000:.2f} ms, LIKE {like * 1000:.2f} ms")
+    print(f"rare word:   FTS5 {rare * 1000:.2f} ms, LIKE {rare_like * 1000:.2f} ms")
+    ConnectionManager.close_all()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,52 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class QueryCache:
+    def __init__(self, maxsize=256, ttl=300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._version = None
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, conn, key, load): # Cached load() result; reloaded when expired or another connection committed
+        # data_version only changes for commits made by *other* connections, own writes call invalidate()
+        data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+        now = time.monotonic()
+        with self._lock:
+            # Holding the connection itself, not its id(), so a reopened connection never matches
+            if self._version is None or self._version[0] is not conn or self._version[1] != data_version:
+                self._clear()
+                self._version = (conn, data_version)
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self._generation
+        value = load()
+        with self._lock:
+            if generation == self._generation: # Not invalidated while loading
+                self._entries[key] = (now, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self): # Drop every entry after a write
+        with self._lock:
+            self._clear()
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+    def _clear(self):
+        self._entries.clear()
+        self._generation += 1
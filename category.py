@@ -1,86 +1,119 @@
+import json
 import sqlite3
+import threading
+from connection import ConnectionManager, ensure_column
+from cache import QueryCache
 
 class Category:
-    def __init__(self, db_name):
+    _caches = {}
+    _caches_lock = threading.Lock()
+
+    def __init__(self, db_name, cache_size=256, cache_ttl=300.0, tenant_id=''):
         self.db_name = db_name
+        self.tenant_id = tenant_id # Tenants sharing a database file only see their own categories
+        self.db = ConnectionManager.for_database(db_name)
+        with Category._caches_lock: # One cache per database and tenant, so every instance sees the others' writes
+            self.cache = Category._caches.setdefault((self.db, tenant_id), QueryCache(cache_size, cache_ttl))
 
     def create_table(self): # Create Categories table
         try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS Categories (
-                    category_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    category_name TEXT NOT NULL,
-                    is_deleted INTEGER DEFAULT 0
-                )
-            ''')
-            conn.commit()
+            with self.db.transaction() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS Categories (
+                        category_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        category_name TEXT NOT NULL,
+                        is_deleted INTEGER DEFAULT 0,
+                        tenant_id TEXT NOT NULL DEFAULT '',
+                        deleted_at TEXT
+                    )
+                ''')
+                ensure_column(conn, 'Categories', 'tenant_id', "TEXT NOT NULL DEFAULT ''")
+                ensure_column(conn, 'Categories', 'deleted_at', "TEXT")
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_categories_tenant ON Categories (tenant_id)')
         except sqlite3.Error as e:
             print(f"An error occurred while creating the Categories table: {e}")
-        finally:
-            conn.close()
 
     def add_category(self, category_name): # Add row of category
-        try:
-            conn = sqlite3.connect(self.db_name)
+        def insert(conn):
             cursor = conn.cursor()
             cursor.execute('''
-                INSERT INTO Categories (category_name) VALUES (?)
-            ''', (category_name,))
-            conn.commit()
-            return (cursor.lastrowid, category_name)
+                INSERT INTO Categories (category_name, tenant_id) VALUES (?, ?)
+            ''', (category_name, self.tenant_id))
+            return cursor.lastrowid
+        try:
+            category_id = self.db.write(insert)
+            self.cache.invalidate()
+            return (category_id, category_name)
         except sqlite3.IntegrityError:
             print(f"The category '{category_name}' already exists.")
         except sqlite3.Error as e:
             print(f"An error occurred while adding the category '{category_name}': {e}")
-        finally:
-            conn.close()
-        
+
     def get_all_categories(self): # Get all row of category
         try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT * FROM Categories WHERE is_deleted = 0
-            ''')
-            categories = cursor.fetchall()
+            conn = self.db.connection()
+            categories = self.cache.get(conn, "all", lambda: conn.execute('''
+                SELECT category_id, category_name, is_deleted FROM Categories WHERE is_deleted = 0 AND tenant_id = ?
+            ''', (self.tenant_id,)).fetchall())
             if categories:
-                return categories
+                return list(categories)
             else:
                 print("There's no category in the table")
                 return None
         except sqlite3.Error as e:
             print(f"An error occurred while retrieving categories: {e}")
             return None
-        finally:
-            conn.close()
-          
+
     def get_category(self, category_id): # Get category by ID
         try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT * FROM Categories WHERE is_deleted = 0 AND category_id = (?)
-            ''',(category_id,))
-            category = cursor.fetchone()  # Use fetchone() for a single result
+            conn = self.db.connection()
+            category = self.cache.get(conn, ("id", category_id), lambda: conn.execute('''
+                SELECT category_id, category_name, is_deleted FROM Categories WHERE is_deleted = 0 AND category_id = (?) AND tenant_id = ?
+            ''',(category_id, self.tenant_id)).fetchone())  # Use fetchone() for a single result
             return category  # Returns None if no result is found
         except sqlite3.Error as e:
             print(f"An error occurred while retrieving category: {e}")
             return None
-        finally:
-            conn.close()
-    
-    def soft_delete_category(self, category_id): # Soft delete category by ID
+
+    def get_category_id_map(self): # Get {category_name: category_id} of all categories
         try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
-            cursor.execute('''
-                UPDATE Categories SET is_deleted = 1 WHERE category_id = ?
-            ''', (category_id,))
-            conn.commit()
-            return category_id
+            conn = self.db.connection()
+            return dict(self.cache.get(conn, "id_map", lambda: conn.execute('''
+                SELECT category_name, category_id FROM Categories WHERE is_deleted = 0 AND tenant_id = ?
+            ''', (self.tenant_id,)).fetchall()))
         except sqlite3.Error as e:
-            print(f"An error occurred while deleting the category with ID {category_id}: {e}")
-        finally:
-            conn.close()
\ No newline at end of file
+            print(f"An error occurred while retrieving categories: {e}")
+            return {}
+
+    def soft_delete_category(self, category_id, cascade=False): # Soft delete category by ID, and its expenses with cascade
+        if self.soft_delete_categories([category_id], cascade) is not None:
+            return category_id
+
+    def soft_delete_categories(self, category_ids, cascade=False): # Soft delete categories in one transaction, returns (categories, expenses) counts
+        return self._set_deleted(1, category_ids, cascade)
+
+    def restore_categories(self, category_ids, cascade=False): # Undo soft deletes of categories, with cascade also of all their deleted expenses
+        return self._set_deleted(0, category_ids, cascade)
+
+    def _set_deleted(self, is_deleted, category_ids, cascade):
+        def update(conn):
+            categories = conn.execute('''
+                UPDATE Categories SET is_deleted = ?, deleted_at = CASE WHEN ? THEN datetime('now') END
+                WHERE category_id IN (SELECT value FROM json_each(?)) AND tenant_id = ? AND is_deleted = ?
+            ''', (is_deleted, is_deleted, json.dumps(ids), self.tenant_id, 1 - is_deleted)).rowcount
+            expenses = 0
+            if cascade:
+                from expense import Expense, selection # Deferred, Category is used without the Expense dependencies
+                expenses = Expense(self.db_name, self.tenant_id)._set_deleted(conn, is_deleted, *selection(category_ids=ids))
+            return categories, expenses
+        try:
+            ids = [int(category_id) for category_id in category_ids]
+            counts = self.db.write(update)
+            self.cache.invalidate() # Once per batch
+            return counts
+        except (sqlite3.Error, ValueError) as e:
+            print(f"An error occurred while {'deleting' if is_deleted else 'restoring'} the categories {category_ids}: {e}")
+
+    def cache_stats(self): # Get hit/miss counters of the category cache
+        return self.cache.stats()
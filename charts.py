@@ -0,0 +1,64 @@
+import hashlib
+import json
+import os
+
+FORMATS = ("png", "svg")
+
+
+def category_pie_data(expense): # [(category_name, total_amount)] of all time, from the total tables
+    totals = {}
+    for _, name, total_amount, _ in expense.get_category_totals():
+        totals[name] = totals.get(name, 0.0) + total_amount
+    return sorted(totals.items())
+
+def monthly_totals_data(expense): # [(month, total_amount)] over all categories
+    totals = {}
+    for month, _, _, total_amount, _ in expense.get_monthly_totals():
+        totals[month] = totals.get(month, 0.0) + total_amount
+    return sorted(totals.items())
+
+def chart_path(kind, data, fmt="png", cache_dir="charts"): # File name keyed on a fingerprint of the chart data
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported chart format '{fmt}', expected one of {FORMATS}")
+    fingerprint = hashlib.sha256(json.dumps([kind, data], sort_keys=True).encode()).hexdigest()[:20]
+    return os.path.join(cache_dir, f"{kind}-{fingerprint}.{fmt}")
+
+def render(kind, data, fmt="png", cache_dir="charts"): # Render to a file on the Agg backend; reuse it if the data is unchanged
+    path = chart_path(kind, data, fmt, cache_dir)
+    if os.path.exists(path):
+        return path
+    os.makedirs(cache_dir, exist_ok=True)
+    from matplotlib.figure import Figure # Deferred until a chart is actually drawn
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    figure = Figure(figsize=(10, 6))
+    FigureCanvasAgg(figure)
+    CHARTS[kind](figure.add_subplot(), data)
+    tmp_path = f"{path}.{os.getpid()}.tmp" # Parallel workers never see a half written file
+    figure.savefig(tmp_path, format=fmt)
+    os.replace(tmp_path, path)
+    return path
+
+def render_many(jobs, processes=None): # Render (kind, data, fmt, cache_dir) jobs in worker processes
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        return list(executor.map(_render_job, jobs))
+
+def _render_job(job):
+    return render(*job)
+
+def _draw_category_pie(ax, data):
+    labels = [name for name, _ in data]
+    totals = [total for _, total in data]
+    grand_total = sum(totals)
+    ax.pie(totals, labels=labels, autopct=lambda pct: "{:.1f}%\n({:d}฿)".format(pct, int(pct/100.*grand_total)))
+    ax.set_title('All time Expenses sum amount by Category')
+
+def _draw_monthly_totals(ax, data):
+    ax.bar([month for month, _ in data], [total for _, total in data])
+    ax.set_title('Expenses sum amount by Month')
+    ax.tick_params(axis='x', labelrotation=90)
+
+CHARTS = {
+    "category_pie": _draw_category_pie,
+    "monthly_totals": _draw_monthly_totals,
+}
@@ -0,0 +1,202 @@
+import argparse
+import sys
+import category as cat
+import expense as exp
+import transfer
+import charts
+import dedupe
+import instrument
+from connection import ConnectionManager, MEMORY_MODES, MULTI_PROCESS_SETTINGS
+
+
+def open_database(db_name): # Create tables if needed and return (category, expense)
+    ConnectionManager.for_database(db_name).configure(**MULTI_PROCESS_SETTINGS)
+    category = cat.Category(db_name)
+    expense = exp.Expense(db_name)
+    category.create_table()
+    expense.create_table()
+    return category, expense
+
+def import_command(args):
+    category, expense = open_database(args.db)
+    with open(args.file, newline='', encoding='utf-8') as file:
+        if args.format == 'ofx' or (args.format is None and args.file.lower().endswith(('.ofx', '.qfx'))):
+            summary = transfer.import_ofx(expense, category, file, args.category, args.chunk_size, args.duplicates, args.window_days)
+        else:
+            summary = transfer.import_csv(expense, category, file, args.chunk_size, args.duplicates, args.window_days)
+    print(f"Imported {summary['inserted']} expenses, created {summary['categories_created']} categories"
+          + (f", merged {len(summary['merged'])} duplicates" if summary["merged"] else "")
+          + (f", flagged {len(summary['flagged'])} possible duplicates" if summary["flagged"] else ""))
+    for line, reason in summary["rejected"]:
+        print(f"Rejected row {line}: {reason}", file=sys.stderr)
+    for line, expense_id in summary["flagged"]:
+        print(f"Flagged row {line}: possible duplicate of expense {expense_id}", file=sys.stderr)
+    return 1 if summary["rejected"] else 0
+
+def export_command(args):
+    _, expense = open_database(args.db)
+    if args.file == '-':
+        count = transfer.export_csv(expense, sys.stdout)
+    else:
+        with open(args.file, 'w', newline='', encoding='utf-8') as file:
+            count = transfer.export_csv(expense, file)
+    print(f"Exported {count} expenses", file=sys.stderr)
+    return 0
+
+def rollups_command(args):
+    _, expense = open_database(args.db)
+    if args.action == 'rebuild':
+        return 0 if expense.rebuild_rollups() else 1
+    mismatches = expense.verify_rollups()
+    if mismatches is None:
+        return 1
+    for table, key, stored, expected in mismatches:
+        print(f"{table} {key}: stored {stored}, expected {expected}")
+    print(f"{len(mismatches)} mismatched rows", file=sys.stderr)
+    return 1 if mismatches else 0
+
+def partitions_command(args):
+    _, expense = open_database(args.db)
+    if args.action == 'close':
+        if args.period is None:
+            print("partitions close needs a period, e.g. 2023 or 2024-01", file=sys.stderr)
+            return 2
+        row_count = expense.close_partition(args.period)
+        if row_count is None:
+            return 1
+        print(f"Moved {row_count} expenses of {args.period} to a read-only partition", file=sys.stderr)
+        return 0
+    for period, first_day, last_day, file, row_count in expense.get_partitions():
+        print(f"{period}\t{first_day}\t{last_day}\t{file}\t{row_count}")
+    return 0
+
+def delete_command(args):
+    _, expense = open_database(args.db)
+    from_to = None
+    if args.date_from or args.date_to:
+        from_to = {"From": args.date_from or "0001-01-01", "To": args.date_to or "9999-12-31"} # The range dates.to_day accepts
+    if args.command == 'delete':
+        count = expense.soft_delete_expenses(args.ids, from_to, args.category_id, args.match)
+    else:
+        count = expense.restore_expenses(args.ids, from_to, args.category_id, args.match)
+    if count is None:
+        return 1
+    print(f"{'Deleted' if args.command == 'delete' else 'Restored'} {count} expenses", file=sys.stderr)
+    return 0
+
+def compact_command(args):
+    import compaction
+    _, expense = open_database(args.db)
+    result = compaction.compact(expense.db, args.retention_days, args.chunk_size, args.pause)
+    print(f"Archived {result['Expenses']} expenses and {result['Categories']} categories to {compaction.archive_file(args.db)} "
+          f"in {result['chunks']} chunks, freed {result['freed_pages']} pages", file=sys.stderr)
+    return 0
+
+def snapshot_command(args):
+    import snapshot # Deferred, it needs NumPy
+    _, expense = open_database(args.db)
+    result = snapshot.refresh(expense)
+    print(f"{'Rebuilt' if result['rebuilt'] else 'Refreshed'} {snapshot.snapshot_dir(expense)}: "
+          f"{result['appended']} expenses appended, {result['rows']} in total", file=sys.stderr)
+    return 0
+
+def charts_command(args):
+    _, expense = open_database(args.db)
+    data = {"category_pie": charts.category_pie_data(expense), "monthly_totals": charts.monthly_totals_data(expense)}
+    jobs = [(kind, data[kind], fmt, args.out_dir) for kind in args.charts for fmt in args.format]
+    for path in charts.render_many(jobs, args.processes):
+        print(path)
+    return 0
+
+def loadtest_command(args):
+    import asyncio
+    import service
+    result = asyncio.run(service.load_test(args.db, args.duration, args.concurrency, args.write_ratio, args.readers))
+    print(f"{result['requests']} requests in {result['seconds']:.2f}s: {result['requests_per_second']:.0f} requests/sec, "
+          f"p50 {result['p50_ms']:.2f} ms, p99 {result['p99_ms']:.2f} ms")
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Non-interactive commands for the expense tracker database")
+    parser.add_argument('db', help="database file, e.g. <user_name>.db")
+    parser.add_argument('--stats', action='store_true', help="print per-statement timings to stderr when done")
+    parser.add_argument('--slow-ms', type=float, default=100.0, help="with --stats, log statements at least this slow with their query plan")
+    parser.add_argument('--slow-log', help="with --stats, also append slow statements to this JSON-lines file")
+    parser.add_argument('--in-memory', choices=MEMORY_MODES, help="load the database into RAM for the command; "
+                        "write-back writes changes to the file once at the end, write-through copies the whole file after every write")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = commands.add_parser('import', help="import a CSV or OFX bank export")
+    import_parser.add_argument('file')
+    import_parser.add_argument('--format', choices=['csv', 'ofx'], help="default: guessed from the file extension")
+    import_parser.add_argument('--category', default='Uncategorized', help="category name for OFX transactions")
+    import_parser.add_argument('--chunk-size', type=int, default=1000)
+    import_parser.add_argument('--duplicates', choices=dedupe.POLICIES, default='allow',
+                               help="rows with the category, amount and description of an existing expense: "
+                                    "reject them, merge them into it, or flag them and insert anyway")
+    import_parser.add_argument('--window-days', type=int, default=0, help="with --duplicates, also match expenses this many days apart")
+    import_parser.set_defaults(handler=import_command)
+
+    export_parser = commands.add_parser('export', help="export all expenses as CSV")
+    export_parser.add_argument('file', nargs='?', default='-', help="default: stdout")
+    export_parser.set_defaults(handler=export_command)
+
+    rollups_parser = commands.add_parser('rollups', help="rebuild or verify the per-category/day/month total tables")
+    rollups_parser.add_argument('action', choices=['rebuild', 'verify'])
+    rollups_parser.set_defaults(handler=rollups_command)
+
+    charts_parser = commands.add_parser('charts', help="render charts to files, reusing files of unchanged data")
+    charts_parser.add_argument('--charts', nargs='+', choices=list(charts.CHARTS), default=list(charts.CHARTS))
+    charts_parser.add_argument('--format', nargs='+', choices=charts.FORMATS, default=['png'])
+    charts_parser.add_argument('--out-dir', default='charts')
+    charts_parser.add_argument('--processes', type=int, default=None, help="default: one per CPU")
+    charts_parser.set_defaults(handler=charts_command)
+
+    for name, help_text in (('delete', "soft delete the expenses matching every given selector in one transaction"),
+                            ('restore', "undo soft deletes of the expenses matching every given selector")):
+        delete_parser = commands.add_parser(name, help=help_text)
+        delete_parser.add_argument('--ids', type=int, nargs='+', help="expense ids")
+        delete_parser.add_argument('--from', dest='date_from', help="yyyy-mm-dd, inclusive")
+        delete_parser.add_argument('--to', dest='date_to', help="yyyy-mm-dd, inclusive")
+        delete_parser.add_argument('--category-id', type=int)
+        delete_parser.add_argument('--match', help="text the description contains")
+        delete_parser.set_defaults(handler=delete_command)
+
+    compact_parser = commands.add_parser('compact', help="move long soft-deleted rows to <db>.archive.db and shrink the file")
+    compact_parser.add_argument('--retention-days', type=int, default=30, help="keep rows deleted more recently in the database")
+    compact_parser.add_argument('--chunk-size', type=int, default=1000, help="rows per write transaction")
+    compact_parser.add_argument('--pause', type=float, default=0.05, help="seconds between chunks, for other writers")
+    compact_parser.set_defaults(handler=compact_command)
+
+    snapshot_parser = commands.add_parser('snapshot', help="refresh the memory-mapped column snapshot used by analytics")
+    snapshot_parser.set_defaults(handler=snapshot_command)
+
+    partitions_parser = commands.add_parser('partitions', help="move ended periods to read-only partition files")
+    partitions_parser.add_argument('action', choices=['list', 'close'])
+    partitions_parser.add_argument('period', nargs='?', help="yyyy or yyyy-mm, required for 'close'")
+    partitions_parser.set_defaults(handler=partitions_command)
+
+    loadtest_parser = commands.add_parser('loadtest', help="measure requests/sec of the async service on this database")
+    loadtest_parser.add_argument('--duration', type=float, default=5.0, help="seconds")
+    loadtest_parser.add_argument('--concurrency', type=int, default=32, help="concurrent clients")
+    loadtest_parser.add_argument('--write-ratio', type=float, default=0.1)
+    loadtest_parser.add_argument('--readers', type=int, default=4, help="reader threads")
+    loadtest_parser.set_defaults(handler=loadtest_command)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.stats:
+        instrument.enable(args.slow_ms, args.slow_log)
+    if args.in_memory:
+        ConnectionManager.for_database(args.db).load_into_memory(args.in_memory)
+    try:
+        return args.handler(args)
+    finally:
+        if args.in_memory:
+            ConnectionManager.for_database(args.db).close() # Flushes
+        if args.stats:
+            print(instrument.REGISTRY.dump(), file=sys.stderr)
+
+if __name__ == '__main__':
+    sys.exit(main())
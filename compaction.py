@@ -0,0 +1,86 @@
+import json
+import os
+import sqlite3
+import time
+import partition
+
+# (table, key column, extra condition) of the soft-deleted rows compaction moves out;
+# a category goes only once no expense, live, deleted or in a closed partition, refers to it
+PURGE_TABLES = (
+    ("Expenses", "expense_id", ""),
+    ("Categories", "category_id", "AND NOT EXISTS (SELECT 1 FROM {source} E WHERE E.category_id = Categories.category_id)"),
+)
+
+
+def archive_file(db_name): # Archive database next to the live one, e.g. alice.db -> alice.archive.db
+    return f"{os.path.splitext(db_name)[0]}.archive.db"
+
+
+def enable_incremental_vacuum(conn): # Switch the database to auto_vacuum=INCREMENTAL, returns True if it had to
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+        return False
+    # Only takes effect on a rebuilt file, so this is the one full VACUUM; later runs free pages a chunk at a time
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    conn.execute('VACUUM')
+    return True
+
+
+def compact(db, retention_days=30, chunk_size=1000, pause=0.05, vacuum_pages=1000): # Move rows deleted before the retention period to the archive, then give their pages back
+    conn = db.connection()
+    result = {"converted": enable_incremental_vacuum(conn), "Expenses": 0, "Categories": 0, "chunks": 0, "freed_pages": 0}
+    cutoff = conn.execute("SELECT datetime('now', ?)", (f"-{int(retention_days)} days",)).fetchone()[0]
+    partition.attach(conn) # ATTACH is not allowed inside the transactions below
+    for table, key, condition in PURGE_TABLES:
+        while True:
+            # One short write transaction per chunk, so interactive writers get the lock in between
+            moved = _move_chunk(db, table, key, condition, cutoff, chunk_size)
+            if not moved:
+                break
+            result[table] += moved
+            result["chunks"] += 1
+            result["freed_pages"] += incremental_vacuum(conn, vacuum_pages)
+            time.sleep(pause)
+    conn.execute('PRAGMA wal_checkpoint(PASSIVE)') # In WAL mode the file only shrinks once the freed pages are checkpointed
+    return result
+
+
+def incremental_vacuum(conn, pages): # Release up to pages free pages to the file system, returns how many
+    before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    conn.execute(f'PRAGMA incremental_vacuum({int(pages)})').fetchall() # Runs one page per step
+    return before - conn.execute('PRAGMA freelist_count').fetchone()[0]
+
+
+def _move_chunk(db, table, key, condition, cutoff, chunk_size):
+    with db.transaction() as conn:
+        # Rows deleted before deleted_at existed have no time and count as old
+        cursor = conn.execute(f'''
+            SELECT * FROM main.{table}
+            WHERE is_deleted = 1 AND (deleted_at IS NULL OR deleted_at <= ?) {condition.format(source=partition.source(conn))}
+            ORDER BY {key}
+            LIMIT ?
+        ''', (cutoff, chunk_size))
+        columns = [column[0] for column in cursor.description]
+        rows = cursor.fetchall()
+        if not rows:
+            return 0
+        archive_rows(conn, db.db_name, table, columns, rows)
+        conn.execute(f'DELETE FROM main.{table} WHERE {key} IN (SELECT value FROM json_each(?))',
+                     (json.dumps([row[columns.index(key)] for row in rows]),))
+    return len(rows)
+
+
+def archive_rows(conn, db_name, table, columns, rows): # Copy rows into the archive file, durable before they leave the live table
+    table_sql = conn.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()[0]
+    archive = sqlite3.connect(archive_file(db_name))
+    try:
+        archive.execute(table_sql.replace("CREATE TABLE", "CREATE TABLE IF NOT EXISTS", 1))
+        # The archive keeps the columns of when it was created; columns added to the live table since are left out
+        existing = {row[1] for row in archive.execute(f'PRAGMA table_info({table})')}
+        kept = [i for i, column in enumerate(columns) if column in existing]
+        # REPLACE, so a chunk archived by an interrupted run is archived again without duplicates
+        archive.executemany(f'''
+            INSERT OR REPLACE INTO {table} ({", ".join(columns[i] for i in kept)}) VALUES ({", ".join("?" * len(kept))})
+        ''', ([row[i] for i in kept] for row in rows))
+        archive.commit()
+    finally:
+        archive.close()
@@ -0,0 +1,328 @@
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+import instrument
+
+JOURNAL_MODES = ("delete", "truncate", "persist", "memory", "wal", "off")
+SYNCHRONOUS_MODES = ("off", "normal", "full", "extra")
+# Readers do not block the writer and commits skip the per-transaction fsync of the WAL;
+# writers wait up to busy_timeout ms for the lock instead of failing with "database is locked"
+MULTI_PROCESS_SETTINGS = {"journal_mode": "wal", "synchronous": "normal", "busy_timeout": 5000}
+# write-back: the file is updated every flush_interval seconds, by flush() and on exit;
+# write-through: every committed transaction is copied to the file before it returns. SQLite cannot tell which
+# pages a commit changed, so that copy is the whole database: each commit costs O(database size), not O(write)
+MEMORY_MODES = ("write-back", "write-through")
+# SQLite's default VFS; a memdb connection opens attached files as empty memdb databases unless their URI names it
+FILE_VFS = "win32" if os.name == "nt" else "unix"
+
+
+class ConnectionManager:
+    _managers = {}
+    _managers_lock = threading.Lock()
+
+    def __init__(self, db_name):
+        self.db_name = db_name
+        self.journal_mode = None  # None keeps the database's current setting
+        self.synchronous = None
+        self.busy_timeout = 5000  # ms, same as the sqlite3.connect default
+        self._settings_version = 0
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._write_queue = None
+        self._memory = None
+
+    @classmethod
+    def for_database(cls, db_name): # Shared manager per database file
+        key = db_name if db_name == ':memory:' else os.path.abspath(db_name)
+        with cls._managers_lock:
+            manager = cls._managers.get(key)
+            if manager is None:
+                manager = cls(db_name)
+                cls._managers[key] = manager
+            return manager
+
+    @classmethod
+    def close_all(cls): # Close every pooled connection of every database
+        with cls._managers_lock:
+            managers = list(cls._managers.values())
+        for manager in managers:
+            manager.close()
+
+    @classmethod
+    def file_of(cls, conn): # Absolute path of the file a pooled connection belongs to, also while it is served from memory; '' for others
+        with cls._managers_lock:
+            managers = list(cls._managers.values())
+        return next((os.path.abspath(manager.db_name) for manager in managers
+                     if manager.db_name != ':memory:' and conn in manager._connections), '')
+
+    def configure(self, journal_mode=None, synchronous=None, busy_timeout=None): # e.g. configure('wal', 'normal', 5000)
+        if journal_mode is not None and journal_mode.lower() not in JOURNAL_MODES:
+            raise ValueError(f"Unknown journal mode '{journal_mode}', expected one of {JOURNAL_MODES}")
+        if synchronous is not None and synchronous.lower() not in SYNCHRONOUS_MODES:
+            raise ValueError(f"Unknown synchronous mode '{synchronous}', expected one of {SYNCHRONOUS_MODES}")
+        with self._lock:
+            if journal_mode is not None:
+                self.journal_mode = journal_mode.lower()
+            if synchronous is not None:
+                self.synchronous = synchronous.lower()
+            if busy_timeout is not None:
+                self.busy_timeout = int(busy_timeout)
+            self._settings_version += 1 # Every thread re-applies the settings on its next connection() call
+
+    def connection(self): # Persistent connection of the calling thread
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            started = time.perf_counter()
+            # Thread-local, so it is safe to let close() run from any thread
+            memory = self._memory
+            conn = sqlite3.connect(memory.uri if memory else self.db_name, timeout=self.busy_timeout / 1000, check_same_thread=False, uri=True,
+                                   factory=instrument.connection_class())
+            self._local.conn = conn
+            self._local.depth = 0
+            self._local.settings_version = -1
+            with self._lock:
+                self._connections.append(conn)
+            self._apply_settings(conn)
+            if instrument.enabled():
+                instrument.REGISTRY.record_connect((time.perf_counter() - started) * 1000)
+        if self._local.settings_version != self._settings_version and not conn.in_transaction:
+            self._apply_settings(conn)
+        return conn
+
+    def _apply_settings(self, conn):
+        with self._lock:
+            journal_mode, synchronous, busy_timeout = self.journal_mode, self.synchronous, self.busy_timeout
+            version = self._settings_version
+        conn.execute(f'PRAGMA busy_timeout = {busy_timeout}')
+        if journal_mode is not None:
+            conn.execute(f'PRAGMA journal_mode = {journal_mode}')
+        if synchronous is not None:
+            conn.execute(f'PRAGMA synchronous = {synchronous}')
+        self._local.settings_version = version
+
+    @contextmanager
+    def transaction(self): # Commit on success, rollback on error; nested blocks join the outer one
+        conn = self.connection()
+        depth = self._local.depth
+        if depth == 0 and not conn.in_transaction:
+            # Take the write lock up front: a deferred transaction that reads first cannot
+            # wait out a concurrent writer when it later upgrades, it fails with "database is locked"
+            conn.execute('BEGIN IMMEDIATE')
+        self._local.depth = depth + 1
+        try:
+            yield conn
+        except BaseException:
+            if depth == 0:
+                conn.rollback()
+            raise
+        else:
+            if depth == 0:
+                conn.commit()
+                memory = self._memory
+                if memory is not None and memory.write_through: # A whole-database backup, see MEMORY_MODES
+                    memory.flush()
+        finally:
+            self._local.depth = depth
+
+    def write(self, fn): # Run fn(conn) in a write transaction, through the write queue when it is enabled
+        write_queue = self._write_queue
+        if write_queue is None or getattr(self._local, 'depth', 0) > 0 or write_queue.is_writer_thread():
+            with self.transaction() as conn:
+                return fn(conn)
+        return write_queue.submit(fn).result()
+
+    def enable_write_queue(self, max_batch=256): # Funnel write() calls of all threads into group commits
+        with self._lock:
+            if self._write_queue is None:
+                self._write_queue = WriteQueue(self, max_batch)
+            return self._write_queue
+
+    def disable_write_queue(self): # Finish queued writes and stop the writer thread
+        with self._lock:
+            write_queue, self._write_queue = self._write_queue, None
+        if write_queue is not None:
+            write_queue.stop()
+
+    def load_into_memory(self, mode="write-back", flush_interval=None): # Serve reads from a copy of the database in RAM
+        if mode not in MEMORY_MODES:
+            raise ValueError(f"Unknown memory mode '{mode}', expected one of {MEMORY_MODES}")
+        if self.db_name == ':memory:':
+            raise ValueError("The database is already in memory")
+        with self._lock:
+            if self._memory is not None:
+                raise ValueError(f"{self.db_name} is already loaded into memory")
+            self._memory = MemoryCopy(self, mode, flush_interval)
+        self._close_connections() # Every thread reopens on the copy
+        return self._memory
+
+    def flush(self): # Write the in-memory copy back to the file now, returns False if there was nothing to write
+        memory = self._memory
+        return memory.flush() if memory is not None else False
+
+    def close(self): # Close the connections of all threads; a database loaded into memory is flushed and served from its file again
+        self.disable_write_queue()
+        with self._lock:
+            memory, self._memory = self._memory, None
+        try:
+            if memory is not None:
+                memory.close()
+        finally:
+            self._close_connections()
+
+    def _close_connections(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        # Other threads notice the closed connection and reopen lazily
+        self._local = threading.local()
+
+
+class MemoryCopy:
+    # The database copied into a memdb database with the backup API; pooled connections open it instead of the file.
+    # The file only ever changes by a whole flush, which is one backup step and so one transaction on it: a crash
+    # leaves the file at the previous flush, never half of one. Lost in a crash: nothing that returned in
+    # write-through mode, the writes since the last flush in write-back mode.
+    def __init__(self, manager, mode, flush_interval=None):
+        self.manager = manager
+        self.write_through = mode == "write-through"
+        self.flushes = 0
+        # memdb rather than a shared-cache :memory: database: its connections lock the whole database
+        # and wait out busy_timeout, shared-cache ones fail at once with "database table is locked"
+        self.uri = f"file:/{os.path.basename(manager.db_name)}-{id(self)}?vfs=memdb"
+        self._lock = threading.Lock()
+        self._disk = sqlite3.connect(manager.db_name, timeout=manager.busy_timeout / 1000, check_same_thread=False)
+        # Keeps the memdb database alive while pooled connections come and go
+        self._keeper = sqlite3.connect(self.uri, uri=True, timeout=manager.busy_timeout / 1000, check_same_thread=False)
+        try:
+            self._disk.backup(self._keeper)
+        except sqlite3.Error:
+            self._keeper.close()
+            self._disk.close()
+            raise
+        self._flushed_version = self._version(self._keeper)
+        self._disk_version = self._version(self._disk)
+        self._stop = threading.Event()
+        self._thread = None
+        if not self.write_through:
+            atexit.register(self.flush)
+            if flush_interval:
+                self._thread = threading.Thread(target=self._run, args=(flush_interval,), name=f"flush-{manager.db_name}", daemon=True)
+                self._thread.start()
+
+    def flush(self): # Copy the database over its file in one transaction, returns False if nothing changed since the last flush
+        with self._lock:
+            if self._keeper is None:
+                return False
+            version = self._version(self._keeper) # Changes with every commit of the pooled connections
+            if version == self._flushed_version:
+                return False
+            if self._version(self._disk) != self._disk_version:
+                raise sqlite3.OperationalError(f"{self.manager.db_name} was changed by another connection since it was loaded into memory, not overwriting it")
+            # All pages in one step, so the file goes from the last flush to this one in a single transaction
+            self._keeper.backup(self._disk)
+            self._flushed_version = version
+            self._disk_version = self._version(self._disk)
+            self.flushes += 1
+            return True
+
+    def close(self): # Last flush, then free the memory
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        atexit.unregister(self.flush)
+        try:
+            self.flush()
+        finally:
+            with self._lock:
+                keeper, self._keeper = self._keeper, None
+            keeper.close()
+            self._disk.close()
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.flush()
+            except sqlite3.Error as e: # Stays unflushed, the next flush tries again
+                print(f"An error occurred while flushing {self.manager.db_name}: {e}")
+
+    def _version(self, conn):
+        return conn.execute('PRAGMA data_version').fetchone()[0]
+
+
+class WriteQueue:
+    def __init__(self, manager, max_batch=256):
+        self.manager = manager
+        self.max_batch = max_batch
+        self.batches = 0
+        self.writes = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=f"write-queue-{manager.db_name}", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn): # Future of fn(conn), run by the writer thread in the next group commit
+        future = Future()
+        self._queue.put((fn, future))
+        return future
+
+    def is_writer_thread(self):
+        return threading.current_thread() is self._thread
+
+    def stop(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            batch = []
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= self.max_batch:
+                    break
+                try: # Everything queued while the previous batch committed joins this one
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            stopping = item is None
+            if batch:
+                self._commit(batch)
+
+    def _commit(self, batch): # One transaction for the batch, one savepoint per write so failures stay isolated
+        results = []
+        try:
+            with self.manager.transaction() as conn:
+                for fn, future in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    conn.execute('SAVEPOINT queued_write')
+                    try:
+                        result = fn(conn)
+                    except BaseException as e:
+                        conn.execute('ROLLBACK TO queued_write')
+                        conn.execute('RELEASE queued_write')
+                        future.set_exception(e)
+                    else:
+                        conn.execute('RELEASE queued_write')
+                        results.append((future, result))
+        except BaseException as e: # The transaction did not start or did not commit, none of the writes happened
+            for _, future in batch:
+                if not future.done(): # Also the writes that never ran, e.g. when BEGIN IMMEDIATE timed out
+                    future.set_exception(e)
+            return
+        self.batches += 1
+        self.writes += len(results)
+        for future, result in results:
+            future.set_result(result)
+
+
+def ensure_column(conn, table, column, definition): # Add a column that databases created by older versions lack
+    if column not in {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
@@ -0,0 +1,34 @@
+import re
+from datetime import date
+
+# Expenses.date holds the day number: days since 1970-01-01, the same count numpy's datetime64[D] uses.
+# The API keeps speaking 'yyyy-mm-dd'; these convert at the edges.
+EPOCH = date(1970, 1, 1).toordinal()
+MIN_DAY = date.min.toordinal() - EPOCH # 0001-01-01
+MAX_DAY = date.max.toordinal() - EPOCH # 9999-12-31
+JULIAN_EPOCH = 2440587.5 # Julian day of 1970-01-01 00:00, SQLite's date functions count from there
+CHECK = f"CHECK (typeof(date) = 'integer' AND date BETWEEN {MIN_DAY} AND {MAX_DAY})"
+
+
+def to_day(text): # 'yyyy-mm-dd' -> day number, ValueError for anything else
+    # Month and day may drop their leading zero, as strptime's %Y-%m-%d allows and older versions stored
+    match = re.fullmatch(r"(\d{4})-(\d{1,2})-(\d{1,2})", text) if isinstance(text, str) else None
+    if match is None:
+        raise ValueError(f"invalid date {text!r}, expected yyyy-mm-dd")
+    return date(*map(int, match.groups())).toordinal() - EPOCH
+
+
+def to_text(day): # Day number -> 'yyyy-mm-dd'
+    return date.fromordinal(day + EPOCH).isoformat()
+
+
+def padded(text): # Any date to_day accepts -> zero-padded 'yyyy-mm-dd', which text keys (totals, partition bounds) compare with
+    return to_text(to_day(text))
+
+
+def sql_text(column): # SQL turning a day number column into 'yyyy-mm-dd'
+    return f"date({column} + {JULIAN_EPOCH})"
+
+
+def sql_day(column): # SQL turning a 'yyyy-mm-dd' text column into a day number, NULL if it is not a date
+    return f"CAST(julianday(date({column})) - {JULIAN_EPOCH} AS INTEGER)"
@@ -0,0 +1,79 @@
+import hashlib
+import json
+import re
+from connection import ensure_column
+import dates
+import partition
+
+# What add_expenses_bulk does with a row that duplicates an existing expense:
+# allow inserts it, reject reports it as rejected, merge keeps the existing expense instead,
+# flag inserts it with duplicate_of set to the existing expense
+POLICIES = ("allow", "reject", "merge", "flag")
+
+
+def normalize(description): # Case, punctuation and spacing that differ between exports of the same transaction do not count
+    return " ".join(re.findall(r"\w+", (description or "").casefold()))
+
+
+def fingerprint(tenant_id, category_id, amount, description): # Signed 64-bit hash of what makes two expenses the same, the date aside
+    if category_id is None or amount is None:
+        return None
+    key = f"{tenant_id}\x1f{int(category_id)}\x1f{round(float(amount) * 100)}\x1f{normalize(description)}"
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big", signed=True)
+
+
+def create_columns(conn): # Add Expenses.fingerprint and duplicate_of, fingerprinting the rows of databases from before them
+    added = "fingerprint" not in {row[1] for row in conn.execute('PRAGMA table_info(Expenses)')}
+    ensure_column(conn, 'Expenses', 'fingerprint', "INTEGER")
+    ensure_column(conn, 'Expenses', 'duplicate_of', "INTEGER")
+    if added:
+        conn.create_function('expense_fingerprint', 4, fingerprint, deterministic=True)
+        conn.execute('UPDATE Expenses SET fingerprint = expense_fingerprint(tenant_id, category_id, amount, description) WHERE category_id IS NOT NULL')
+    return added
+
+
+class DuplicateMatcher:
+    # Pairs the rows of one import with existing expenses. Each existing expense absorbs at most one row,
+    # so a statement with two identical coffees imported over one that has them once adds the second
+    def __init__(self, conn, tenant_id, window_days=0):
+        self.tenant_id = tenant_id
+        self.window_days = int(window_days)
+        # Rows this import adds get higher ids, so rows of the same import never duplicate each other.
+        # The AUTOINCREMENT sequence, as the hot table may be empty with every expense in closed partitions
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'Expenses'").fetchone()
+        self.max_id = row[0] if row else 0
+        self._claimed = set()
+
+    def match(self, conn, probes): # {key: expense_id} for the (key, fingerprint, day) probes that duplicate an expense
+        if not probes:
+            return {}
+        # Re-imported statements reach back into closed periods, so the partitions that overlap the chunk are probed too
+        days = [day for _, _, day in probes]
+        first_day = dates.to_text(max(min(days) - self.window_days, dates.MIN_DAY))
+        last_day = dates.to_text(min(max(days) + self.window_days, dates.MAX_DAY))
+        schemas = partition.schemas(conn, first_day, last_day)
+        if schemas: # On the connection db.write runs on, which is the writer thread's once the write queue is enabled
+            partition.attach(conn)
+        # One statement per chunk; CROSS JOIN keeps the probes outside, so each one is a range seek on
+        # idx_expenses_fingerprint rather than the planner walking the tenant's rows with idx_expenses_date
+        rows = conn.execute(" UNION ALL ".join(f'''
+            SELECT P.key, E.expense_id, E.date
+            FROM json_each(:probes) P
+            CROSS JOIN {schema}.Expenses E ON E.fingerprint = json_extract(P.value, '$[1]')
+                AND E.date BETWEEN json_extract(P.value, '$[2]') - :window_days AND json_extract(P.value, '$[2]') + :window_days
+            WHERE E.is_deleted = 0 AND E.tenant_id = :tenant_id AND E.expense_id <= :max_id
+        ''' for schema in ["main", *schemas]), {
+            "probes": json.dumps([list(probe) for probe in probes]), "window_days": self.window_days,
+            "tenant_id": self.tenant_id, "max_id": self.max_id,
+        }).fetchall()
+        candidates = {}
+        for index, expense_id, day in rows:
+            candidates.setdefault(index, []).append((day, expense_id))
+        matches = {}
+        for index, (key, _, day) in enumerate(probes): # The closest date wins, then the oldest expense
+            for _, expense_id in sorted(candidates.get(index, ()), key=lambda candidate: (abs(candidate[0] - day), candidate[1])):
+                if expense_id not in self._claimed:
+                    self._claimed.add(expense_id)
+                    matches[key] = expense_id
+                    break
+        return matches
@@ -1,141 +1,569 @@
+import json
+import math
+import os
+import re
 import sqlite3
-import pandas as pd
-import matplotlib.pyplot as plt
-import numpy as np
+from itertools import islice
+from connection import ConnectionManager, ensure_column
+import rollup
+import partition
+import search
+import query
+import dates
+import dedupe
+import charts
 
+# Partial indexes over live rows only, matching the "is_deleted = 0 ... ORDER BY date" read paths and the
+# duplicate lookups of imports, and over deleted rows only for compaction
+EXPENSE_INDEXES = {
+    "idx_expenses_date": '''
+        CREATE INDEX idx_expenses_date ON Expenses (tenant_id, date) WHERE is_deleted = 0
+    ''',
+    "idx_expenses_category_date": '''
+        CREATE INDEX idx_expenses_category_date ON Expenses (category_id, date) WHERE is_deleted = 0
+    ''',
+    "idx_expenses_deleted_at": '''
+        CREATE INDEX idx_expenses_deleted_at ON Expenses (deleted_at) WHERE is_deleted = 1
+    ''',
+    "idx_expenses_fingerprint": '''
+        CREATE INDEX idx_expenses_fingerprint ON Expenses (fingerprint, date) WHERE is_deleted = 0
+    ''',
+}
+
+# Row layouts of the listing methods; expense_id and date come first so pages can build their cursor
+EXPENSE_COLUMNS = f"E.expense_id, {dates.sql_text('E.date')}, C.category_id, C.category_name, E.description, E.amount"
+EXPENSE_BY_DATE_COLUMNS = f"E.expense_id, {dates.sql_text('E.date')}, C.category_name, E.description, E.amount"
+
+def selection(expense_ids=None, from_to=None, category_ids=None, description=None): # WHERE conditions and params over Expenses, every given selector must match
+    conditions, params = [], []
+    if expense_ids is not None: # A JSON array is one parameter however many ids there are
+        conditions.append("expense_id IN (SELECT value FROM json_each(?))")
+        params.append(json.dumps([int(expense_id) for expense_id in expense_ids]))
+    if from_to is not None:
+        conditions.append("date BETWEEN ? AND ?")
+        params += [dates.to_day(from_to["From"]), dates.to_day(from_to["To"])]
+    if category_ids is not None:
+        conditions.append("category_id IN (SELECT value FROM json_each(?))")
+        params.append(json.dumps([int(category_id) for category_id in category_ids]))
+    if description: # Substring, case-insensitive for ASCII; deleted rows are not in the search index, so no FTS here
+        conditions.append("description LIKE ? ESCAPE '\\'")
+        params.append(query.like_pattern(description))
+    if not conditions:
+        raise ValueError("no expenses selected, give ids, a date range, a category or a description")
+    return " AND ".join(conditions), params
+
+def _text_day(text): # dates.to_day for SQL, NULL for text that is not a date
+    try:
+        return dates.to_day(text)
+    except ValueError:
+        return None
+
+def migrate_dates(conn): # Rebuild an Expenses table that stores TEXT dates with day numbers, returns True if it did
+    info = conn.execute('PRAGMA table_info(Expenses)').fetchall()
+    columns = [row[1] for row in info]
+    if {row[1]: row[2].upper() for row in info}.get("date") != "TEXT":
+        return False
+    # SQLite's date() only reads zero-padded dates; the few others, like '2024-1-6', go through Python
+    conn.create_function('text_day', 1, _text_day, deterministic=True)
+    day = f'COALESCE({dates.sql_day("date")}, text_day(date))'
+    bad = conn.execute(f'SELECT expense_id, date FROM Expenses WHERE {day} IS NULL LIMIT 10').fetchall()
+    if bad:
+        raise ValueError(f"expenses {bad} have dates that are not yyyy-mm-dd, fix them before the upgrade")
+    table_sql = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'Expenses'").fetchone()[0]
+    table_sql = re.sub(r"\bdate\s+TEXT\s+NOT\s+NULL", f"date INTEGER NOT NULL {dates.CHECK}", table_sql, count=1, flags=re.IGNORECASE)
+    sequence = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'Expenses'").fetchone()
+    index_sqls = [row[0] for row in conn.execute("SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'Expenses' AND sql IS NOT NULL")]
+    # SQLite cannot change a column type: copy into a new table, drop the old one (and its indexes), rename
+    conn.execute(f'DROP VIEW IF EXISTS temp.{partition.VIEW_NAME}') # RENAME checks the temp view, which names Expenses
+    conn.execute(table_sql.replace("CREATE TABLE Expenses", "CREATE TABLE Expenses_migrated", 1))
+    conn.execute(f'''
+        INSERT INTO Expenses_migrated ({", ".join(columns)})
+        SELECT {", ".join(day if column == "date" else column for column in columns)} FROM Expenses
+    ''')
+    conn.execute('DROP TABLE Expenses') # and its indexes, created again below
+    conn.execute('ALTER TABLE Expenses_migrated RENAME TO Expenses')
+    for sql in index_sqls:
+        conn.execute(sql)
+    if sequence: # Keep ids of purged rows from being handed out again
+        conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'Expenses'", sequence)
+    return True
+
+# Database files whose TEXT dates create_table could not convert, with the reason; Expense refuses to read
+# or write their dates until a later create_table converts them
+UNCONVERTED_DATES = {}
 
 class Expense:
-    def __init__(self, db_name):
+    def __init__(self, db_name, tenant_id=''):
         self.db_name = db_name
+        self.tenant_id = tenant_id # Tenants sharing a database file only see their own expenses
+        self.db = ConnectionManager.for_database(db_name)
 
     def create_table(self): # Create Expense table
         try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS Expenses (
-                    expense_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    category_id INTEGER,
-                    amount REAL NOT NULL,
-                    date TEXT NOT NULL,
-                    description TEXT,
-                    is_deleted INTEGER DEFAULT 0,
-                    FOREIGN KEY (category_id) REFERENCES Categories(category_id)
-                )
-            ''')
-            conn.commit()
-        except sqlite3.Error as e:
+            with self.db.transaction() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f'''
+                    CREATE TABLE IF NOT EXISTS Expenses (
+                        expense_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        category_id INTEGER,
+                        amount REAL NOT NULL,
+                        date INTEGER NOT NULL {dates.CHECK},
+                        description TEXT,
+                        is_deleted INTEGER DEFAULT 0,
+                        tenant_id TEXT NOT NULL DEFAULT '',
+                        deleted_at TEXT,
+                        fingerprint INTEGER,
+                        duplicate_of INTEGER,
+                        FOREIGN KEY (category_id) REFERENCES Categories(category_id)
+                    )
+                ''')
+                ensure_column(conn, 'Expenses', 'tenant_id', "TEXT NOT NULL DEFAULT ''")
+                ensure_column(conn, 'Expenses', 'deleted_at', "TEXT")
+                try:
+                    migrate_dates(conn)
+                    UNCONVERTED_DATES.pop(os.path.abspath(self.db_name), None)
+                except ValueError as e: # It checks the dates before changing anything, so the other upgrades can still go ahead
+                    UNCONVERTED_DATES[os.path.abspath(self.db_name)] = str(e)
+                    print(f"An error occurred while migrating the expense dates: {e}")
+                dedupe.create_columns(conn)
+                self.create_indexes()
+                if os.path.abspath(self.db_name) not in UNCONVERTED_DATES: # Filled from TEXT dates they would keep wrong days after the conversion
+                    rollup.create_tables(conn)
+                partition.create_catalog(conn)
+                self._migrate_files(conn)
+                search.create_table(conn)
+        except (sqlite3.Error, ValueError) as e:
             print(f"An error occurred while creating the Expenses table: {e}")
-        finally:
-            conn.close()
+
+    def _migrate_files(self, conn): # Closed partitions and the compaction archive hold Expenses tables of their own
+        directory = os.path.dirname(os.path.abspath(self.db_name))
+        partition_files = [os.path.join(directory, row[3]) for row in partition.partitions(conn)]
+        for path in partition_files + [os.path.splitext(self.db_name)[0] + ".archive.db"]:
+            if not os.path.exists(path):
+                continue
+            other = sqlite3.connect(path)
+            try:
+                migrated = migrate_dates(other)
+                # Duplicate lookups of imports probe the partitions too
+                if path in partition_files and dedupe.create_columns(other):
+                    other.execute(EXPENSE_INDEXES["idx_expenses_fingerprint"])
+                    migrated = True
+                if migrated:
+                    other.commit()
+            except ValueError as e:
+                print(f"An error occurred while migrating the expense dates of {path}: {e}")
+            finally:
+                other.close()
+
+    def create_indexes(self): # Add missing or outdated managed indexes, also on existing databases
+        with self.db.transaction() as conn:
+            existing = dict(conn.execute('''
+                SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'Expenses' AND name LIKE 'idx_expenses_%'
+            ''').fetchall())
+            for name, sql in list(existing.items()):
+                if " ".join(sql.split()) != " ".join(EXPENSE_INDEXES.get(name, "").split()):
+                    conn.execute(f'DROP INDEX {name}')
+                    del existing[name]
+            for name, sql in EXPENSE_INDEXES.items():
+                if name not in existing:
+                    conn.execute(sql)
+
+    def check_dates(self): # Raise sqlite3.OperationalError while the dates of the file are still TEXT
+        reason = UNCONVERTED_DATES.get(os.path.abspath(self.db_name))
+        if reason is not None:
+            raise sqlite3.OperationalError(f"the expense dates are not converted to day numbers yet, {reason}")
 
     def add_expenses(self, expense_obj): # Add row of expense
-        try:
-            conn = sqlite3.connect(self.db_name)
+        def insert(conn):
+            day = dates.to_day(expense_obj["date"])
             cursor = conn.cursor()
+            # The category must be one of this tenant's, as _validate_chunk checks for add_expenses_bulk
+            cursor.execute('SELECT 1 FROM Categories WHERE category_id = ? AND tenant_id = ? AND is_deleted = 0', (expense_obj["category_id"], self.tenant_id))
+            if cursor.fetchone() is None:
+                raise ValueError(f"unknown category_id {expense_obj['category_id']}")
             cursor.execute('''
-                INSERT INTO Expenses (category_id, amount, date, description)
-                VALUES (?, ?, ?, ?)
-            ''', (expense_obj["category_id"], expense_obj["amount"], expense_obj["date"], expense_obj["description"]))
-            conn.commit()
-            return (cursor.lastrowid, expense_obj["amount"])
-        except sqlite3.Error as e:
+                INSERT INTO Expenses (category_id, amount, date, description, tenant_id, fingerprint)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (expense_obj["category_id"], expense_obj["amount"], day, expense_obj["description"], self.tenant_id,
+                  dedupe.fingerprint(self.tenant_id, expense_obj["category_id"], expense_obj["amount"], expense_obj["description"])))
+            rollup.apply_deltas(conn, [(expense_obj["category_id"], dates.to_text(day), float(expense_obj["amount"]), 1)])
+            search.index(conn, [(cursor.lastrowid, expense_obj["description"])])
+            return cursor.lastrowid
+        try:
+            self.check_dates()
+            return (self.db.write(insert), expense_obj["amount"])
+        except (sqlite3.Error, ValueError) as e:
             print(f"An error occurred while adding the expense: {e}")
-        finally:
-            conn.close()
+
+    def add_expenses_bulk(self, expense_objs, chunk_size=1000, on_duplicate="allow", window_days=0): # Add many rows of expense, one transaction per chunk; see dedupe.POLICIES for on_duplicate
+        if on_duplicate not in dedupe.POLICIES:
+            raise ValueError(f"Unknown duplicate policy '{on_duplicate}', expected one of {dedupe.POLICIES}")
+        # A duplicate has the same category, amount and description, and a date at most window_days away
+        matcher = None if on_duplicate == "allow" else dedupe.DuplicateMatcher(self.db.connection(), self.tenant_id, window_days)
+        result = {"inserted": [], "rejected": [], "merged": [], "flagged": []}
+        rows = iter(expense_objs)
+        offset = 0
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                return result
+            try:
+                self.check_dates()
+                inserted, rejected, duplicates = self.db.write(lambda conn: self._insert_chunk(conn, chunk, offset, on_duplicate, matcher))
+                result["rejected"].extend(rejected)
+                if on_duplicate in ("merge", "flag"):
+                    result["merged" if on_duplicate == "merge" else "flagged"].extend(duplicates)
+                if inserted:
+                    result["inserted"].append(inserted)
+            except sqlite3.Error as e:
+                print(f"An error occurred while adding expenses {offset} to {offset + len(chunk) - 1}: {e}")
+                result["rejected"].extend((offset + i, str(e)) for i in range(len(chunk)))
+                return result
+            offset += len(chunk)
+
+    def _insert_chunk(self, conn, chunk, offset, on_duplicate="allow", matcher=None): # Insert the valid rows of a chunk, returns ((first_id, last_id) or None, rejected, [(index, duplicated expense_id)])
+        valid, rejected = self._validate_chunk(conn, chunk, offset)
+        fingerprints = {i: dedupe.fingerprint(self.tenant_id, category_id, amount, description) for category_id, amount, _, description, _, i in valid}
+        duplicates = []
+        if matcher is not None:
+            matches = matcher.match(conn, [(i, fingerprints[i], day) for _, _, _, _, day, i in valid])
+            duplicates = sorted(matches.items())
+            if on_duplicate == "reject":
+                rejected = sorted(rejected + [(i, f"duplicate of expense {expense_id}") for i, expense_id in duplicates])
+            if on_duplicate in ("reject", "merge"):
+                valid = [row for row in valid if row[5] not in matches]
+        else:
+            matches = {}
+        if not valid:
+            return None, rejected, duplicates
+        conn.executemany('''
+            INSERT INTO Expenses (category_id, amount, date, description, tenant_id, fingerprint, duplicate_of)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', [(category_id, amount, day, description, self.tenant_id, fingerprints[i], matches.get(i)) for category_id, amount, _, description, day, i in valid])
+        # AUTOINCREMENT ids are consecutive while this transaction holds the write lock; read before the
+        # rollup upserts, which set last_insert_rowid() to a CategoryTotals row
+        last_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+        rollup.apply_deltas(conn, ((category_id, date, amount, 1) for category_id, amount, date, _, _, _ in valid))
+        search.index(conn, ((expense_id, description) for expense_id, (_, _, _, description, _, _) in enumerate(valid, start=last_id - len(valid) + 1)))
+        return (last_id - len(valid) + 1, last_id), rejected, duplicates
+
+    def _validate_chunk(self, conn, chunk, offset): # Check a chunk with one lookup per distinct category and date
+        category_ids = set()
+        for expense_obj in chunk:
+            try:
+                category_ids.add(int(expense_obj["category_id"]))
+            except (KeyError, TypeError, ValueError):
+                pass
+        known_ids = set()
+        if category_ids:
+            placeholders = ', '.join('?' * len(category_ids))
+            known_ids = {row[0] for row in conn.execute(f'''
+                SELECT category_id FROM Categories WHERE is_deleted = 0 AND tenant_id = ? AND category_id IN ({placeholders})
+            ''', (self.tenant_id, *category_ids))}
+        valid_dates = {}
+        valid, rejected = [], []
+        for i, expense_obj in enumerate(chunk, start=offset):
+            try:
+                category_id = int(expense_obj["category_id"])
+                amount = float(expense_obj["amount"])
+                date = expense_obj["date"]
+            except KeyError as e:
+                rejected.append((i, f"missing field {e}"))
+                continue
+            except (TypeError, ValueError):
+                rejected.append((i, "category_id and amount must be numbers"))
+                continue
+            if category_id not in known_ids:
+                rejected.append((i, f"unknown category_id {category_id}"))
+                continue
+            if not math.isfinite(amount):
+                rejected.append((i, f"invalid amount {expense_obj['amount']}"))
+                continue
+            if isinstance(date, str) and date not in valid_dates:
+                try:
+                    day = dates.to_day(date)
+                    valid_dates[date] = (dates.to_text(day), day) # The totals are keyed by the zero-padded text
+                except ValueError:
+                    valid_dates[date] = None
+            if not isinstance(date, str) or valid_dates[date] is None:
+                rejected.append((i, f"invalid date {date!r}, expected yyyy-mm-dd"))
+                continue
+            text, day = valid_dates[date]
+            valid.append((category_id, amount, text, expense_obj.get("description"), day, i))
+        return valid, rejected
 
     def get_all_expenses(self): # Get all row of expense
         try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT E.expense_id, E.date, C.category_id, C.category_name, E.description, E.amount
-                FROM Expenses E 
-                JOIN Categories C ON C.category_id = E.category_id 
-                WHERE E.is_deleted = 0 
-                ORDER BY E.date
-            ''')
-            all_expenses = cursor.fetchall()
-            return all_expenses
+            return self.query().all()
         except sqlite3.Error as e:
             print(f"An error occurred while retrieving expenses: {e}")
             all_expenses = []
-        finally:
-            conn.close()
-    
+
+    def query(self): # Composable filters, sorting, paging and totals compiled to one SQL statement, see query.ExpenseQuery
+        return query.ExpenseQuery(self)
+
+    def get_all_expenses_page(self, after=None, limit=50): # Get a page of expense after a (date, expense_id) cursor
+        try:
+            return self._fetch_page(EXPENSE_COLUMNS, "", (), after, limit)
+        except sqlite3.Error as e:
+            print(f"An error occurred while retrieving expenses: {e}")
+            return [], None
+
+    def iter_all_expenses(self, page_size=1000): # Yield all row of expense one page at a time
+        return self._iter_pages(self.get_all_expenses_page, page_size)
+
     def get_expense(self,expense_id): # Get expense by ID
         try:
-            conn = sqlite3.connect(self.db_name)
+            self.check_dates()
+            conn = self.db.connection()
             cursor = conn.cursor()
-            cursor.execute('SELECT * FROM Expenses WHERE expense_id = ? AND is_deleted = 0', (expense_id,))
+            cursor.execute(f'''
+                SELECT expense_id, category_id, amount, {dates.sql_text('date')}, description, is_deleted
+                FROM {partition.source(conn)} WHERE expense_id = ? AND is_deleted = 0 AND tenant_id = ?
+            ''', (expense_id, self.tenant_id))
             expense = cursor.fetchone()
             return expense
         except sqlite3.Error as e:
             print(f"An error occurred while retrieving the expense with ID {expense_id}: {e}")
             expense = None
-        finally:
-            conn.close()
     
     def get_expenses_by_date(self, from_to): # Get expenses by From date - To date
         try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT E.expense_id, E.date, C.category_name, E.description, E.amount
-                FROM Expenses E 
-                JOIN Categories C ON C.category_id = E.category_id 
-                WHERE E.date BETWEEN ? AND ? AND E.is_deleted = 0 
-                ORDER BY E.date
-            ''', (from_to["From"], from_to["To"]))
-            expenses = cursor.fetchall()
-            return expenses
+            return self.query().filter(from_to=from_to).select("expense_id", "date", "category_name", "description", "amount").all()
         except sqlite3.Error as e:
             print(f"An error occurred while retrieving expenses between {from_to["From"]} and {from_to["To"]}: {e}")
-        finally:
-            conn.close()
+
+    def get_expenses_by_date_page(self, from_to, after=None, limit=50): # Get a page of expenses by From date - To date
+        try:
+            first_day, last_day = dates.padded(from_to["From"]), dates.padded(from_to["To"])
+            return self._fetch_page(EXPENSE_BY_DATE_COLUMNS, "AND E.date BETWEEN ? AND ?", (dates.to_day(first_day), dates.to_day(last_day)), after, limit,
+                                    first_day, last_day)
+        except sqlite3.Error as e:
+            print(f"An error occurred while retrieving expenses between {from_to["From"]} and {from_to["To"]}: {e}")
+            return [], None
+
+    def iter_expenses_by_date(self, from_to, page_size=1000): # Yield expenses by From date - To date one page at a time
+        return self._iter_pages(lambda after, limit: self.get_expenses_by_date_page(from_to, after, limit), page_size)
 
     def get_expenses_by_category(self, category_id): # Get expenses by category ID
         try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT E.expense_id, E.date, C.category_id, C.category_name, E.description, E.amount
-                FROM Expenses E 
-                JOIN Categories C ON C.category_id = E.category_id 
-                WHERE C.category_id = ? AND E.is_deleted = 0 
-                ORDER BY E.date
-            ''', (category_id,))
-            expenses = cursor.fetchall()
-            return expenses
+            return self.query().filter(category_id=category_id).all()
         except sqlite3.Error as e:
             print(f"An error occurred while retrieving expenses for category_id {category_id} : {e}")
-        finally:
-            conn.close()
 
-    def soft_delete_expense(self, expense_id): # Soft delete expense by ID
+    def get_expenses_by_category_page(self, category_id, after=None, limit=50): # Get a page of expenses by category ID
         try:
-            conn = sqlite3.connect(self.db_name)
+            return self._fetch_page(EXPENSE_COLUMNS, "AND C.category_id = ?", (category_id,), after, limit)
+        except sqlite3.Error as e:
+            print(f"An error occurred while retrieving expenses for category_id {category_id} : {e}")
+            return [], None
+
+    def iter_expenses_by_category(self, category_id, page_size=1000): # Yield expenses by category ID one page at a time
+        return self._iter_pages(lambda after, limit: self.get_expenses_by_category_page(category_id, after, limit), page_size)
+
+    def _fetch_page(self, columns, condition, params, after, limit, first_day=None, last_day=None): # Keyset page ordered by (date, expense_id)
+        self.check_dates()
+        if after is not None:
+            condition += " AND (E.date, E.expense_id) > (?, ?)"
+            after_day = dates.padded(after[0])
+            params = (*params, dates.to_day(after_day), after[1])
+            first_day = max(first_day or after_day, after_day) # Partitions before the cursor are done
+        conn = self.db.connection()
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT {columns}
+            FROM {partition.source(conn, first_day, last_day)} E
+            JOIN Categories C ON C.category_id = E.category_id
+            WHERE E.is_deleted = 0 AND E.tenant_id = ? {condition}
+            ORDER BY E.date, E.expense_id
+            LIMIT ?
+        ''', (self.tenant_id, *params, limit))
+        rows = cursor.fetchall()
+        next_cursor = (rows[-1][1], rows[-1][0]) if len(rows) == limit else None
+        return rows, next_cursor
+
+    def _iter_pages(self, fetch_page, page_size): # Re-query per page so no cursor stays open between pages
+        after = None
+        while True:
+            rows, after = fetch_page(after, page_size)
+            yield from rows
+            if after is None:
+                return
+
+    def search_expenses(self, query, from_to=None, category_id=None, after=None, limit=50): # Get a page of expenses whose description matches, best match first
+        match = search.match_expression(query)
+        if not match:
+            return [], None
+        offset = after or 0 # Ranked results cannot use a keyset cursor, the cursor is the offset of the next page
+        conditions, params = "", [match, self.tenant_id]
+        if from_to is not None:
+            conditions += " AND E.date BETWEEN ? AND ?"
+            params += [dates.to_day(from_to["From"]), dates.to_day(from_to["To"])]
+        if category_id is not None:
+            conditions += " AND E.category_id = ?"
+            params.append(category_id)
+        try:
+            self.check_dates()
+            conn = self.db.connection()
+            source = partition.source(conn, dates.padded(from_to["From"]), dates.padded(from_to["To"])) if from_to is not None else partition.source(conn)
             cursor = conn.cursor()
-            cursor.execute('UPDATE Expenses SET is_deleted = 1 WHERE expense_id = ?', (expense_id,))
-            conn.commit()
+            cursor.execute(f'''
+                SELECT {EXPENSE_COLUMNS}
+                FROM ExpenseSearch S
+                JOIN {source} E ON E.expense_id = S.rowid
+                JOIN Categories C ON C.category_id = E.category_id
+                WHERE S.ExpenseSearch MATCH ? AND E.is_deleted = 0 AND E.tenant_id = ? {conditions}
+                ORDER BY S.rank, E.expense_id
+                LIMIT ? OFFSET ?
+            ''', (*params, limit, offset))
+            rows = cursor.fetchall()
+            return rows, (offset + limit if len(rows) == limit else None)
+        except sqlite3.Error as e:
+            print(f"An error occurred while searching expenses for '{query}': {e}")
+            return [], None
+
+    def soft_delete_expense(self, expense_id): # Soft delete expense by ID, None if no expense changed
+        deleted = self.soft_delete_expenses(expense_ids=[expense_id])
+        if deleted:
             return expense_id
+        if deleted == 0: # Closed partitions are read-only
+            print(f"No live expense with ID {expense_id} to delete in the open periods")
+
+    def soft_delete_expenses(self, expense_ids=None, from_to=None, category_id=None, description=None): # Soft delete every expense matching all given selectors in one transaction, returns the count
+        return self._set_deleted_where(1, expense_ids, from_to, category_id, description)
+
+    def restore_expenses(self, expense_ids=None, from_to=None, category_id=None, description=None): # Undo soft deletes of every expense matching all given selectors, returns the count
+        return self._set_deleted_where(0, expense_ids, from_to, category_id, description)
+
+    def _set_deleted_where(self, is_deleted, expense_ids, from_to, category_id, description):
+        action = "deleting" if is_deleted else "restoring"
+        try:
+            conditions, params = selection(expense_ids, from_to, None if category_id is None else [category_id], description)
+            return self.db.write(lambda conn: self._set_deleted(conn, is_deleted, conditions, params))
+        except (sqlite3.Error, ValueError) as e:
+            print(f"An error occurred while {action} expenses: {e}")
+            return None
+
+    def _set_deleted(self, conn, is_deleted, conditions, params): # Flip is_deleted of the selected rows, with one rollup and search index update for the batch
+        self.check_dates() # Category cascades call this directly
+        where = f"tenant_id = ? AND is_deleted = ? AND {conditions}"
+        params = (self.tenant_id, 1 - is_deleted, *params)
+        # Closed partitions are read-only, only the hot table changes
+        rows = conn.execute(f'''
+            SELECT expense_id, category_id, {dates.sql_text('date')}, amount, description FROM Expenses WHERE {where}
+        ''', params).fetchall()
+        if not rows:
+            return 0
+        conn.execute(f'''
+            UPDATE Expenses SET is_deleted = ?, deleted_at = CASE WHEN ? THEN datetime('now') END WHERE {where}
+        ''', (is_deleted, is_deleted, *params))
+        rollup.bump_version(conn, self.tenant_id)
+        sign = -1 if is_deleted else 1
+        rollup.apply_deltas(conn, ((category_id, date, sign * amount, sign) for _, category_id, date, amount, _ in rows))
+        (search.unindex if is_deleted else search.index)(conn, ((expense_id, description) for expense_id, _, _, _, description in rows))
+        return len(rows)
+
+    def get_category_totals(self): # Get all time total amount and count by category
+        try:
+            cursor = self.db.connection().cursor()
+            cursor.execute('''
+                SELECT C.category_id, C.category_name, T.total_amount, T.expense_count
+                FROM CategoryTotals T
+                JOIN Categories C ON C.category_id = T.category_id
+                WHERE T.expense_count > 0 AND C.tenant_id = ?
+                ORDER BY T.total_amount DESC
+            ''', (self.tenant_id,))
+            return cursor.fetchall()
         except sqlite3.Error as e:
-            print(f"An error occurred while deleting the expense with ID {expense_id}: {e}")
-        finally:
-            conn.close()
+            print(f"An error occurred while retrieving category totals: {e}")
+            return []
 
-    def plot_expenses_amount_by_category(self): # Display piechart of all time expense by category
+    def get_daily_totals(self, from_to, category_id=None): # Get total amount by day and category, From date - To date
         try:
-            conn = sqlite3.connect(self.db_name)
+            cursor = self.db.connection().cursor()
+            cursor.execute(f'''
+                SELECT T.day, T.category_id, C.category_name, T.total_amount, T.expense_count
+                FROM DailyTotals T
+                JOIN Categories C ON C.category_id = T.category_id
+                WHERE T.day BETWEEN ? AND ? AND T.expense_count > 0 AND C.tenant_id = ? {"AND T.category_id = ?" if category_id is not None else ""}
+                ORDER BY T.day, T.category_id
+            ''', (dates.padded(from_to["From"]), dates.padded(from_to["To"]), self.tenant_id) + ((category_id,) if category_id is not None else ()))
+            return cursor.fetchall()
+        except (sqlite3.Error, ValueError) as e:
+            print(f"An error occurred while retrieving daily totals: {e}")
+            return []
+
+    def get_monthly_totals(self, category_id=None): # Get total amount by month (yyyy-mm) and category
+        try:
+            cursor = self.db.connection().cursor()
+            cursor.execute(f'''
+                SELECT T.month, T.category_id, C.category_name, T.total_amount, T.expense_count
+                FROM MonthlyTotals T
+                JOIN Categories C ON C.category_id = T.category_id
+                WHERE T.expense_count > 0 AND C.tenant_id = ? {"AND T.category_id = ?" if category_id is not None else ""}
+                ORDER BY T.month, T.category_id
+            ''', (self.tenant_id,) + ((category_id,) if category_id is not None else ()))
+            return cursor.fetchall()
+        except sqlite3.Error as e:
+            print(f"An error occurred while retrieving monthly totals: {e}")
+            return []
+
+    def rebuild_rollups(self): # Recompute the total tables from Expenses
+        try:
+            self.check_dates()
+            partition.attach(self.db.connection()) # ATTACH is not allowed inside the transaction
+            with self.db.transaction() as conn:
+                rollup.rebuild(conn, partition.source(conn))
+            return True
+        except sqlite3.Error as e:
+            print(f"An error occurred while rebuilding the total tables: {e}")
+            return False
+
+    def verify_rollups(self): # List total table rows that disagree with Expenses
+        try:
+            self.check_dates()
+            conn = self.db.connection()
+            return rollup.verify(conn, partition.source(conn))
+        except sqlite3.Error as e:
+            print(f"An error occurred while verifying the total tables: {e}")
+            return None
+
+    def close_partition(self, period, today=None): # Move an ended 'yyyy' or 'yyyy-mm' period to a read-only partition file
+        try:
+            self.check_dates()
+            return self.db.write(lambda conn: partition.close_period(self.db, period, EXPENSE_INDEXES.values(), today))
+        except (sqlite3.Error, OSError, ValueError) as e:
+            print(f"An error occurred while closing the partition {period}: {e}")
+            return None
+
+    def get_partitions(self): # Get (period, first_day, last_day, file, row_count) of the closed partitions
+        try:
+            return partition.partitions(self.db.connection())
+        except sqlite3.Error as e:
+            print(f"An error occurred while retrieving partitions: {e}")
+            return []
+
+    def plot_expenses_amount_by_category(self, fmt=None, cache_dir='charts'): # Display piechart of all time expense by category
+        if fmt is not None: # Headless: render to a png/svg file and return its path
+            try:
+                return charts.render("category_pie", charts.category_pie_data(self), fmt, cache_dir)
+            except (sqlite3.Error, OSError, ValueError) as e:
+                print(f"An error occurred while rendering expenses by category: {e}")
+                return None
+        # Imported here so that importing this module stays fast for the CLI
+        import pandas as pd
+        import matplotlib.pyplot as plt
+        import numpy as np
+        try:
+            conn = self.db.connection()
             query = '''
-                SELECT C.category_name, SUM(E.amount) as total_amount
-                FROM Expenses E
-                JOIN Categories C ON C.category_id = E.category_id
-                WHERE E.is_deleted = 0
+                SELECT C.category_name, SUM(T.total_amount) as total_amount
+                FROM CategoryTotals T
+                JOIN Categories C ON C.category_id = T.category_id
+                WHERE T.expense_count > 0 AND C.tenant_id = ?
                 GROUP BY C.category_name
             '''
-            df = pd.read_sql_query(query, conn)
-            conn.close()
+            df = pd.read_sql_query(query, conn, params=(self.tenant_id,))
 
             # Plotting the pie chart using pandas
             df.set_index('category_name', inplace=True)
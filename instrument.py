@@ -0,0 +1,227 @@
+import bisect
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+
+BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+SLOW_LOG_SIZE = 100
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1) # The last bucket holds everything above BUCKETS_MS[-1]
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.errors = 0
+        self.param_shapes = set()
+
+    def add(self, ms, rows=0):
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.rows += rows
+
+    def percentile(self, p): # Upper bound of the bucket holding the p-th percentile, in ms
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS_MS + (self.max_ms,), self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+
+class Registry:
+    def __init__(self, slow_ms=100.0, log_file=None):
+        self.slow_ms = slow_ms # None turns the slow-query log off
+        self.log_file = log_file
+        self.statements = {}
+        self.connects = Histogram()
+        self.slow_queries = deque(maxlen=SLOW_LOG_SIZE)
+        self._lock = threading.Lock()
+
+    def record(self, conn, sql, params_shape, ms, rows, error=False):
+        key = statement_key(sql)
+        with self._lock:
+            histogram = self.statements.get(key)
+            if histogram is None:
+                histogram = self.statements[key] = Histogram()
+            histogram.add(ms, rows)
+            histogram.errors += error
+            histogram.param_shapes.add(params_shape)
+        if self.slow_ms is not None and ms >= self.slow_ms:
+            self._log_slow(conn, sql, params_shape, ms, rows)
+
+    def record_connect(self, ms):
+        with self._lock:
+            self.connects.add(ms)
+
+    def _log_slow(self, conn, sql, params_shape, ms, rows):
+        entry = {"at": time.strftime("%Y-%m-%d %H:%M:%S"), "ms": round(ms, 3), "rows": rows,
+                 "params": params_shape, "sql": statement_key(sql), "plan": explain(conn, sql)}
+        with self._lock:
+            self.slow_queries.append(entry)
+            if self.log_file:
+                with open(self.log_file, "a", encoding="utf-8") as file:
+                    file.write(json.dumps(entry) + "\n")
+
+    def reset(self):
+        with self._lock:
+            self.statements.clear()
+            self.connects = Histogram()
+            self.slow_queries.clear()
+
+    def dump(self, limit=20): # Text report: slowest statements by total time, connection opens, recent slow queries
+        with self._lock:
+            statements = sorted(self.statements.items(), key=lambda item: item[1].total_ms, reverse=True)[:limit]
+            slow_queries = list(self.slow_queries)[-10:]
+            connects = self.connects
+        lines = [f"{'calls':>7}{'total ms':>11}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}{'rows':>9}{'errors':>7}  statement"]
+        for key, histogram in statements:
+            lines.append(f"{histogram.count:>7}{histogram.total_ms:>11.1f}{histogram.percentile(50):>9.2f}{histogram.percentile(99):>9.2f}"
+                         f"{histogram.max_ms:>9.2f}{histogram.rows:>9}{histogram.errors:>7}  {key[:100]}")
+        lines.append(f"connections opened: {connects.count}, {connects.total_ms:.1f} ms in total, max {connects.max_ms:.2f} ms")
+        if slow_queries:
+            lines.append(f"slow queries (>= {self.slow_ms} ms):")
+            for entry in slow_queries:
+                lines.append(f"  {entry['at']} {entry['ms']:.1f} ms, {entry['rows']} rows, params {entry['params']}: {entry['sql'][:100]}")
+                lines.extend(f"    {detail}" for detail in entry["plan"])
+        return "\n".join(lines)
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    # Time of a statement is execute plus every fetch, recorded once its rows are exhausted or the cursor moves on
+    def execute(self, sql, parameters=()):
+        self._finish()
+        return self._timed(super().execute, sql, parameters, params_shape(parameters))
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        seen = [0, 0] # Parameter sets and their length, counted as they are consumed so generators stay lazy
+        def counted():
+            for parameters in seq_of_parameters:
+                seen[0] += 1
+                seen[1] = len(parameters)
+                yield parameters
+        return self._timed(super().executemany, sql, counted(), lambda: f"many[{seen[0]}x{seen[1]}]")
+
+    def _timed(self, run, sql, parameters, shape):
+        started = time.perf_counter()
+        try:
+            run(sql, parameters)
+        except sqlite3.Error:
+            REGISTRY.record(self.connection, sql, shape() if callable(shape) else shape, (time.perf_counter() - started) * 1000, 0, error=True)
+            raise
+        self._pending = [sql, shape() if callable(shape) else shape, time.perf_counter() - started, 0]
+        if self.description is None: # No rows to fetch
+            self._finish()
+        return self
+
+    def fetchone(self):
+        row = self._fetch(super().fetchone)
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._fetch(lambda: super(InstrumentedCursor, self).fetchmany(self.arraysize if size is None else size))
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._fetch(super().fetchall)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        self._finish()
+
+    def _fetch(self, fetch):
+        started = time.perf_counter()
+        result = fetch()
+        pending = getattr(self, "_pending", None)
+        if pending is not None:
+            pending[2] += time.perf_counter() - started
+            pending[3] += len(result) if isinstance(result, list) else result is not None
+        return result
+
+    def _finish(self):
+        pending = getattr(self, "_pending", None)
+        if pending is not None:
+            self._pending = None
+            sql, shape, seconds, rows = pending
+            REGISTRY.record(self.connection, sql, shape, seconds * 1000, rows)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+REGISTRY = Registry()
+_enabled = False
+
+
+def enable(slow_ms=100.0, log_file=None): # Instrument connections opened from now on
+    global _enabled
+    REGISTRY.slow_ms = slow_ms
+    REGISTRY.log_file = log_file
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def connection_class(): # sqlite3.connect factory for new connections
+    return InstrumentedConnection if _enabled else sqlite3.Connection
+
+
+def enabled():
+    return _enabled
+
+
+def statement_key(sql): # One entry per statement shape: whitespace collapsed, IN (?, ?, ...) lists folded
+    return re.sub(r"\?(\s*,\s*\?)+", "?, ...", " ".join(sql.split()))
+
+
+def params_shape(parameters):
+    if isinstance(parameters, dict):
+        return f"dict[{len(parameters)}]"
+    return f"{type(parameters).__name__}[{len(parameters)}]"
+
+
+def explain(conn, sql): # EXPLAIN QUERY PLAN details of a statement, without running it
+    if not sql.lstrip().upper().startswith(("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")):
+        return []
+    try:
+        # Placeholders are bound to NULL; the plan depends on the SQL, not the values
+        return [row[3] for row in sqlite3.Connection.execute(conn, f"EXPLAIN QUERY PLAN {sql}", (None,) * sql.count("?"))]
+    except sqlite3.Error as e:
+        return [f"(no plan: {e})"]
@@ -1,12 +1,38 @@
+import argparse
+import io
+import json
+import os
+import sqlite3
+import sys
+from contextlib import nullcontext, redirect_stdout
 import category as cat
 import expense as exp
+from connection import ConnectionManager, MULTI_PROCESS_SETTINGS
+from sharding import ShardRouter
+import instrument
+import query
 from datetime import datetime
 
 
-user_name = str(input('Enter your name as database name: '))
-db_name = f'{user_name}.db'
-category = cat.Category(db_name)
-expense = exp.Expense(db_name)
+PAGE_SIZE = 20
+category = expense = None # Of the user chosen at startup, see open_session
+
+def open_session(user_name): # Open the user's database and its tables
+    global category, expense
+    if os.environ.get('EXPENSE_TRACKER_SHARDS'): # Users share a fixed set of shard databases in this directory
+        router = ShardRouter.from_directory(os.environ['EXPENSE_TRACKER_SHARDS'], int(os.environ.get('EXPENSE_TRACKER_SHARD_COUNT', 8)))
+        category = router.category(user_name)
+        expense = router.expense(user_name)
+    else:
+        db_name = f'{user_name}.db'
+        ConnectionManager.for_database(db_name).configure(**MULTI_PROCESS_SETTINGS) # Several processes may open the same user database
+        if os.environ.get('EXPENSE_TRACKER_IN_MEMORY'): # write-through or write-back, see README
+            ConnectionManager.for_database(db_name).load_into_memory(os.environ['EXPENSE_TRACKER_IN_MEMORY'],
+                                                                     float(os.environ.get('EXPENSE_TRACKER_FLUSH_SECONDS', 30)))
+        category = cat.Category(db_name)
+        expense = exp.Expense(db_name)
+    category.create_table()
+    expense.create_table()
 
 # Main Menu
 def display_main_menu():
@@ -18,6 +44,8 @@ def display_main_menu():
     print("4. Show Categories".ljust(20) + "8. Show Expenses".ljust(30))
     print(" ".ljust(20)+"9. Show Expenses by Category".ljust(30))
     print(" ".ljust(20)+"10. Pie chart all time expenses by Category".ljust(30))
+    print(" ".ljust(20)+"11. Search Expenses by Description".ljust(30))
+    print(" ".ljust(20)+"12. Show Query Statistics".ljust(30))
 
 # Category Manage
 def add_category(category_name): # 1
@@ -60,7 +88,10 @@ def show_all_categories(): # 4
 # Expense Manage
 def add_expense(cat_id,amount,date,description): # 5
     expense_data = {"category_id":cat_id, "amount":amount, "date":date, "description":description}
-    expense_id, amount = expense.add_expenses(expense_data)
+    added = expense.add_expenses(expense_data)
+    if added is None: # add_expenses printed why
+        return
+    expense_id, amount = added
     if expense_id:
         print("\n"+"|"+"-"*58+"|")
         print(" "*25+"Expense Added"+"\n")
@@ -78,47 +109,147 @@ def delete_expense(expense_id): # 6
 def show_expense_from_to(from_date, to_date): # 7
     print("\n"+"|"+"-"*58+"|")
     date = {"From":from_date,"To":to_date}
-    data = expense.get_expenses_by_date(date)
-    if not data:
-        print("No expenses found.")
-    else:
-        print(" "*5+f"Expense From: {from_date} To: {to_date}"+"\n")
-        for exp in data:
-            print(f"ID: {exp[0]}, Date: {exp[1]}, Category: {exp[2]}, Description: {exp[3]}, Amount: {exp[4]}")
+    print_pages(lambda after: expense.get_expenses_by_date_page(date, after, PAGE_SIZE),
+                lambda exp: print(f"ID: {exp[0]}, Date: {exp[1]}, Category: {exp[2]}, Description: {exp[3]}, Amount: {exp[4]}"),
+                " "*5+f"Expense From: {from_date} To: {to_date}"+"\n")
     print("\n"+"|"+"_"*58+"|")
 
 def show_all_expense(): # 8
     print("\n"+"|"+"-"*58+"|")
-    all_expense = expense.get_all_expenses()
-    if not all_expense:
-        print("No expenses found.")
-    else:
-        print(" "*25+"All Expense"+"\n")
-        for exp in all_expense:
-            print(f"ID: {exp[0]}, Date: {exp[1]}, CategoryID: {exp[2]}, CategoryName: {exp[3]}, Description: {exp[4]}, Amount: {exp[5]}")
+    print_pages(lambda after: expense.get_all_expenses_page(after, PAGE_SIZE),
+                lambda exp: print(f"ID: {exp[0]}, Date: {exp[1]}, CategoryID: {exp[2]}, CategoryName: {exp[3]}, Description: {exp[4]}, Amount: {exp[5]}"),
+                " "*25+"All Expense"+"\n")
     print("\n"+"|"+"_"*58+"|")
 
 def show_expense_by_category(category_id): # 9
     print("\n"+"|"+"-"*58+"|")
     print(" "*5+f"Expense from Category: {category_id}"+"\n")
-    data = expense.get_expenses_by_category(category_id)
-    if not data:
-        print("No expenses found.")
-    else:
-        for exp in data:
-            print(f"ID: {exp[0]}, Date: {exp[1]}, CategoryID: {exp[2]}, CategoryName: {exp[3]}, Description: {exp[4]}, Amount: {exp[5]}")
+    print_pages(lambda after: expense.get_expenses_by_category_page(category_id, after, PAGE_SIZE),
+                lambda exp: print(f"ID: {exp[0]}, Date: {exp[1]}, CategoryID: {exp[2]}, CategoryName: {exp[3]}, Description: {exp[4]}, Amount: {exp[5]}"))
+    print("\n"+"|"+"_"*58+"|")
+
+def search_expense(query, from_to=None): # 11
+    print("\n"+"|"+"-"*58+"|")
+    print_pages(lambda after: expense.search_expenses(query, from_to, None, after, PAGE_SIZE),
+                lambda exp: print(f"ID: {exp[0]}, Date: {exp[1]}, CategoryID: {exp[2]}, CategoryName: {exp[3]}, Description: {exp[4]}, Amount: {exp[5]}"),
+                " "*5+f"Expenses matching: {query}"+"\n")
+    print("\n"+"|"+"_"*58+"|")
+
+def show_query_statistics(): # 12
+    print("\n"+"|"+"-"*58+"|")
+    print(" "*20+"Query Statistics"+"\n")
+    print(instrument.REGISTRY.dump())
     print("\n"+"|"+"_"*58+"|")
 
+def print_pages(fetch_page, print_row, header=None): # Print a page at a time, fetching the next only when asked
+    rows, after = fetch_page(None)
+    if not rows:
+        print("No expenses found.")
+        return
+    if header:
+        print(header)
+    while True:
+        for row in rows:
+            print_row(row)
+        if after is None or input("\n -- Press Enter for more, q to stop: ").lower() == 'q':
+            return
+        rows, after = fetch_page(after)
+
 def show_piechart_exp_by_cat(): #10
     print("\n"+"|"+"-"*58+"|")
     expense.plot_expenses_amount_by_category()
     print("\n"+"|"+"_"*58+"|")
 
+# ============================ Batch Mode ============================ #
+
+# op: function of the request's other fields, returning something JSON can encode
+BATCH_OPERATIONS = {
+    "add_category": lambda name: _fields(("category_id", "name"), category.add_category(name)),
+    "delete_categories": lambda category_ids, cascade=False: _fields(("categories", "expenses"), category.soft_delete_categories(category_ids, cascade)),
+    "restore_categories": lambda category_ids, cascade=False: _fields(("categories", "expenses"), category.restore_categories(category_ids, cascade)),
+    "get_category": lambda category_id: _fields(("category_id", "name"), category.get_category(category_id)),
+    "list_categories": lambda: [{"category_id": category_id, "name": name} for name, category_id in category.get_category_id_map().items()],
+    "add_expense": lambda category_id, amount, date, description: _fields(("expense_id", "amount"), expense.add_expenses(
+        {"category_id": category_id, "amount": amount, "date": date, "description": description})),
+    "delete_expenses": lambda **selectors: expense.soft_delete_expenses(**selectors),
+    "restore_expenses": lambda **selectors: expense.restore_expenses(**selectors),
+    "list_expenses": lambda **filters: [dict(zip(query.DEFAULT_COLUMNS, row)) for row in expense.query().filter(**filters).all()],
+    "search_expenses": lambda text, from_to=None, category_id=None, limit=50: [
+        dict(zip(query.DEFAULT_COLUMNS, row)) for row in expense.search_expenses(text, from_to, category_id, None, limit)[0]],
+    "category_totals": lambda: [_fields(("category_id", "name", "total", "count"), row) for row in expense.get_category_totals()],
+}
+
+def _fields(names, row):
+    return None if row is None else dict(zip(names, row))
+
+def run_batch(lines, out=sys.stdout, atomic=False): # Run JSON-lines operations in one transaction, one JSON result line each; returns the number that failed
+    failed = 0
+    try:
+        with expense.db.transaction() as conn:
+            for number, line in enumerate(lines, 1):
+                if not line.strip():
+                    continue
+                result = run_operation(conn, line)
+                failed += not result["ok"]
+                out.write(json.dumps({"line": number, **result}) + "\n")
+            if atomic and failed:
+                raise BatchRolledBack()
+        committed = True
+    except BatchRolledBack:
+        committed = False
+        category.cache.invalidate() # It may hold rows of the rolled back transaction
+    out.write(json.dumps({"committed": committed, "failed": failed}) + "\n")
+    return failed
+
+def run_operation(conn, line): # {"ok": True, "op", "result"} or {"ok": False, "op", "error"}; a failed operation is rolled back alone
+    try:
+        request = json.loads(line)
+        name = request.pop("op")
+        if not isinstance(name, str):
+            raise TypeError(name)
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return {"ok": False, "op": None, "error": f"Expected a JSON object with an \"op\", got {line.strip()!r}"}
+    operation = BATCH_OPERATIONS.get(name)
+    if operation is None:
+        return {"ok": False, "op": name, "error": f"Unknown op {name!r}, expected one of {list(BATCH_OPERATIONS)}"}
+    conn.execute('SAVEPOINT batch_operation')
+    printed = io.StringIO()
+    try:
+        with redirect_stdout(printed): # Category and Expense print their errors
+            result = operation(**request)
+        error = printed.getvalue().strip()
+    except Exception as e: # Whatever bad arguments raise, e.g. a KeyError for a from_to without "To", fails this line only
+        error = f"{type(e).__name__}: {e}"
+    if error:
+        conn.execute('ROLLBACK TO batch_operation')
+        conn.execute('RELEASE batch_operation')
+        category.cache.invalidate()
+        return {"ok": False, "op": name, "error": error}
+    conn.execute('RELEASE batch_operation')
+    return {"ok": True, "op": name, "result": result}
+
+class BatchRolledBack(Exception):
+    pass
+
 # ============================ Controller ============================ #
 
-def main():
-    category.create_table()
-    expense.create_table()
+def build_parser():
+    parser = argparse.ArgumentParser(description="Expense tracker menu, or a script of operations with --batch")
+    parser.add_argument('--user', help="database name, asked for if not given")
+    parser.add_argument('--batch', metavar='FILE', help="run the JSON-lines operations in FILE ('-' for stdin) and exit")
+    parser.add_argument('--atomic', action='store_true', help="with --batch, commit nothing if any operation fails")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    # Per-statement timings for menu option 12; statements slower than EXPENSE_TRACKER_SLOW_MS are logged with their query plan
+    instrument.enable(float(os.environ.get('EXPENSE_TRACKER_SLOW_MS', 100)), os.environ.get('EXPENSE_TRACKER_SLOW_LOG'))
+    if args.batch is not None and args.user is None:
+        build_parser().error("--batch needs --user")
+    open_session(args.user or str(input('Enter your name as database name: ')))
+    if args.batch is not None:
+        with nullcontext(sys.stdin) if args.batch == '-' else open(args.batch, encoding='utf-8') as script:
+            return 1 if run_batch(script, sys.stdout, args.atomic) else 0
     print("\n" + "="*60)
     print(" "*20+"WELCOME TO EXPENSE TRACKER")
     print("="*60)
@@ -180,6 +311,21 @@ def main():
                     print(f"Invalid input: {ve}")
             case '10': #how_piechart_exp_by_cat
                 show_piechart_exp_by_cat()
+            case '11': #search_expense
+                try:
+                    query = input("Enter words to search for: ")
+                    from_date = input("Enter start date (yyyy-mm-dd), or leave empty: ")
+                    from_to = None
+                    if from_date:
+                        to_date = input("Enter end date (yyyy-mm-dd): ")
+                        datetime.strptime(from_date, "%Y-%m-%d")
+                        datetime.strptime(to_date, "%Y-%m-%d")
+                        from_to = {"From": from_date, "To": to_date}
+                    search_expense(query, from_to)
+                except ValueError as ve:
+                    print(f"Invalid date format: {ve}")
+            case '12': #show_query_statistics
+                show_query_statistics()
             case 'q':
                 print("Exiting the application.")
                 break
@@ -188,4 +334,4 @@ def main():
                 print("-"*60)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,131 @@
+import calendar
+import os
+import re
+import sqlite3
+import dates
+from connection import ConnectionManager, FILE_VFS
+from datetime import date
+from urllib.request import pathname2url
+
+# Closed periods of Expenses, each moved to its own file next to the database and attached read-only
+CATALOG = '''
+    CREATE TABLE IF NOT EXISTS ExpensePartitions (
+        period TEXT PRIMARY KEY,
+        first_day TEXT NOT NULL,
+        last_day TEXT NOT NULL,
+        file TEXT NOT NULL,
+        row_count INTEGER NOT NULL
+    )
+'''
+VIEW_NAME = "AllExpenses" # Temp view over the hot table and every partition, for code that does not prune
+
+
+def create_catalog(conn):
+    conn.execute(CATALOG)
+
+
+def period_bounds(period): # ('yyyy-mm-dd', 'yyyy-mm-dd') first and last day of a 'yyyy' or 'yyyy-mm' period
+    match = re.fullmatch(r'(\d{4})(?:-(\d{2}))?', period)
+    if not match or (match.group(2) and not 1 <= int(match.group(2)) <= 12):
+        raise ValueError(f"Invalid period '{period}', expected yyyy or yyyy-mm")
+    year = int(match.group(1))
+    if match.group(2) is None:
+        return f"{year:04d}-01-01", f"{year:04d}-12-31"
+    month = int(match.group(2))
+    return f"{year:04d}-{month:02d}-01", f"{year:04d}-{month:02d}-{calendar.monthrange(year, month)[1]:02d}"
+
+
+def partitions(conn, first_day=None, last_day=None): # [(period, first_day, last_day, file, row_count)] overlapping the days
+    try:
+        return conn.execute('''
+            SELECT period, first_day, last_day, file, row_count FROM ExpensePartitions
+            WHERE last_day >= ? AND first_day <= ?
+            ORDER BY first_day
+        ''', (first_day or "0000-00-00", last_day or "9999-99-99")).fetchall()
+    except sqlite3.OperationalError as e:
+        if "no such table" in str(e): # Database from before partitioning
+            return []
+        raise
+
+
+def source(conn, first_day=None, last_day=None): # FROM clause item over the hot table and only the overlapping partitions
+    overlapping = partitions(conn, first_day, last_day)
+    if not overlapping:
+        return "Expenses"
+    attach(conn)
+    return f"({_union(conn, overlapping)})"
+
+
+def schemas(conn, first_day=None, last_day=None): # Schema names attach gives the partitions overlapping the days
+    return [_schema(row[0]) for row in partitions(conn, first_day, last_day)]
+
+
+def attach(conn): # Attach partitions this connection does not know yet, read-only, and rebuild the view over them
+    attached = {row[1] for row in conn.execute('PRAGMA database_list')}
+    catalog = partitions(conn)
+    missing = [row for row in catalog if _schema(row[0]) not in attached]
+    if not missing and (not catalog or conn.execute("SELECT 1 FROM temp.sqlite_master WHERE name = ?", (VIEW_NAME,)).fetchone()):
+        return
+    directory = os.path.dirname(_main_file(conn))
+    for period, _, _, file, _ in missing:
+        uri = f"file:{pathname2url(os.path.join(directory, file))}?mode=ro&vfs={FILE_VFS}"
+        conn.execute(f'ATTACH DATABASE ? AS {_schema(period)}', (uri,))
+    conn.execute(f'DROP VIEW IF EXISTS temp.{VIEW_NAME}')
+    conn.execute(f'CREATE TEMP VIEW {VIEW_NAME} AS {_union(conn, catalog)}')
+
+
+def close_period(db, period, index_sqls, today=None): # Move the live expenses of an ended period into a partition file
+    first_day, last_day = period_bounds(period)
+    if last_day >= (today or date.today().isoformat()):
+        raise ValueError(f"Period {period} has not ended yet")
+    with db.transaction() as conn: # Holds the write lock, so the period cannot change while it moves
+        if partitions(conn, first_day, last_day):
+            raise ValueError(f"Period {period} overlaps a closed partition")
+        main_file = _main_file(conn)
+        file = f"{os.path.splitext(os.path.basename(main_file))[0]}.{period}.db"
+        path = os.path.join(os.path.dirname(main_file), file)
+        if os.path.exists(path): # Left over from an interrupted close; its rows never left the hot table
+            os.remove(path)
+        table_sql = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'Expenses'").fetchone()[0]
+        cursor = conn.execute('''
+            SELECT * FROM main.Expenses WHERE date BETWEEN ? AND ? AND is_deleted = 0 ORDER BY date, expense_id
+        ''', (dates.to_day(first_day), dates.to_day(last_day)))
+        part = sqlite3.connect(path)
+        try:
+            part.execute(table_sql)
+            placeholders = ", ".join("?" * len(cursor.description))
+            row_count = part.executemany(f'INSERT INTO Expenses VALUES ({placeholders})', cursor).rowcount
+            for sql in index_sqls:
+                part.execute(sql)
+            part.commit() # Durable before the rows leave the hot table
+        finally:
+            part.close()
+        # Soft-deleted rows of the period go to the compaction archive rather than the partition, which stays live rows only
+        import compaction # which imports this module
+        cursor = conn.execute('SELECT * FROM main.Expenses WHERE date BETWEEN ? AND ? AND is_deleted = 1', (dates.to_day(first_day), dates.to_day(last_day)))
+        columns = [column[0] for column in cursor.description]
+        deleted = cursor.fetchall()
+        if deleted:
+            compaction.archive_rows(conn, db.db_name, "Expenses", columns, deleted)
+        conn.execute('DELETE FROM main.Expenses WHERE date BETWEEN ? AND ?', (dates.to_day(first_day), dates.to_day(last_day)))
+        conn.execute('INSERT INTO ExpensePartitions VALUES (?, ?, ?, ?, ?)', (period, first_day, last_day, file, row_count))
+    return row_count
+
+
+def _union(conn, rows): # Hot table UNION ALL the partitions, each in the hot table's columns
+    columns = [row[1] for row in conn.execute('PRAGMA main.table_info(Expenses)')]
+    selects = ["SELECT * FROM main.Expenses"]
+    for row in rows:
+        schema = _schema(row[0])
+        # A partition keeps the columns of when it was closed, columns added since read as NULL
+        existing = {info[1] for info in conn.execute(f'PRAGMA {schema}.table_info(Expenses)')}
+        selects.append(f"SELECT {', '.join(column if column in existing else f'NULL AS {column}' for column in columns)} FROM {schema}.Expenses")
+    return " UNION ALL ".join(selects)
+
+
+def _schema(period):
+    return "p_" + period.replace("-", "_")
+
+
+def _main_file(conn): # Partitions live next to the file, also while the database is loaded into memory
+    return ConnectionManager.file_of(conn) or next(row[2] for row in conn.execute('PRAGMA database_list') if row[1] == "main")
@@ -0,0 +1,139 @@
+import copy
+import json
+from functools import lru_cache
+import partition
+import search
+import dates
+
+# name: SQL of every column a query can return, sort or group by; E is the expense, C its category
+COLUMNS = {
+    "expense_id": "E.expense_id",
+    "date": dates.sql_text("E.date"),
+    "category_id": "E.category_id",
+    "category_name": "C.category_name",
+    "description": "E.description",
+    "amount": "E.amount",
+    "month": f"substr({dates.sql_text('E.date')}, 1, 7)",
+    "year": f"substr({dates.sql_text('E.date')}, 1, 4)",
+}
+SORT_KEYS = {"date": "E.date"} # Day numbers sort like their dates and can use the date indexes
+DEFAULT_COLUMNS = ("expense_id", "date", "category_id", "category_name", "description", "amount") # EXPENSE_COLUMNS
+AGGREGATES = {"total": "SUM(E.amount)", "count": "COUNT(*)", "average": "AVG(E.amount)", "min": "MIN(E.amount)", "max": "MAX(E.amount)"}
+# name: (condition, value -> params)
+FILTERS = {
+    "expense_ids": ("E.expense_id IN (SELECT value FROM json_each(?))", lambda ids: (json.dumps([int(i) for i in ids]),)),
+    "category_id": ("E.category_id = ?", lambda category_id: (category_id,)),
+    "category_ids": ("E.category_id IN (SELECT value FROM json_each(?))", lambda ids: (json.dumps([int(i) for i in ids]),)),
+    "date_from": ("E.date >= ?", lambda day: (dates.to_day(day),)),
+    "date_to": ("E.date <= ?", lambda day: (dates.to_day(day),)),
+    "min_amount": ("E.amount >= ?", lambda amount: (amount,)),
+    "max_amount": ("E.amount <= ?", lambda amount: (amount,)),
+    "description": ("E.description LIKE ? ESCAPE '\\'", lambda text: (like_pattern(text),)),
+    "search": ("E.expense_id IN (SELECT rowid FROM ExpenseSearch WHERE ExpenseSearch MATCH ?)", lambda text: (_match(text),)),
+}
+
+
+def like_pattern(text): # LIKE pattern matching text anywhere, with % and _ in text taken literally
+    return "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def _match(text):
+    match = search.match_expression(text)
+    if not match:
+        raise ValueError("search needs at least one word")
+    return match
+
+
+class ExpenseQuery:
+    # expense.query().filter(category_id=1, from_to=..., min_amount=100).order_by('-amount').limit(10).all()
+    # Every method returns a new query, so a partly built one can be reused
+    def __init__(self, expense):
+        self.expense = expense
+        self._filters = {}
+        self._columns = DEFAULT_COLUMNS
+        self._order = ("date", "expense_id")
+        self._group = ()
+        self._aggregates = ()
+        self._limit = None
+        self._offset = 0
+
+    def filter(self, from_to=None, **filters): # Keep expenses matching every filter, None skips one; from_to is the {"From", "To"} of the other methods
+        filters = {name: value for name, value in filters.items() if value is not None}
+        if from_to is not None:
+            filters.update(date_from=from_to["From"], date_to=from_to["To"])
+        for name in ("date_from", "date_to"): # Partition pruning compares them as text
+            if name in filters:
+                filters[name] = dates.padded(filters[name])
+        unknown = set(filters) - set(FILTERS)
+        if unknown:
+            raise ValueError(f"Unknown filters {sorted(unknown)}, expected some of {list(FILTERS)}")
+        return self._with(_filters={**self._filters, **filters})
+
+    def select(self, *columns): # Return only these columns
+        if not columns:
+            raise ValueError("select needs at least one column")
+        self._check(columns, COLUMNS)
+        return self._with(_columns=columns)
+
+    def order_by(self, *columns): # Sort by columns or aggregates, '-amount' for descending
+        self._check([column.lstrip("-") for column in columns], {**COLUMNS, **AGGREGATES})
+        return self._with(_order=columns)
+
+    def limit(self, limit, offset=0):
+        return self._with(_limit=int(limit), _offset=int(offset))
+
+    def aggregate(self, *aggregates, by=()): # One row per group of the by columns: the group columns, then the aggregates; sorted by the group unless order_by follows
+        self._check(aggregates, AGGREGATES)
+        self._check(by, COLUMNS)
+        return self._with(_aggregates=aggregates or ("total", "count"), _group=tuple(by), _order=tuple(by))
+
+    def sql(self, conn): # (SQL, params) of the query on a connection; the SQL text is the same for the same shape
+        names = tuple(sorted(self._filters))
+        params = [self.expense.tenant_id]
+        for name in names:
+            params.extend(FILTERS[name][1](self._filters[name]))
+        source = partition.source(conn, self._filters.get("date_from"), self._filters.get("date_to"))
+        sql = compile_sql(source, names, self._columns, self._order, self._group, self._aggregates, self._limit is not None)
+        if self._limit is not None:
+            params += [self._limit, self._offset]
+        return sql, tuple(params)
+
+    def all(self): # Every row, raises sqlite3.Error like the page methods
+        self.expense.check_dates()
+        conn = self.expense.db.connection()
+        return conn.execute(*self.sql(conn)).fetchall()
+
+    def first(self):
+        rows = self.limit(1, self._offset).all()
+        return rows[0] if rows else None
+
+    def _with(self, **changes):
+        query = copy.copy(self)
+        query.__dict__.update(changes)
+        return query
+
+    def _check(self, names, known):
+        unknown = [name for name in names if name not in known]
+        if unknown:
+            raise ValueError(f"Unknown names {unknown}, expected some of {list(known)}")
+
+
+@lru_cache(maxsize=256)
+def compile_sql(source, filters, columns, order, group, aggregates, paged): # SQL of one query shape, built once
+    if aggregates:
+        selected = [COLUMNS[name] for name in group] + [AGGREGATES[name] for name in aggregates]
+    else:
+        selected = [COLUMNS[name] for name in columns]
+    conditions = "".join(f" AND {FILTERS[name][0]}" for name in filters)
+    orders = [f"{AGGREGATES.get(name.lstrip('-')) or SORT_KEYS.get(name.lstrip('-')) or COLUMNS[name.lstrip('-')]}{' DESC' if name.startswith('-') else ''}" for name in order]
+    # Categories are only joined when a category name is asked for
+    uses_categories = "category_name" in (*(group if aggregates else columns), *(name.lstrip("-") for name in order))
+    return f'''
+        SELECT {", ".join(selected)}
+        FROM {source} E
+        {"JOIN Categories C ON C.category_id = E.category_id" if uses_categories else ""}
+        WHERE E.is_deleted = 0 AND E.tenant_id = ?{conditions}
+        {"GROUP BY " + ", ".join(COLUMNS[name] for name in group) if group else ""}
+        {"ORDER BY " + ", ".join(orders) if orders else ""}
+        {"LIMIT ? OFFSET ?" if paged else ""}
+    '''
@@ -0,0 +1,116 @@
+import math
+from collections import defaultdict
+import dates
+
+# Materialized totals of non-deleted expenses, kept current by the Expense write path
+ROLLUP_TABLES = {
+    "CategoryTotals": '''
+        CREATE TABLE IF NOT EXISTS CategoryTotals (
+            category_id INTEGER PRIMARY KEY,
+            total_amount REAL NOT NULL DEFAULT 0,
+            expense_count INTEGER NOT NULL DEFAULT 0
+        )
+    ''',
+    "DailyTotals": '''
+        CREATE TABLE IF NOT EXISTS DailyTotals (
+            category_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            total_amount REAL NOT NULL DEFAULT 0,
+            expense_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (category_id, day)
+        ) WITHOUT ROWID
+    ''',
+    "MonthlyTotals": '''
+        CREATE TABLE IF NOT EXISTS MonthlyTotals (
+            category_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            total_amount REAL NOT NULL DEFAULT 0,
+            expense_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (category_id, month)
+        ) WITHOUT ROWID
+    ''',
+}
+
+# How often a tenant's existing expenses were deleted or restored. The totals cannot tell a delete and a restore
+# of the same amount apart from no change at all, readers that cache rows (snapshot.refresh) compare this instead
+VERSION_TABLE = '''
+    CREATE TABLE IF NOT EXISTS ExpenseVersions (
+        tenant_id TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+'''
+
+# (table, key columns, the same key computed from Expenses); the total tables keep 'yyyy-mm-dd' and 'yyyy-mm' keys
+ROLLUP_KEYS = (
+    ("CategoryTotals", "category_id", "category_id"),
+    ("DailyTotals", "category_id, day", f"category_id, {dates.sql_text('date')}"),
+    ("MonthlyTotals", "category_id, month", f"category_id, substr({dates.sql_text('date')}, 1, 7)"),
+)
+
+
+def create_tables(conn): # Create missing rollup tables and fill them from existing expenses
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    for sql in ROLLUP_TABLES.values():
+        conn.execute(sql)
+    conn.execute(VERSION_TABLE)
+    if not set(ROLLUP_TABLES) <= existing:
+        rebuild(conn)
+
+
+def bump_version(conn, tenant_id): # Record that existing expenses of the tenant changed
+    conn.execute('''
+        INSERT INTO ExpenseVersions (tenant_id, version) VALUES (?, 1)
+        ON CONFLICT (tenant_id) DO UPDATE SET version = version + 1
+    ''', (tenant_id,))
+
+
+def version(conn, tenant_id): # 0 until the tenant's expenses first change
+    row = conn.execute('SELECT version FROM ExpenseVersions WHERE tenant_id = ?', (tenant_id,)).fetchone()
+    return row[0] if row else 0
+
+
+def apply_deltas(conn, deltas): # Add (category_id, date, amount, count) deltas, one upsert per touched key
+    categories = defaultdict(lambda: [0.0, 0])
+    days = defaultdict(lambda: [0.0, 0])
+    months = defaultdict(lambda: [0.0, 0])
+    for category_id, date, amount, count in deltas:
+        for totals, key in ((categories, (category_id,)), (days, (category_id, date)), (months, (category_id, date[:7]))):
+            totals[key][0] += amount
+            totals[key][1] += count
+    for (table, key_columns, _), totals in zip(ROLLUP_KEYS, (categories, days, months)):
+        placeholders = ", ".join("?" * (key_columns.count(",") + 3))
+        conn.executemany(f'''
+            INSERT INTO {table} ({key_columns}, total_amount, expense_count) VALUES ({placeholders})
+            ON CONFLICT ({key_columns}) DO UPDATE SET
+                total_amount = total_amount + excluded.total_amount,
+                expense_count = expense_count + excluded.expense_count
+        ''', [(*key, amount, count) for key, (amount, count) in totals.items()])
+
+
+def rebuild(conn, source="Expenses"): # Recompute every rollup from the Expenses table, or a union with its partitions
+    for table, key_columns, source_key in ROLLUP_KEYS:
+        conn.execute(f'DELETE FROM {table}')
+        conn.execute(f'''
+            INSERT INTO {table} ({key_columns}, total_amount, expense_count)
+            SELECT {source_key}, SUM(amount), COUNT(*)
+            FROM {source}
+            WHERE is_deleted = 0
+            GROUP BY {source_key}
+        ''')
+
+
+def verify(conn, source="Expenses"): # List (table, key, stored, expected) for every rollup row that disagrees with Expenses
+    mismatches = []
+    for table, key_columns, source_key in ROLLUP_KEYS:
+        expected = {tuple(row[:-2]): row[-2:] for row in conn.execute(f'''
+            SELECT {source_key}, SUM(amount), COUNT(*) FROM {source} WHERE is_deleted = 0 GROUP BY {source_key}
+        ''')}
+        stored = {tuple(row[:-2]): row[-2:] for row in conn.execute(f'''
+            SELECT {key_columns}, total_amount, expense_count FROM {table} WHERE expense_count != 0 OR total_amount != 0
+        ''')}
+        for key in sorted(expected.keys() | stored.keys(), key=repr):
+            stored_total = stored.get(key, (0.0, 0))
+            expected_total = expected.get(key, (0.0, 0))
+            if stored_total[1] != expected_total[1] or not math.isclose(stored_total[0], expected_total[0], rel_tol=1e-9, abs_tol=1e-6):
+                mismatches.append((table, key, stored_total, expected_total))
+    return mismatches
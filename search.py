@@ -0,0 +1,42 @@
+import partition
+
+# Contentless FTS5 index of the descriptions of live expenses, rowid = expense_id, kept current by the Expense write path
+SEARCH_TABLE = '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS ExpenseSearch USING fts5(description, content='')
+'''
+
+
+def create_table(conn): # Create the index if missing and fill it from existing expenses
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ExpenseSearch'").fetchone()
+    conn.execute(SEARCH_TABLE)
+    if not exists:
+        rebuild(conn)
+
+
+def index(conn, rows): # Add (expense_id, description) rows
+    conn.executemany('''
+        INSERT INTO ExpenseSearch (rowid, description) VALUES (?, ?)
+    ''', ((expense_id, description) for expense_id, description in rows if description))
+
+
+def unindex(conn, rows): # Remove (expense_id, description) rows; a contentless index needs the indexed text to remove it
+    conn.executemany('''
+        INSERT INTO ExpenseSearch (ExpenseSearch, rowid, description) VALUES ('delete', ?, ?)
+    ''', ((expense_id, description) for expense_id, description in rows if description))
+
+
+def rebuild(conn): # Re-index every live expense
+    conn.execute("INSERT INTO ExpenseSearch (ExpenseSearch) VALUES ('delete-all')")
+    index(conn, conn.execute(f'''
+        SELECT expense_id, description FROM {partition.source(conn)} WHERE is_deleted = 0
+    '''))
+
+
+def match_expression(text): # Plain words to an FTS5 query: every word must match, a trailing * matches a prefix
+    terms = []
+    for word in text.split():
+        prefix = word.endswith("*") and len(word) > 1
+        word = word.rstrip("*")
+        if word:
+            terms.append('"' + word.replace('"', '""') + '"' + ("*" if prefix else ""))
+    return " ".join(terms)
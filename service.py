@@ -0,0 +1,126 @@
+import asyncio
+import functools
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from category import Category
+from expense import Expense
+
+# Methods served by the single writer thread; everything else goes to the reader pool.
+# Connections are per thread, so this is one writer connection and one connection per reader.
+CATEGORY_WRITES = ("create_table", "add_category", "soft_delete_category", "soft_delete_categories", "restore_categories")
+CATEGORY_READS = ("get_all_categories", "get_category", "get_category_id_map")
+EXPENSE_WRITES = ("create_table", "create_indexes", "add_expenses", "add_expenses_bulk", "soft_delete_expense",
+                  "soft_delete_expenses", "restore_expenses", "rebuild_rollups", "close_partition")
+EXPENSE_READS = (
+    "get_all_expenses", "get_all_expenses_page", "get_expense",
+    "get_expenses_by_date", "get_expenses_by_date_page",
+    "get_expenses_by_category", "get_expenses_by_category_page",
+    "get_category_totals", "get_daily_totals", "get_monthly_totals", "verify_rollups", "get_partitions",
+    "plot_expenses_amount_by_category", "search_expenses",
+)
+# Async generators over the keyset pages: (service method, page method)
+EXPENSE_ITERATORS = (
+    ("iter_all_expenses", "get_all_expenses_page"),
+    ("iter_expenses_by_date", "get_expenses_by_date_page"),
+    ("iter_expenses_by_category", "get_expenses_by_category_page"),
+)
+
+
+class ExpenseService:
+    def __init__(self, db_name, readers=4, max_pending=256):
+        self.db_name = db_name
+        self.category = Category(db_name)
+        self.expense = Expense(db_name)
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="expense-writer")
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="expense-reader")
+        self._max_pending = max_pending
+        self._pending = None
+        self.categories = _AsyncMethods(self, self.category, CATEGORY_WRITES, CATEGORY_READS)
+        self.expenses = _AsyncMethods(self, self.expense, EXPENSE_WRITES, EXPENSE_READS, EXPENSE_ITERATORS)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self): # Wait for queued calls, then stop the worker threads
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+
+    async def _run(self, executor, method, *args, **kwargs): # Run a blocking method without blocking the event loop
+        if self._pending is None: # Created lazily so it binds to the running loop
+            self._pending = asyncio.Semaphore(self._max_pending)
+        async with self._pending:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(executor, functools.partial(method, *args, **kwargs))
+
+    async def _iter_pages(self, page_method, *args, page_size=1000):
+        after = None
+        while True:
+            rows, after = await self._run(self._readers, page_method, *args, after, page_size)
+            for row in rows:
+                yield row
+            if after is None:
+                return
+
+
+class _AsyncMethods:
+    def __init__(self, service, target, writes, reads, iterators=()):
+        for name in writes:
+            setattr(self, name, self._bind(service, service._writer, getattr(target, name)))
+        for name in reads:
+            setattr(self, name, self._bind(service, service._readers, getattr(target, name)))
+        for name, page_name in iterators:
+            setattr(self, name, functools.partial(service._iter_pages, getattr(target, page_name)))
+
+    @staticmethod
+    def _bind(service, executor, method):
+        async def call(*args, **kwargs):
+            return await service._run(executor, method, *args, **kwargs)
+        call.__name__ = method.__name__
+        return call
+
+
+async def load_test(db_name, duration=5.0, concurrency=32, write_ratio=0.1, readers=4, seed=0): # Requests/sec of a mixed read/write workload
+    rng = random.Random(seed)
+    service = ExpenseService(db_name, readers=readers)
+    categories, expenses = service.categories, service.expenses
+    try:
+        await categories.create_table()
+        await expenses.create_table()
+        category_ids = list((await categories.get_category_id_map()).values())
+        if not category_ids:
+            category_ids = [(await categories.add_category("Load test"))[0]]
+        latencies = []
+        deadline = time.perf_counter() + duration
+
+        async def client():
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                if rng.random() < write_ratio:
+                    await expenses.add_expenses({
+                        "category_id": rng.choice(category_ids), "amount": round(rng.uniform(1, 500), 2),
+                        "date": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}", "description": "load test",
+                    })
+                elif rng.random() < 0.5:
+                    await expenses.get_expenses_by_category_page(rng.choice(category_ids), None, 20)
+                else:
+                    month = rng.randint(1, 12)
+                    await expenses.get_expenses_by_date_page({"From": f"2024-{month:02d}-01", "To": f"2024-{month:02d}-28"}, None, 20)
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    finally:
+        service.close()
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "seconds": elapsed,
+        "requests_per_second": len(latencies) / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000 if latencies else None,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000 if latencies else None,
+    }
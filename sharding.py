@@ -0,0 +1,95 @@
+import hashlib
+import os
+import sqlite3
+from category import Category
+from expense import Expense
+from connection import ConnectionManager, MULTI_PROCESS_SETTINGS
+
+# Cross-tenant aggregates: each query returns (key, total_amount, expense_count) rows of one shard,
+# read from the total tables so a shard answers without scanning its expenses
+AGGREGATES = {
+    "tenant": '''
+        SELECT C.tenant_id, SUM(T.total_amount), SUM(T.expense_count)
+        FROM CategoryTotals T
+        JOIN Categories C ON C.category_id = T.category_id
+        WHERE T.expense_count > 0
+        GROUP BY C.tenant_id
+    ''',
+    "category": '''
+        SELECT C.category_name, SUM(T.total_amount), SUM(T.expense_count)
+        FROM CategoryTotals T
+        JOIN Categories C ON C.category_id = T.category_id
+        WHERE T.expense_count > 0
+        GROUP BY C.category_name
+    ''',
+    "month": '''
+        SELECT T.month, SUM(T.total_amount), SUM(T.expense_count)
+        FROM MonthlyTotals T
+        WHERE T.expense_count > 0
+        GROUP BY T.month
+    ''',
+}
+
+
+class ShardRouter:
+    def __init__(self, shard_names, placements=None):
+        if not shard_names:
+            raise ValueError("A shard router needs at least one shard database")
+        self.shard_names = list(shard_names)
+        self.placements = dict(placements or {}) # {tenant_id: shard_name} pins, e.g. for a tenant moved off a busy shard
+        for shard_name in self.shard_names:
+            ConnectionManager.for_database(shard_name).configure(**MULTI_PROCESS_SETTINGS) # Tenants of a shard write concurrently
+
+    @classmethod
+    def from_directory(cls, directory, shards=8, placements=None): # shard_000.db ... shard_<n-1>.db in a directory
+        os.makedirs(directory, exist_ok=True)
+        return cls([os.path.join(directory, f"shard_{i:03d}.db") for i in range(shards)], placements)
+
+    def shard_for(self, tenant_id): # Database file that holds a tenant; stable across processes and runs
+        if tenant_id in self.placements:
+            return self.placements[tenant_id]
+        digest = hashlib.sha1(tenant_id.encode('utf-8')).digest()
+        return self.shard_names[int.from_bytes(digest[:8], 'big') % len(self.shard_names)]
+
+    def category(self, tenant_id):
+        return Category(self.shard_for(tenant_id), tenant_id=tenant_id)
+
+    def expense(self, tenant_id):
+        return Expense(self.shard_for(tenant_id), tenant_id=tenant_id)
+
+    def open(self, tenant_id): # Create the tenant's shard tables if needed and return (category, expense)
+        category, expense = self.category(tenant_id), self.expense(tenant_id)
+        category.create_table()
+        expense.create_table()
+        return category, expense
+
+    def aggregate(self, by="tenant", processes=None): # [(key, total_amount, expense_count)] over all tenants of all shards
+        if by not in AGGREGATES:
+            raise ValueError(f"Unknown aggregate '{by}', expected one of {tuple(AGGREGATES)}")
+        jobs = [(shard_name, AGGREGATES[by]) for shard_name in self.shard_names if os.path.exists(shard_name)]
+        if processes == 0 or len(jobs) <= 1:
+            results = map(_query_shard, jobs)
+        else:
+            from concurrent.futures import ProcessPoolExecutor # Deferred, the process machinery is slow to import
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                results = list(executor.map(_query_shard, jobs))
+        merged = {}
+        for rows in results:
+            for key, total_amount, expense_count in rows:
+                totals = merged.setdefault(key, [0.0, 0])
+                totals[0] += total_amount
+                totals[1] += expense_count
+        return [(key, total_amount, expense_count) for key, (total_amount, expense_count) in sorted(merged.items())]
+
+
+def _query_shard(job): # Worker process: run one aggregate on one shard over a read-only connection
+    shard_name, sql = job
+    try:
+        conn = sqlite3.connect(f"file:{os.path.abspath(shard_name)}?mode=ro", uri=True)
+        try:
+            return conn.execute(sql).fetchall()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"An error occurred while aggregating shard {shard_name}: {e}")
+        return []
@@ -0,0 +1,172 @@
+import json
+import math
+import os
+import shutil
+import numpy as np
+import partition
+import rollup
+
+FETCH_SIZE = 65536
+# Raw little-endian column files; a reader maps the first meta["rows"] values of each
+COLUMNS = {
+    "expense_id": np.dtype("<i8"),
+    "category_code": np.dtype("<i4"),  # index into meta["categories"]
+    "amount": np.dtype("<f8"),
+    "date": np.dtype("<M8[D]"),
+}
+SOURCE_DTYPE = np.dtype([("expense_id", np.int64), ("category_id", np.int64), ("amount", np.float64), ("date", np.int64)]) # Day numbers, which are datetime64[D] values
+
+
+def snapshot_dir(expense): # <db>.snapshot next to the database, one per tenant
+    root = os.path.splitext(expense.db_name)[0]
+    return f"{root}.{expense.tenant_id}.snapshot" if expense.tenant_id else f"{root}.snapshot"
+
+
+def refresh(expense, directory=None): # Append expenses added since the last refresh, rebuild if older rows changed
+    directory = directory or snapshot_dir(expense)
+    meta = _read_meta(directory)
+    expense.check_dates()
+    conn = expense.db.connection()
+    version = rollup.version(conn, expense.tenant_id) # Read first: a change after it makes the next refresh rebuild
+    count, total = conn.execute('''
+        SELECT TOTAL(T.expense_count), TOTAL(T.total_amount)
+        FROM CategoryTotals T
+        JOIN Categories C ON C.category_id = T.category_id
+        WHERE C.tenant_id = ?
+    ''', (expense.tenant_id,)).fetchone()
+    rebuilt = meta is None
+    if rebuilt:
+        meta = _new_meta(0)
+    else:
+        new_count, new_total = conn.execute(f'''
+            SELECT COUNT(*), TOTAL(E.amount) FROM {_live_rows(conn)} AND E.expense_id > ?
+        ''', (expense.tenant_id, meta["max_expense_id"])).fetchone()
+        # Deletes and restores bump the version; the totals also catch rows written around the Expense write path
+        if meta.get("version") != version or meta["rows"] + new_count != count \
+                or not math.isclose(meta["amount"] + new_total, total, rel_tol=1e-9, abs_tol=1e-6):
+            meta = _new_meta(meta["generation"] + 1)
+            rebuilt = True
+        elif not new_count:
+            return {"appended": 0, "rebuilt": False, "rows": meta["rows"]}
+    rows_before = meta["rows"]
+    meta["version"] = version
+    _append(conn, directory, meta, _fetch_after(conn, expense.tenant_id, meta["max_expense_id"]))
+    _write_meta(directory, meta)
+    if rebuilt:
+        _remove_old_generations(directory, meta["generation"])
+    return {"appended": meta["rows"] - rows_before, "rebuilt": rebuilt, "rows": meta["rows"]}
+
+
+def load(expense, directory=None, refresh_first=True): # Memory-mapped ExpenseColumns of the snapshot, no row tuples involved
+    from analytics import ExpenseColumns # analytics loads through this module
+    directory = directory or snapshot_dir(expense)
+    if refresh_first:
+        refresh(expense, directory)
+    meta = _read_meta(directory)
+    if meta is None:
+        raise FileNotFoundError(f"No snapshot in {directory}")
+    columns = {name: _map(directory, meta, name, dtype) for name, dtype in COLUMNS.items()}
+    categories = meta["categories"]
+    return ExpenseColumns(
+        columns["expense_id"],
+        columns["category_code"],
+        columns["amount"],
+        columns["date"],
+        np.array([category_id for category_id, _ in categories], dtype=np.int64),
+        np.array([name for _, name in categories], dtype=object),
+    )
+
+
+def _live_rows(conn): # FROM ... WHERE prefix over the live rows of a tenant, partitions included
+    return f'''
+        {partition.source(conn)} E
+        JOIN Categories C ON C.category_id = E.category_id
+        WHERE E.is_deleted = 0 AND E.tenant_id = ?
+    '''
+
+
+def _fetch_after(conn, tenant_id, max_expense_id): # Yield the live rows with a larger expense_id as structured chunks
+    cursor = conn.execute(f'''
+        SELECT E.expense_id, E.category_id, E.amount, E.date FROM {_live_rows(conn)} AND E.expense_id > ?
+        ORDER BY E.expense_id
+    ''', (tenant_id, max_expense_id))
+    while True:
+        rows = cursor.fetchmany(FETCH_SIZE)
+        if not rows:
+            return
+        yield np.array(rows, dtype=SOURCE_DTYPE)
+
+
+def _append(conn, directory, meta, chunks): # Write chunks to the end of the column files and advance meta
+    os.makedirs(directory, exist_ok=True)
+    codes = {category_id: code for code, (category_id, _) in enumerate(meta["categories"])}
+    files = {}
+    try:
+        for name, dtype in COLUMNS.items():
+            file = open(_column_path(directory, meta, name), "ab")
+            file.truncate(meta["rows"] * dtype.itemsize) # Drop the tail of an append that never reached the meta file
+            files[name] = file
+        for chunk in chunks:
+            category_ids, inverse = np.unique(chunk["category_id"], return_inverse=True)
+            new_ids = [int(category_id) for category_id in category_ids if int(category_id) not in codes]
+            if new_ids:
+                names = dict(conn.execute(f'''
+                    SELECT category_id, category_name FROM Categories WHERE category_id IN ({", ".join("?" * len(new_ids))})
+                ''', new_ids).fetchall())
+                for category_id in new_ids:
+                    codes[category_id] = len(meta["categories"])
+                    meta["categories"].append([category_id, names[category_id]])
+            values = {
+                "expense_id": chunk["expense_id"],
+                "category_code": np.array([codes[int(category_id)] for category_id in category_ids], dtype=np.int32)[inverse],
+                "amount": chunk["amount"],
+                "date": chunk["date"].astype("datetime64[D]"),
+            }
+            for name, dtype in COLUMNS.items():
+                files[name].write(values[name].astype(dtype, copy=False).tobytes())
+            meta["rows"] += len(chunk)
+            meta["amount"] += float(chunk["amount"].sum())
+            meta["max_expense_id"] = int(chunk["expense_id"][-1])
+    finally:
+        for file in files.values():
+            file.close()
+
+
+def _map(directory, meta, name, dtype):
+    if meta["rows"] == 0: # np.memmap cannot map an empty file
+        return np.empty(0, dtype=dtype)
+    return np.memmap(_column_path(directory, meta, name), dtype=dtype, mode="r", shape=(meta["rows"],))
+
+
+def _new_meta(generation):
+    return {"generation": generation, "version": 0, "rows": 0, "max_expense_id": 0, "amount": 0.0, "categories": []}
+
+
+def _column_path(directory, meta, name): # A rebuild writes a new generation, so open memmaps of the old one stay valid
+    return os.path.join(directory, f"{name}.{meta['generation']}.bin")
+
+
+def _read_meta(directory):
+    try:
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+def _write_meta(directory, meta): # Written last and replaced atomically, it is what makes appended rows visible
+    path = os.path.join(directory, "meta.json")
+    with open(f"{path}.tmp", "w", encoding="utf-8") as file:
+        json.dump(meta, file)
+    os.replace(f"{path}.tmp", path)
+
+
+def _remove_old_generations(directory, generation):
+    for file in os.listdir(directory):
+        parts = file.split(".")
+        if file.endswith(".bin") and len(parts) == 3 and parts[1] != str(generation):
+            os.remove(os.path.join(directory, file))
+
+
+def remove(expense, directory=None): # Delete the snapshot files, e.g. before deleting the database
+    shutil.rmtree(directory or snapshot_dir(expense), ignore_errors=True)
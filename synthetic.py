@@ -0,0 +1,61 @@
+import math
+import random
+from datetime import date, timedelta
+from itertools import accumulate
+from category import Category
+from expense import Expense
+
+# (name, share of expenses, median amount in baht, lognormal sigma, items)
+CATEGORIES = (
+    ("Food", 0.40, 120.0, 0.6, ("coffee", "lunch", "dinner", "breakfast", "noodles", "grocery", "snack", "fruit")),
+    ("Transport", 0.20, 60.0, 0.7, ("taxi", "bus", "train", "fuel", "parking", "motorbike", "ferry")),
+    ("Shopping", 0.12, 600.0, 1.0, ("shirt", "shoes", "book", "gift", "toys", "phone", "bag")),
+    ("Entertainment", 0.10, 300.0, 0.8, ("movie", "concert", "game", "karaoke", "museum", "subscription")),
+    ("Bills", 0.08, 1500.0, 0.5, ("electricity", "water", "internet", "mobile", "insurance")),
+    ("Health", 0.05, 400.0, 0.8, ("pharmacy", "doctor", "dentist", "gym", "vitamins")),
+    ("Rent", 0.05, 12000.0, 0.1, ("rent",)),
+)
+MERCHANTS = 5000 # Zipf-distributed, so a few merchants are everywhere and most are rare
+WEEKEND_SHARE = 0.4 # Of the days spent on, compared with 2/7 for uniform days
+
+
+def merchant_name(rank): # rank 0 is the most common merchant
+    return f"store{rank:04d}"
+
+
+def generate_expenses(category_ids, rows, seed=0, start="2019-01-01", end="2024-12-31"): # Yield expense dicts, the same ones for the same seed
+    rng = random.Random(seed)
+    first, last = date.fromisoformat(start), date.fromisoformat(end)
+    span = (last - first).days
+    category_weights = list(accumulate(share for _, share, _, _, _ in CATEGORIES))
+    merchant_weights = list(accumulate(1 / (rank + 1) ** 1.1 for rank in range(MERCHANTS)))
+    merchants = [merchant_name(rank) for rank in range(MERCHANTS)]
+    for _ in range(rows):
+        (name, _, median, sigma, items), = rng.choices(CATEGORIES, cum_weights=category_weights)
+        weekend = rng.random() < WEEKEND_SHARE
+        day = first + timedelta(days=int(rng.triangular(0, span, span))) # Skewed to recent dates, spending grows over time
+        while (day.weekday() >= 5) != weekend:
+            day = first + timedelta(days=int(rng.triangular(0, span, span)))
+        if name == "Rent":
+            day = day.replace(day=1)
+        merchant, = rng.choices(merchants, cum_weights=merchant_weights)
+        yield {
+            "category_id": category_ids[name],
+            "amount": round(rng.lognormvariate(math.log(median), sigma), 2),
+            "date": day.isoformat(),
+            "description": f"{rng.choice(items)} {merchant}",
+        }
+
+
+def create_dataset(db_name, rows, seed=0, tenant_id='', chunk_size=10000): # Create the tables, the categories and rows expenses
+    category, expense = Category(db_name, tenant_id=tenant_id), Expense(db_name, tenant_id=tenant_id)
+    category.create_table()
+    expense.create_table()
+    category_ids = category.get_category_id_map()
+    for name, _, _, _, _ in CATEGORIES:
+        if name not in category_ids:
+            category_ids[name] = category.add_category(name)[0]
+    result = expense.add_expenses_bulk(generate_expenses(category_ids, rows, seed), chunk_size)
+    if result["rejected"]:
+        raise ValueError(f"Synthetic expenses were rejected: {result['rejected'][:5]}")
+    return category, expense
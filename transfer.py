@@ -0,0 +1,117 @@
+import csv
+from datetime import datetime
+
+
+EXPORT_HEADER = ["expense_id", "date", "category_id", "category_name", "description", "amount"]
+OFX_READ_SIZE = 64 * 1024
+
+
+class CategoryResolver:
+    def __init__(self, category):
+        self.category = category
+        self.ids = category.get_category_id_map()
+        self.created = 0
+
+    def resolve(self, category_name): # Get category ID by name, creating the category when missing
+        category_id = self.ids.get(category_name)
+        if category_id is None:
+            added = self.category.add_category(category_name)
+            if added:
+                category_id = added[0]
+                self.ids[category_name] = category_id
+                self.created += 1
+        return category_id
+
+
+def import_csv(expense, category, file, chunk_size=1000, on_duplicate="allow", window_days=0): # Stream rows of date, category, description, amount
+    resolver = CategoryResolver(category)
+    reader = csv.DictReader(file)
+    def expense_objs():
+        for row in reader:
+            expense_obj = {
+                "amount": row.get("amount"),
+                "date": (row.get("date") or "").strip(),
+                "description": row.get("description"),
+            }
+            name = (row.get("category") or row.get("category_name") or "").strip()
+            if name:
+                expense_obj["category_id"] = resolver.resolve(name)
+            yield expense_obj
+    result = expense.add_expenses_bulk(expense_objs(), chunk_size, on_duplicate, window_days)
+    return _summary(result, resolver, first_line=2) # Line 1 is the header
+
+
+def import_ofx(expense, category, file, category_name="Uncategorized", chunk_size=1000, on_duplicate="allow", window_days=0): # Stream debit transactions of an OFX statement
+    resolver = CategoryResolver(category)
+    def expense_objs():
+        for transaction in _ofx_transactions(file):
+            try:
+                amount = float(transaction.get("TRNAMT", ""))
+            except ValueError:
+                amount = None
+            if amount is not None and amount >= 0:
+                continue # Credits are income, not expenses
+            posted = transaction.get("DTPOSTED", "")[:8]
+            try:
+                date = datetime.strptime(posted, "%Y%m%d").strftime("%Y-%m-%d")
+            except ValueError:
+                date = posted
+            description = " ".join(part for part in (transaction.get("NAME"), transaction.get("MEMO")) if part)
+            yield {
+                "category_id": resolver.resolve(category_name),
+                "amount": -amount if amount is not None else transaction.get("TRNAMT"),
+                "date": date,
+                "description": description or None,
+            }
+    result = expense.add_expenses_bulk(expense_objs(), chunk_size, on_duplicate, window_days)
+    return _summary(result, resolver, first_line=1) # Counted in debit transactions
+
+
+def export_csv(expense, file): # Stream all expenses to CSV, one fetch batch at a time
+    writer = csv.writer(file)
+    writer.writerow(EXPORT_HEADER)
+    count = 0
+    for row in expense.iter_all_expenses():
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+def _summary(result, resolver, first_line):
+    return {
+        "inserted": sum(last - first + 1 for first, last in result["inserted"]),
+        "rejected": [(index + first_line, reason) for index, reason in result["rejected"]],
+        "merged": [(index + first_line, expense_id) for index, expense_id in result["merged"]],
+        "flagged": [(index + first_line, expense_id) for index, expense_id in result["flagged"]],
+        "categories_created": resolver.created,
+    }
+
+
+def _ofx_tokens(file): # Yield (tag, text) pairs reading the file in fixed-size blocks
+    pending = ""
+    while True:
+        block = file.read(OFX_READ_SIZE)
+        if not block:
+            break
+        parts = (pending + block).split("<")
+        pending = parts.pop()
+        for part in parts:
+            if ">" in part:
+                tag, _, text = part.partition(">")
+                yield tag.strip().upper(), text.strip()
+    if ">" in pending:
+        tag, _, text = pending.partition(">")
+        yield tag.strip().upper(), text.strip()
+
+
+def _ofx_transactions(file): # Yield each <STMTTRN> block as a dict of its fields
+    transaction = None
+    for tag, text in _ofx_tokens(file):
+        if tag == "STMTTRN":
+            transaction = {}
+        elif tag == "/STMTTRN":
+            if transaction is not None:
+                yield transaction
+            transaction = None
+        elif transaction is not None and not tag.startswith("/"):
+            transaction[tag] = text
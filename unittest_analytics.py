@@ -0,0 +1,82 @@
+import unittest
+import os
+import numpy as np
+import analytics
+import snapshot
+from category import Category
+from expense import Expense
+from connection import ConnectionManager
+
+
+class TestAnalytics(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.test_db_name = 'test_analytics_db.db'
+        cls.category = Category(cls.test_db_name)
+        cls.expense = Expense(cls.test_db_name)
+        cls.category.create_table()
+        cls.expense.create_table()
+        cls.food_id, _ = cls.category.add_category('Food')
+        cls.travel_id, _ = cls.category.add_category('Travel')
+        cls.expense.add_expenses_bulk([
+            {"category_id": cls.food_id, "amount": 10.0, "date": "2023-07-01", "description": "Last year"},
+            {"category_id": cls.food_id, "amount": 20.0, "date": "2024-07-01", "description": "A"},
+            {"category_id": cls.food_id, "amount": 30.0, "date": "2024-07-03", "description": "B"},
+            {"category_id": cls.travel_id, "amount": 100.0, "date": "2024-07-03", "description": "C"},
+            {"category_id": cls.food_id, "amount": 40.0, "date": "2024-08-01", "description": "D"},
+        ])
+        deleted_id, _ = cls.expense.add_expenses({"category_id": cls.food_id, "amount": 999.0, "date": "2024-07-02", "description": "Deleted"})
+        cls.expense.soft_delete_expense(deleted_id)
+        cls.columns = analytics.load_columns(cls.expense)
+
+    @classmethod
+    def tearDownClass(cls):
+        snapshot.remove(cls.expense)
+        ConnectionManager.for_database(cls.test_db_name).close()
+        if os.path.exists(cls.test_db_name):
+            os.remove(cls.test_db_name)
+
+    def test_load_columns(self): # analytics.load_columns
+        self.assertEqual(len(self.columns), 5)
+        self.assertEqual(self.columns.category_codes.dtype, np.int32)
+        self.assertEqual(self.columns.amounts.dtype, np.float64)
+        self.assertEqual(self.columns.dates.dtype, np.dtype('datetime64[D]'))
+        self.assertEqual(list(self.columns.category_names), ['Food', 'Travel'])
+
+    def test_monthly_trend(self): # analytics.monthly_trend
+        trend = analytics.monthly_trend(self.columns)
+        self.assertEqual(len(trend), 14) # 2023-07 to 2024-08, empty months included
+        self.assertEqual(trend.loc['2023-08'].sum(), 0.0)
+        self.assertEqual(trend.loc['2024-07', 'Food'], 50.0)
+        self.assertEqual(trend.loc['2024-07', 'Travel'], 100.0)
+        self.assertEqual(trend.loc['2024-08', 'Travel'], 0.0)
+
+    def test_rolling_average(self): # analytics.rolling_average
+        rolling = analytics.rolling_average(self.columns, window=2, category_id=self.food_id)
+        self.assertTrue(np.isnan(rolling['2023-07-01']))
+        self.assertEqual(rolling['2024-07-02'], 10.0) # (20 + 0) / 2
+        self.assertEqual(rolling['2024-07-03'], 15.0) # (0 + 30) / 2
+
+    def test_category_percentiles(self): # analytics.category_percentiles
+        percentiles = analytics.category_percentiles(self.columns, percentiles=(50, 100))
+        self.assertEqual(percentiles.loc['Food', 'p50'], 25.0)
+        self.assertEqual(percentiles.loc['Food', 'p100'], 40.0)
+        self.assertEqual(percentiles.loc['Travel', 'p50'], 100.0)
+
+    def test_budget_burn_rate(self): # analytics.budget_burn_rate
+        burn = analytics.budget_burn_rate(self.columns, budget=310.0, month='2024-07', today='2024-07-10')
+        self.assertEqual(burn["spent"], 150.0)
+        self.assertEqual(burn["daily_rate"], 15.0)
+        self.assertEqual(burn["projected_total"], 465.0)
+        self.assertEqual(burn["days_until_exhausted"], 160.0 / 15.0)
+
+    def test_year_over_year(self): # analytics.year_over_year
+        yoy = analytics.year_over_year(self.columns)
+        self.assertEqual(yoy.loc[2024, ('total', 'Food')], 90.0)
+        self.assertEqual(yoy.loc[2024, ('delta', 'Food')], 80.0)
+        self.assertEqual(yoy.loc[2024, ('pct_change', 'Food')], 800.0)
+        self.assertTrue(np.isnan(yoy.loc[2023, ('delta', 'Food')]))
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
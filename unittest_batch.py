@@ -0,0 +1,90 @@
+import unittest
+import glob
+import io
+import json
+import os
+import sqlite3
+from connection import ConnectionManager
+import main
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.test_db_name = 'test_batch_db.db'
+        main.open_session('test_batch_db')
+
+    def tearDown(self):
+        ConnectionManager.for_database(self.test_db_name).close()
+        for path in glob.glob('test_batch_db.*'):
+            os.remove(path)
+
+    def run_batch(self, operations, atomic=False):
+        out = io.StringIO()
+        failed = main.run_batch([json.dumps(operation) if isinstance(operation, dict) else operation for operation in operations], out, atomic)
+        return failed, [json.loads(line) for line in out.getvalue().splitlines()]
+
+    def on_disk(self, sql):
+        conn = sqlite3.connect(self.test_db_name)
+        try:
+            return conn.execute(sql).fetchall()
+        finally:
+            conn.close()
+
+    def test_run_batch(self): # main.run_batch
+        failed, results = self.run_batch([
+            {"op": "add_category", "name": "Food"},
+            {"op": "add_expense", "category_id": 1, "amount": 5.0, "date": "2024-01-02", "description": "Lunch"},
+            {"op": "list_expenses", "date_from": "2024-01-01"},
+            {"op": "category_totals"},
+        ])
+        self.assertEqual(failed, 0)
+        self.assertEqual(results[0], {"line": 1, "ok": True, "op": "add_category", "result": {"category_id": 1, "name": "Food"}})
+        self.assertEqual(results[2]["result"], [{"expense_id": 1, "date": "2024-01-02", "category_id": 1, "category_name": "Food",
+                                                 "description": "Lunch", "amount": 5.0}])
+        self.assertEqual(results[3]["result"], [{"category_id": 1, "name": "Food", "total": 5.0, "count": 1}])
+        self.assertEqual(results[-1], {"committed": True, "failed": 0})
+        self.assertEqual(self.on_disk('SELECT description FROM Expenses'), [('Lunch',)])
+
+    def test_failed_operations(self): # main.run_operation
+        failed, results = self.run_batch([
+            {"op": "add_category", "name": "Food"},
+            {"op": "add_expense", "category_id": 1, "amount": 5.0, "date": "2024-13-01", "description": "Bad date"},
+            {"op": "add_expense", "category_id": 1, "amount": 5.0},
+            {"op": "fly"},
+            "not json",
+            "",
+            {"op": "delete_expenses"},
+            {"op": ["fly"]},
+            {"op": "list_expenses", "from_to": {"From": "2024-01-01"}},
+            {"op": "search_expenses", "text": 5},
+        ])
+        self.assertEqual(failed, 8)
+        self.assertTrue(results[0]["ok"])
+        self.assertIn("An error occurred while adding the expense", results[1]["error"])
+        self.assertIn("description", results[2]["error"])
+        self.assertIn("Unknown op 'fly'", results[3]["error"])
+        self.assertIsNone(results[4]["op"])
+        self.assertEqual(results[5]["line"], 7) # Blank lines are skipped but counted
+        self.assertIsNone(results[6]["op"]) # An op that is not a string is rejected like a missing one
+        self.assertIn("KeyError", results[7]["error"])
+        self.assertIn("AttributeError", results[8]["error"])
+        self.assertEqual(results[-1], {"committed": True, "failed": 8})
+        self.assertEqual(self.on_disk('SELECT category_name FROM Categories'), [('Food',)])
+
+    def test_atomic(self): # main.run_batch
+        failed, results = self.run_batch([{"op": "add_category", "name": "Food"}, {"op": "fly"}], atomic=True)
+        self.assertEqual(failed, 1)
+        self.assertEqual(results[-1], {"committed": False, "failed": 1})
+        self.assertEqual(self.on_disk('SELECT category_name FROM Categories'), [])
+        self.assertIsNone(main.category.get_category(1)) # Not served from the cache either
+
+    def test_main_batch(self): # main.main
+        with open('test_batch_db.jsonl', 'w', encoding='utf-8') as script:
+            script.write('{"op": "add_category", "name": "Food"}\n{"op": "list_categories"}\n')
+        self.assertEqual(main.main(['--user', 'test_batch_db', '--batch', 'test_batch_db.jsonl']), 0)
+        self.assertEqual(self.on_disk('SELECT category_name FROM Categories'), [('Food',)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+import shutil
+import benchmark
+import synthetic
+
+
+class TestSynthetic(unittest.TestCase):
+
+    def setUp(self):
+        self.category_ids = {name: i + 1 for i, (name, _, _, _, _) in enumerate(synthetic.CATEGORIES)}
+
+    def test_generate_expenses_is_seeded(self): # synthetic.generate_expenses
+        first = list(synthetic.generate_expenses(self.category_ids, 500, seed=3))
+        self.assertEqual(first, list(synthetic.generate_expenses(self.category_ids, 500, seed=3)))
+        self.assertNotEqual(first, list(synthetic.generate_expenses(self.category_ids, 500, seed=4)))
+
+    def test_generate_expenses_distributions(self): # synthetic.generate_expenses
+        rows = list(synthetic.generate_expenses(self.category_ids, 5000, start="2020-01-01", end="2023-12-31"))
+        food = sum(row["category_id"] == self.category_ids["Food"] for row in rows) / len(rows)
+        self.assertAlmostEqual(food, 0.40, delta=0.03)
+        self.assertGreater(sum(row["date"] >= "2023" for row in rows), sum(row["date"] < "2021" for row in rows) * 2)
+        self.assertTrue(all("2020-01-01" <= row["date"] <= "2023-12-31" and row["amount"] > 0 for row in rows))
+        self.assertTrue(all(row["date"].endswith("-01") for row in rows if row["category_id"] == self.category_ids["Rent"]))
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def setUp(self):
+        self.data_dir = 'test_benchmark_data'
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def test_run_benchmark(self): # benchmark.run_benchmark
+        operations = ["Expense.get_expenses_by_date_page", "Expense.add_expenses"]
+        results = benchmark.run_benchmark([300], operations, repeat=3, data_dir=self.data_dir)
+        self.assertEqual(sorted(results["300"]), sorted(operations))
+        for result in results["300"].values():
+            self.assertLessEqual(result["p50_ms"], result["p99_ms"])
+            self.assertGreater(result["peak_rss_mb"], 0)
+
+    def test_compare(self): # benchmark.compare
+        baseline = {"1000": {"Expense.get_all_expenses": {"p50_ms": 10.0, "p99_ms": 12.0, "peak_rss_mb": 100.0}}}
+        same = {"1000": {"Expense.get_all_expenses": {"p50_ms": 11.0, "p99_ms": 20.0, "peak_rss_mb": 110.0}}}
+        slower = {"1000": {"Expense.get_all_expenses": {"p50_ms": 20.0, "p99_ms": 25.0, "peak_rss_mb": 200.0}}}
+        self.assertEqual(benchmark.compare(same, baseline), [])
+        self.assertEqual(len(benchmark.compare(slower, baseline)), 2)
+        self.assertEqual(benchmark.compare({"5000": slower["1000"]}, baseline), [])
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
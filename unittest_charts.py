@@ -0,0 +1,60 @@
+import unittest
+import os
+import shutil
+from unittest import mock
+import charts
+from category import Category
+from expense import Expense
+from connection import ConnectionManager
+
+
+class TestCharts(unittest.TestCase):
+
+    def setUp(self):
+        self.test_db_name = 'test_charts_db.db'
+        self.cache_dir = 'test_charts'
+        self.category = Category(self.test_db_name)
+        self.expense = Expense(self.test_db_name)
+        self.category.create_table()
+        self.expense.create_table()
+        food_id, _ = self.category.add_category('Food')
+        travel_id, _ = self.category.add_category('Travel')
+        self.expense.add_expenses({"category_id": food_id, "amount": 50.0, "date": "2024-07-24", "description": "Lunch"})
+        self.expense.add_expenses({"category_id": travel_id, "amount": 150.0, "date": "2024-08-01", "description": "Taxi"})
+
+    def tearDown(self):
+        ConnectionManager.for_database(self.test_db_name).close()
+        if os.path.exists(self.test_db_name):
+            os.remove(self.test_db_name)
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_render_to_file(self): # Expense.plot_expenses_amount_by_category(fmt=...)
+        png_path = self.expense.plot_expenses_amount_by_category(fmt='png', cache_dir=self.cache_dir)
+        svg_path = self.expense.plot_expenses_amount_by_category(fmt='svg', cache_dir=self.cache_dir)
+        with open(png_path, 'rb') as file:
+            self.assertEqual(file.read(8), b'\x89PNG\r\n\x1a\n')
+        with open(svg_path, encoding='utf-8') as file:
+            self.assertIn('<svg', file.read())
+
+    def test_render_cached_by_data(self): # charts.render
+        data = charts.category_pie_data(self.expense)
+        self.assertEqual(data, [('Food', 50.0), ('Travel', 150.0)])
+        path = charts.render('category_pie', data, 'png', self.cache_dir)
+        with mock.patch.dict(charts.CHARTS, {'category_pie': mock.Mock()}) as patched:
+            self.assertEqual(charts.render('category_pie', data, 'png', self.cache_dir), path)
+            patched['category_pie'].assert_not_called()
+
+        self.expense.add_expenses({"category_id": 1, "amount": 1.0, "date": "2024-08-02", "description": "Snack"})
+        self.assertNotEqual(charts.render('category_pie', charts.category_pie_data(self.expense), 'png', self.cache_dir), path)
+
+    def test_render_many(self): # charts.render_many
+        jobs = [
+            ('category_pie', charts.category_pie_data(self.expense), 'png', self.cache_dir),
+            ('monthly_totals', charts.monthly_totals_data(self.expense), 'svg', self.cache_dir),
+        ]
+        paths = charts.render_many(jobs, processes=2)
+        self.assertEqual(len(set(paths)), 2)
+        self.assertTrue(all(os.path.exists(path) for path in paths))
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
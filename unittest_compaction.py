@@ -0,0 +1,74 @@
+import unittest
+import glob
+import os
+import sqlite3
+from category import Category
+from expense import Expense
+from connection import ConnectionManager
+import compaction
+
+
+class TestCompaction(unittest.TestCase):
+
+    def setUp(self):
+        self.test_db_name = 'test_compaction_db.db'
+        self.category = Category(self.test_db_name)
+        self.expense = Expense(self.test_db_name)
+        self.category.create_table()
+        self.expense.create_table()
+        self.food_id, _ = self.category.add_category('Food')
+        self.old_id, _ = self.category.add_category('Old')
+        self.used_id, _ = self.category.add_category('Used')
+        self.expense.add_expenses_bulk(
+            [{"category_id": self.food_id, "amount": 10.0, "date": "2024-01-01", "description": "x" * 500} for _ in range(300)]
+            + [{"category_id": self.used_id, "amount": 5.0, "date": "2024-01-02", "description": "Kept"}])
+        self.ids = [row[0] for row in self.expense.get_expenses_by_category(self.food_id)]
+        self.expense.soft_delete_expenses(expense_ids=self.ids[:250])
+        self.category.soft_delete_categories([self.old_id, self.used_id])
+        conn = self.expense.db.connection() # Deleted long ago, except the last 50 expenses
+        conn.execute("UPDATE Expenses SET deleted_at = '2020-01-01 00:00:00' WHERE expense_id <= ?", (self.ids[199],))
+        conn.execute("UPDATE Categories SET deleted_at = NULL") # Deleted before deleted_at existed
+        conn.commit()
+
+    def tearDown(self):
+        ConnectionManager.for_database(self.test_db_name).close()
+        for path in glob.glob('test_compaction_db.*'):
+            os.remove(path)
+
+    def count(self, db_name, sql):
+        conn = sqlite3.connect(db_name)
+        try:
+            return conn.execute(sql).fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_deleted_at(self): # Expense.soft_delete_expenses / restore_expenses
+        conn = self.expense.db.connection()
+        self.assertIsNotNone(conn.execute('SELECT deleted_at FROM Expenses WHERE expense_id = ?', (self.ids[200],)).fetchone()[0])
+        self.expense.restore_expenses(expense_ids=[self.ids[200]])
+        self.assertIsNone(conn.execute('SELECT deleted_at FROM Expenses WHERE expense_id = ?', (self.ids[200],)).fetchone()[0])
+
+    def test_compact(self): # compaction.compact
+        result = compaction.compact(self.expense.db, retention_days=30, chunk_size=64, pause=0)
+        self.assertTrue(result["converted"])
+        self.assertEqual(result["Expenses"], 200)
+        self.assertEqual(result["Categories"], 1) # 'Used' still has an expense
+        self.assertEqual(result["chunks"], 5)
+        self.assertGreater(result["freed_pages"], 0)
+        archive = compaction.archive_file(self.test_db_name)
+        self.assertEqual(self.count(archive, 'SELECT COUNT(*) FROM Expenses'), 200)
+        self.assertEqual(self.count(archive, 'SELECT category_name FROM Categories'), 'Old')
+        self.assertEqual(self.count(self.test_db_name, 'SELECT COUNT(*) FROM Expenses'), 101)
+        self.assertEqual(self.count(self.test_db_name, 'PRAGMA auto_vacuum'), 2)
+        self.assertEqual(len(self.expense.get_all_expenses()), 51)
+        self.assertEqual(self.expense.verify_rollups(), [])
+
+        result = compaction.compact(self.expense.db, retention_days=0, chunk_size=64, pause=0)
+        self.assertFalse(result["converted"])
+        self.assertEqual((result["Expenses"], result["Categories"]), (50, 0))
+        self.assertEqual(self.count(archive, 'SELECT COUNT(*) FROM Expenses'), 250)
+        self.assertEqual(self.count(self.test_db_name, 'SELECT COUNT(*) FROM Expenses WHERE is_deleted = 1'), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import unittest
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from category import Category
+from expense import Expense
+from connection import ConnectionManager, MULTI_PROCESS_SETTINGS
+
+PROCESSES = 4
+WRITES_PER_PROCESS = 200
+
+
+def write_expenses(db_name, category_id, writes): # Worker process: one add_expenses transaction per row
+    ConnectionManager.for_database(db_name).configure(**MULTI_PROCESS_SETTINGS)
+    expense = Expense(db_name)
+    failed = 0
+    for i in range(writes):
+        if expense.add_expenses({"category_id": category_id, "amount": 1.0, "date": f"2024-01-{i % 28 + 1:02d}", "description": f"pid {os.getpid()}"}) is None:
+            failed += 1
+        if i % 50 == 0:
+            expense.soft_delete_expense(-1) # Writes that touch no row still take the write lock
+    ConnectionManager.close_all()
+    return failed
+
+
+class TestConcurrency(unittest.TestCase):
+
+    def setUp(self):
+        self.test_db_name = 'test_concurrency_db.db'
+        self.db = ConnectionManager.for_database(self.test_db_name)
+        self.db.configure(**MULTI_PROCESS_SETTINGS)
+        self.category = Category(self.test_db_name)
+        self.expense = Expense(self.test_db_name)
+        self.category.create_table()
+        self.expense.create_table()
+        self.category_id, _ = self.category.add_category('Concurrent')
+
+    def tearDown(self):
+        self.db.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.test_db_name + suffix):
+                os.remove(self.test_db_name + suffix)
+
+    def count_expenses(self):
+        return self.db.connection().execute('SELECT COUNT(*) FROM Expenses').fetchone()[0]
+
+    def test_wal_settings(self): # ConnectionManager.configure
+        conn = self.db.connection()
+        self.assertEqual(conn.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+        self.assertEqual(conn.execute('PRAGMA synchronous').fetchone()[0], 1) # NORMAL
+        self.assertEqual(conn.execute('PRAGMA busy_timeout').fetchone()[0], 5000)
+        with self.assertRaises(ValueError):
+            self.db.configure(journal_mode='fast')
+
+    def test_multi_process_writes(self): # Expense.add_expenses from several processes
+        started = time.perf_counter()
+        with multiprocessing.get_context('spawn').Pool(PROCESSES) as pool:
+            failed = pool.starmap(write_expenses, [(self.test_db_name, self.category_id, WRITES_PER_PROCESS)] * PROCESSES)
+        elapsed = time.perf_counter() - started
+        print(f"{PROCESSES * WRITES_PER_PROCESS / elapsed:.0f} writes/s over {PROCESSES} processes", end=' ')
+        self.assertEqual(failed, [0] * PROCESSES)
+        self.assertEqual(self.count_expenses(), PROCESSES * WRITES_PER_PROCESS)
+        self.assertEqual(self.expense.verify_rollups(), [])
+
+    def test_write_queue_group_commit(self): # ConnectionManager.enable_write_queue
+        write_queue = self.db.enable_write_queue()
+        def client():
+            for i in range(WRITES_PER_PROCESS):
+                self.expense.add_expenses({"category_id": self.category_id, "amount": 2.5, "date": "2024-02-01", "description": "queued"})
+        threads = [threading.Thread(target=client) for _ in range(PROCESSES)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.count_expenses(), PROCESSES * WRITES_PER_PROCESS)
+        self.assertEqual(write_queue.writes, PROCESSES * WRITES_PER_PROCESS)
+        self.assertLessEqual(write_queue.batches, write_queue.writes)
+        self.assertEqual(self.expense.verify_rollups(), [])
+
+    def test_write_queue_isolates_failures(self): # ConnectionManager.write
+        self.db.enable_write_queue()
+        def failing(conn):
+            conn.execute("INSERT INTO Categories (category_name) VALUES ('Rolled back')")
+            raise sqlite3.OperationalError('abort')
+        with self.assertRaises(sqlite3.OperationalError):
+            self.db.write(failing)
+        self.assertIsNotNone(self.category.add_category('Kept'))
+        self.db.disable_write_queue()
+        names = [row[1] for row in self.category.get_all_categories()]
+        self.assertIn('Kept', names)
+        self.assertNotIn('Rolled back', names)
+
+    def test_write_queue_lock_timeout(self): # WriteQueue._commit
+        write_queue = self.db.enable_write_queue()
+        self.db.configure(busy_timeout=200)
+        other = sqlite3.connect(self.test_db_name)
+        other.execute('BEGIN IMMEDIATE') # Another process holds the write lock longer than busy_timeout
+        try:
+            future = write_queue.submit(lambda conn: conn.execute("INSERT INTO Categories (category_name) VALUES ('Blocked')"))
+            with self.assertRaises(sqlite3.OperationalError):
+                future.result(timeout=10)
+        finally:
+            other.rollback()
+            other.close()
+        self.assertIsNotNone(self.category.add_category('After')) # The queue keeps working once the lock is free
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,117 @@
+import unittest
+import glob
+import os
+import sqlite3
+from category import Category
+from expense import Expense
+from connection import ConnectionManager
+import dates
+
+OLD_EXPENSES = '''
+    CREATE TABLE Expenses (
+        expense_id INTEGER PRIMARY KEY AUTOINCREMENT, category_id INTEGER, amount REAL NOT NULL,
+        date TEXT NOT NULL, description TEXT, is_deleted INTEGER DEFAULT 0
+    )
+'''
+
+
+class TestDates(unittest.TestCase):
+
+    def setUp(self):
+        self.test_db_name = 'test_dates_db.db'
+
+    def tearDown(self):
+        ConnectionManager.for_database(self.test_db_name).close()
+        for path in glob.glob('test_dates_db.*'):
+            os.remove(path)
+
+    def create_old_database(self, rows): # Database of a version that stored dates as TEXT, with a closed 2022 partition
+        conn = sqlite3.connect(self.test_db_name)
+        conn.execute('CREATE TABLE Categories (category_id INTEGER PRIMARY KEY AUTOINCREMENT, category_name TEXT NOT NULL, is_deleted INTEGER DEFAULT 0)')
+        conn.execute("INSERT INTO Categories (category_name) VALUES ('Food')")
+        conn.execute(OLD_EXPENSES)
+        conn.executemany("INSERT INTO Expenses (category_id, amount, date, description) VALUES (1, ?, ?, 'Old')", rows)
+        conn.execute("INSERT INTO Expenses (expense_id, category_id, amount, date, is_deleted) VALUES (100, 1, 1.0, '2024-01-01', 1)")
+        conn.execute("DELETE FROM Expenses WHERE expense_id = 100") # Purged, its id must not come back
+        conn.execute('CREATE TABLE ExpensePartitions (period TEXT PRIMARY KEY, first_day TEXT NOT NULL, last_day TEXT NOT NULL, file TEXT NOT NULL, row_count INTEGER NOT NULL)')
+        conn.execute("INSERT INTO ExpensePartitions VALUES ('2022', '2022-01-01', '2022-12-31', 'test_dates_db.2022.db', 1)")
+        conn.commit()
+        conn.close()
+        part = sqlite3.connect('test_dates_db.2022.db')
+        part.execute(OLD_EXPENSES) # Closed by a version with tenants, before deleted_at
+        part.execute("ALTER TABLE Expenses ADD COLUMN tenant_id TEXT NOT NULL DEFAULT ''")
+        part.execute("CREATE INDEX idx_expenses_date ON Expenses (tenant_id, date) WHERE is_deleted = 0")
+        part.execute("INSERT INTO Expenses VALUES (50, 1, 7.0, '2022-03-04', 'Partition', 0, '')")
+        part.commit()
+        part.close()
+
+    def test_to_day(self): # dates.to_day / dates.to_text
+        self.assertEqual(dates.to_day('1970-01-01'), 0)
+        self.assertEqual(dates.to_day('1969-12-31'), -1)
+        self.assertEqual(dates.to_text(dates.to_day('2024-02-29')), '2024-02-29')
+        self.assertEqual(dates.to_day('2024-2-9'), dates.to_day('2024-02-09')) # As datetime.strptime(text, "%Y-%m-%d") reads it
+        for bad in ('2024-002-09', '24-02-09', '20240229', '2023-02-29', '2024-13-01', '', None):
+            with self.assertRaises(ValueError):
+                dates.to_day(bad)
+
+    def test_migration(self): # expense.migrate_dates
+        self.create_old_database([(10.0, '2024-07-24'), (20.0, '2024-07-25 13:45:00'), (30.0, '2023-12-31'), (40.0, '2024-1-6')])
+        category, expense = Category(self.test_db_name), Expense(self.test_db_name)
+        category.create_table()
+        expense.create_table()
+        self.assertEqual([(row[1], row[5]) for row in expense.get_all_expenses()],
+                         [('2022-03-04', 7.0), ('2023-12-31', 30.0), ('2024-01-06', 40.0), ('2024-07-24', 10.0), ('2024-07-25', 20.0)])
+        self.assertTrue(expense.rebuild_rollups()) # The total tables are newer than this database, fill them with the partition too
+        self.assertEqual(expense.get_daily_totals({"From": "2024-07-25", "To": "2024-07-25"}), [('2024-07-25', 1, 'Food', 20.0, 1)])
+        self.assertEqual(expense.verify_rollups(), [])
+        conn = expense.db.connection()
+        self.assertEqual({row[0] for row in conn.execute('SELECT typeof(date) FROM main.Expenses')}, {'integer'})
+        self.assertEqual({row[0] for row in conn.execute('SELECT typeof(date) FROM p_2022.Expenses')}, {'integer'})
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'Expenses'")}
+        self.assertIn('idx_expenses_date', indexes)
+        self.assertEqual([row[0] for row in conn.execute("SELECT name FROM p_2022.sqlite_master WHERE type = 'index'")], ['idx_expenses_date', 'idx_expenses_fingerprint']) # Duplicate lookups probe it
+        new_id, _ = expense.add_expenses({"category_id": 1, "amount": 1.0, "date": "2024-8-1", "description": "New"}) # As the menu accepts it
+        self.assertGreater(new_id, 100)
+        self.assertEqual(expense.get_daily_totals({"From": "2024-08-01", "To": "2024-08-01"}), [('2024-08-01', 1, 'Food', 1.0, 1)])
+        expense.create_table() # Already migrated, nothing to do
+        self.assertEqual(len(expense.get_all_expenses()), 6)
+
+    def test_migration_stops_at_bad_dates(self): # expense.migrate_dates
+        self.create_old_database([(10.0, '2024-07-24'), (20.0, '24/07/2024')])
+        Category(self.test_db_name).create_table()
+        Expense(self.test_db_name).create_table()
+        conn = sqlite3.connect(self.test_db_name)
+        try: # Nothing changed, so the dates can be fixed and the upgrade retried
+            self.assertEqual(conn.execute("SELECT type FROM pragma_table_info('Expenses') WHERE name = 'date'").fetchone()[0], 'TEXT')
+            self.assertEqual(conn.execute('SELECT COUNT(*) FROM Expenses').fetchone()[0], 2)
+            columns = {row[0] for row in conn.execute("SELECT name FROM pragma_table_info('Expenses')")}
+            self.assertLessEqual({'tenant_id', 'deleted_at', 'fingerprint'}, columns) # The other upgrades still went ahead
+        finally:
+            conn.close()
+
+    def test_no_dates_used_until_converted(self): # Expense.check_dates
+        self.create_old_database([(10.0, '2024-07-24'), (20.0, '24/07/2024')])
+        Category(self.test_db_name).create_table()
+        expense = Expense(self.test_db_name)
+        expense.create_table()
+        self.assertIsNone(expense.add_expenses({"category_id": 1, "amount": 5.0, "date": "2024-07-25", "description": "New"}))
+        self.assertEqual(expense.add_expenses_bulk([{"category_id": 1, "amount": 5.0, "date": "2024-07-25", "description": "New"}])["inserted"], [])
+        self.assertIsNone(expense.soft_delete_expenses(from_to={"From": "2024-01-01", "To": "2024-12-31"}))
+        self.assertIsNone(expense.get_all_expenses()) # Instead of TEXT dates read as day numbers
+        self.assertEqual(expense.get_monthly_totals(), []) # Not filled from the TEXT dates
+        conn = sqlite3.connect(self.test_db_name)
+        try:
+            self.assertEqual(conn.execute('SELECT COUNT(*) FROM Expenses WHERE is_deleted = 0').fetchone()[0], 2)
+            conn.execute("UPDATE Expenses SET date = '2024-07-23' WHERE date = '24/07/2024'")
+            conn.commit()
+        finally:
+            conn.close()
+        expense.create_table()
+        self.assertEqual([row[1] for row in expense.get_all_expenses()], ['2022-03-04', '2024-07-23', '2024-07-24'])
+        self.assertTrue(expense.rebuild_rollups()) # With the partition, as after any upgrade
+        self.assertIsNotNone(expense.add_expenses({"category_id": 1, "amount": 5.0, "date": "2024-07-25", "description": "New"}))
+        self.assertEqual([(row[0], row[3]) for row in expense.get_monthly_totals()], [('2022-03', 7.0), ('2024-07', 35.0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
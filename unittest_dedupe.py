@@ -0,0 +1,147 @@
+import unittest
+import glob
+import io
+import os
+import sqlite3
+from category import Category
+from expense import Expense
+from connection import ConnectionManager
+import dedupe
+import transfer
+
+
+class TestDedupe(unittest.TestCase):
+
+    def setUp(self):
+        self.test_db_name = 'test_dedupe_db.db'
+        self.category = Category(self.test_db_name)
+        self.expense = Expense(self.test_db_name)
+        self.category.create_table()
+        self.expense.create_table()
+        self.food_id, _ = self.category.add_category('Food')
+        self.statement = [
+            {"category_id": self.food_id, "amount": 3.5, "date": "2024-01-01", "description": "COFFEE  Shop #12"},
+            {"category_id": self.food_id, "amount": 3.5, "date": "2024-01-01", "description": "COFFEE  Shop #12"}, # Bought two
+            {"category_id": self.food_id, "amount": 9.0, "date": "2024-01-05", "description": "Lunch"},
+        ]
+        self.expense.add_expenses_bulk(self.statement)
+
+    def tearDown(self):
+        ConnectionManager.for_database(self.test_db_name).close()
+        for path in glob.glob('test_dedupe_db.*'):
+            os.remove(path)
+
+    def count(self):
+        return self.expense.db.connection().execute('SELECT COUNT(*) FROM Expenses').fetchone()[0]
+
+    def test_fingerprint(self): # dedupe.fingerprint
+        self.assertEqual(dedupe.fingerprint('', 1, 3.5, 'COFFEE  Shop #12'), dedupe.fingerprint('', '1', 3.50000001, 'coffee shop 12'))
+        self.assertNotEqual(dedupe.fingerprint('', 1, 3.5, 'coffee'), dedupe.fingerprint('', 1, 3.51, 'coffee'))
+        self.assertNotEqual(dedupe.fingerprint('', 1, 3.5, 'coffee'), dedupe.fingerprint('', 2, 3.5, 'coffee'))
+        self.assertNotEqual(dedupe.fingerprint('', 1, 3.5, 'coffee'), dedupe.fingerprint('bob', 1, 3.5, 'coffee'))
+        self.assertIsNone(dedupe.fingerprint('', None, 3.5, 'coffee'))
+
+    def test_allow(self): # Expense.add_expenses_bulk
+        result = self.expense.add_expenses_bulk(self.statement)
+        self.assertEqual(result["inserted"], [(4, 6)])
+        self.assertEqual(self.count(), 6)
+
+    def test_reject(self): # Expense.add_expenses_bulk
+        result = self.expense.add_expenses_bulk(self.statement, on_duplicate="reject")
+        self.assertEqual(result["inserted"], [])
+        self.assertEqual(result["rejected"], [(0, "duplicate of expense 1"), (1, "duplicate of expense 2"), (2, "duplicate of expense 3")])
+        self.assertEqual(self.count(), 3)
+
+    def test_merge_pairs_each_expense_once(self): # dedupe.DuplicateMatcher
+        # A later statement with three coffees that day: two were imported already, the third is new
+        coffee = dict(self.statement[0], description="coffee shop 12")
+        result = self.expense.add_expenses_bulk([coffee, coffee, coffee], on_duplicate="merge")
+        self.assertEqual(result["merged"], [(0, 1), (1, 2)])
+        self.assertEqual(result["inserted"], [(4, 4)])
+        self.assertEqual(self.expense.get_category_totals()[0][3], 4) # The totals only count the new coffee
+
+    def test_window(self): # Expense.add_expenses_bulk
+        late = [dict(self.statement[2], date="2024-01-07")] # Posted two days later in the next export
+        self.assertEqual(self.expense.add_expenses_bulk(late, on_duplicate="merge", window_days=2)["merged"], [(0, 3)])
+        later = [dict(self.statement[2], date="2024-01-08")]
+        self.assertEqual(self.expense.add_expenses_bulk(later, on_duplicate="merge", window_days=2)["inserted"], [(4, 4)])
+
+    def test_flag(self): # Expense.add_expenses_bulk
+        result = self.expense.add_expenses_bulk(self.statement[2:], on_duplicate="flag")
+        self.assertEqual(result["flagged"], [(0, 3)])
+        self.assertEqual(result["inserted"], [(4, 4)])
+        duplicate_of = self.expense.db.connection().execute('SELECT duplicate_of FROM Expenses WHERE expense_id = 4').fetchone()[0]
+        self.assertEqual(duplicate_of, 3)
+
+    def test_deleted_are_not_duplicates(self): # dedupe.DuplicateMatcher
+        self.expense.soft_delete_expense(3)
+        self.assertEqual(self.expense.add_expenses_bulk(self.statement[2:], on_duplicate="reject")["inserted"], [(4, 4)])
+
+    def test_closed_partitions_are_probed(self): # dedupe.DuplicateMatcher.match
+        self.expense.add_expenses_bulk([dict(self.statement[2], date="2023-12-30", description="Rent")])
+        self.assertEqual(self.expense.close_partition('2023', today='2024-07-01'), 1)
+        old = [dict(self.statement[2], date="2023-12-30", description="rent"), dict(self.statement[2], date="2023-12-31")]
+        result = self.expense.add_expenses_bulk(old, on_duplicate="reject", window_days=2)
+        self.assertEqual(result["rejected"], [(0, "duplicate of expense 4")])
+        self.assertEqual(result["inserted"], [(5, 5)]) # Lunch of 2024-01-05 is in the hot table, two days is too far from it
+        self.assertEqual(len(self.expense.get_expenses_by_date({"From": "2023-01-01", "To": "2023-12-31"})), 2)
+
+    def test_closed_partitions_with_write_queue(self): # dedupe.DuplicateMatcher.match
+        self.expense.add_expenses_bulk([dict(self.statement[2], date="2023-12-30")])
+        self.expense.close_partition('2023', today='2024-07-01')
+        self.expense.db.enable_write_queue() # match runs on the writer thread's connection
+        try:
+            result = self.expense.add_expenses_bulk([dict(self.statement[2], date="2023-12-30")], on_duplicate="reject")
+        finally:
+            self.expense.db.disable_write_queue()
+        self.assertEqual(result["rejected"], [(0, "duplicate of expense 4")])
+
+    def test_partition_from_before_fingerprints(self): # Expense._migrate_files
+        self.expense.add_expenses_bulk([dict(self.statement[2], date="2023-12-30")])
+        self.expense.close_partition('2023', today='2024-07-01')
+        ConnectionManager.for_database(self.test_db_name).close()
+        conn = sqlite3.connect('test_dedupe_db.2023.db') # As a version from before the fingerprints closed it
+        conn.execute('DROP INDEX idx_expenses_fingerprint')
+        conn.execute('ALTER TABLE Expenses DROP COLUMN duplicate_of')
+        conn.execute('ALTER TABLE Expenses DROP COLUMN fingerprint')
+        conn.commit()
+        conn.close()
+        self.expense.create_table()
+        self.assertEqual(self.expense.add_expenses_bulk([dict(self.statement[2], date="2023-12-30")], on_duplicate="merge")["merged"], [(0, 4)])
+
+    def test_invalid_policy(self): # Expense.add_expenses_bulk
+        with self.assertRaises(ValueError):
+            self.expense.add_expenses_bulk(self.statement, on_duplicate="ignore")
+
+    def test_lookup_plan(self): # dedupe.DuplicateMatcher.match
+        statements = []
+        conn = self.expense.db.connection()
+        conn.set_trace_callback(statements.append)
+        try:
+            self.expense.add_expenses_bulk(self.statement, on_duplicate="merge", window_days=3)
+        finally:
+            conn.set_trace_callback(None)
+        lookup = next(sql for sql in statements if 'json_each' in sql and 'fingerprint' in sql)
+        plan = [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {lookup}')]
+        self.assertTrue(any('idx_expenses_fingerprint' in detail for detail in plan), plan)
+
+    def test_existing_database_is_fingerprinted(self): # dedupe.create_columns
+        ConnectionManager.for_database(self.test_db_name).close()
+        conn = sqlite3.connect(self.test_db_name) # As a version from before the fingerprints left it
+        conn.execute('DROP INDEX idx_expenses_fingerprint')
+        conn.execute('ALTER TABLE Expenses DROP COLUMN duplicate_of')
+        conn.execute('ALTER TABLE Expenses DROP COLUMN fingerprint')
+        conn.commit()
+        conn.close()
+        self.expense.create_table()
+        self.assertEqual(len(self.expense.add_expenses_bulk(self.statement, on_duplicate="merge")["merged"]), 3)
+
+    def test_import_csv(self): # transfer.import_csv
+        file = io.StringIO("date,category,description,amount\n2024-01-05,Food,lunch,9.00\n2024-01-06,Food,Dinner,12\n")
+        summary = transfer.import_csv(self.expense, self.category, file, on_duplicate="merge")
+        self.assertEqual(summary["merged"], [(2, 3)])
+        self.assertEqual(summary["inserted"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,12 @@
 import unittest
 import sqlite3
 import os
+import threading
 from category import Category
 from expense import Expense
+from connection import ConnectionManager
+import rollup
+import dates
 
 class TestCategory(unittest.TestCase):
 
@@ -15,6 +19,7 @@ class TestCategory(unittest.TestCase):
 
     @classmethod
     def tearDownClass(cls):
+        ConnectionManager.for_database(cls.test_db_name).close()
         if os.path.exists(cls.test_db_name):
             os.remove(cls.test_db_name)
             print(f"Deleted database: {cls.test_db_name}", end=' ')
@@ -56,6 +61,32 @@ class TestCategory(unittest.TestCase):
         retrieved_category = self.category.get_category(category_id)
         self.assertIsNone(retrieved_category, "Category should not be retrievable after soft deletion")
 
+    def test_category_cache(self): # Category cache hit/miss counters
+        category_id, _ = self.category.add_category('Test Category')
+        self.category.get_category(category_id)
+        before = self.category.cache_stats()
+        self.assertEqual(self.category.get_category(category_id)[1], 'Test Category')
+        self.assertEqual(len(self.category.get_all_categories()), 1)
+        self.assertEqual(len(self.category.get_all_categories()), 1)
+        after = self.category.cache_stats()
+        self.assertEqual(after["hits"] - before["hits"], 2)
+        self.assertEqual(after["misses"] - before["misses"], 1)
+
+    def test_category_cache_invalidation(self): # Category cache invalidated by writes
+        category_id, _ = self.category.add_category('Test Category')
+        self.assertEqual(len(self.category.get_all_categories()), 1)
+        other = Category(self.test_db_name) # Shares the cache of the same database
+        other.add_category('Other Category')
+        self.assertEqual(len(self.category.get_all_categories()), 2)
+        self.category.soft_delete_category(category_id)
+        self.assertIsNone(self.category.get_category(category_id))
+
+        conn = sqlite3.connect(self.test_db_name) # Write from another connection, as another process would
+        conn.execute("UPDATE Categories SET category_name = 'Renamed' WHERE category_name = 'Other Category'")
+        conn.commit()
+        conn.close()
+        self.assertEqual([row[1] for row in self.category.get_all_categories()], ['Renamed'])
+
 
 class TestExpense(unittest.TestCase):
 
@@ -69,6 +100,7 @@ class TestExpense(unittest.TestCase):
         cls.expense.create_table() # Expense.create_table
     @classmethod
     def tearDownClass(cls):
+        ConnectionManager.for_database(cls.test_db_name).close()
         if os.path.exists(cls.test_db_name):
             os.remove(cls.test_db_name)
             print(f"Deleted database: {cls.test_db_name}", end=' ')
@@ -78,6 +110,8 @@ class TestExpense(unittest.TestCase):
         cursor = conn.cursor()
         cursor.execute('DELETE FROM Categories')
         cursor.execute('DELETE FROM Expenses')
+        for table in rollup.ROLLUP_TABLES:
+            cursor.execute(f'DELETE FROM {table}')
         conn.commit()
         conn.close()
 
@@ -149,7 +183,7 @@ class TestExpense(unittest.TestCase):
         self.assertIsNotNone(expense_data)
         self.assertEqual(expense_data[1], category_id)
         self.assertEqual(expense_data[2], 100.0)
-        self.assertEqual(expense_data[3], "2024-07-24")
+        self.assertEqual(expense_data[3], dates.to_day("2024-07-24")) # Stored as a day number
         self.assertEqual(expense_data[4], "Test Expense")
     
     def test_get_expense(self): # Expense.get_expense
@@ -303,5 +337,219 @@ class TestExpense(unittest.TestCase):
         self.assertIsNotNone(is_deleted, "Expense data should be retrievable after soft delete")
         self.assertEqual(is_deleted[0], 1, "Expense should be marked as deleted (is_deleted = 1)")
 
+    def test_add_expenses_bulk(self): # Expense.add_expenses_bulk
+        category_id, _ = self.category.add_category('Test Category')
+        expense_objs = (
+            {"category_id": category_id, "amount": i, "date": f"2024-07-{i % 28 + 1:02d}", "description": f"Bulk {i}"}
+            for i in range(25)
+        )
+        result = self.expense.add_expenses_bulk(expense_objs, chunk_size=10)
+
+        self.assertEqual(result["rejected"], [])
+        self.assertEqual(len(result["inserted"]), 3) # 10 + 10 + 5 rows
+        inserted_ids = [i for first, last in result["inserted"] for i in range(first, last + 1)]
+        self.assertEqual(len(inserted_ids), 25)
+        self.assertEqual(len(self.expense.get_all_expenses()), 25)
+        self.assertEqual(self.expense.get_expense(inserted_ids[-1])[4], "Bulk 24")
+
+    def test_add_expenses_bulk_rejections(self): # Expense.add_expenses_bulk
+        category_id, _ = self.category.add_category('Test Category')
+        expense_objs = [
+            {"category_id": category_id, "amount": 10.0, "date": "2024-07-24", "description": "Valid"},
+            {"category_id": category_id + 100, "amount": 10.0, "date": "2024-07-24", "description": "Unknown category"},
+            {"category_id": category_id, "amount": "ten", "date": "2024-07-24", "description": "Bad amount"},
+            {"category_id": category_id, "amount": 10.0, "date": "24/07/2024", "description": "Bad date"},
+            {"category_id": category_id, "date": "2024-07-24", "description": "Missing amount"},
+            {"category_id": category_id, "amount": 20.0, "date": "2024-07-25", "description": "Valid"},
+        ]
+        result = self.expense.add_expenses_bulk(expense_objs, chunk_size=4)
+
+        self.assertEqual([index for index, _ in result["rejected"]], [1, 2, 3, 4])
+        self.assertIn("unknown category_id", result["rejected"][0][1])
+        self.assertIn("invalid date", result["rejected"][2][1])
+        self.assertIn("missing field", result["rejected"][3][1])
+        self.assertEqual(sum(last - first + 1 for first, last in result["inserted"]), 2)
+
+    def test_get_all_expenses_page(self): # Expense.get_all_expenses_page
+        category_id, _ = self.category.add_category('Test Category')
+        for day in (3, 1, 2, 1, 3):
+            self.expense.add_expenses({"category_id": category_id, "amount": day, "date": f"2024-07-0{day}", "description": "Page"})
+
+        pages, after = [], None
+        while True:
+            rows, after = self.expense.get_all_expenses_page(after, limit=2)
+            pages.append(rows)
+            if after is None:
+                break
+        self.assertEqual([len(rows) for rows in pages], [2, 2, 1])
+        keys = [(row[1], row[0]) for rows in pages for row in rows]
+        self.assertEqual(keys, sorted(keys))
+        self.assertEqual([row[0] for row in self.expense.get_all_expenses()], [key[1] for key in keys])
+
+    def test_iter_expenses(self): # Expense.iter_expenses_by_date / iter_expenses_by_category
+        category_id, _ = self.category.add_category('Test Category')
+        other_category_id, _ = self.category.add_category('Other Category')
+        for day in range(1, 8):
+            self.expense.add_expenses({"category_id": category_id if day % 2 else other_category_id,
+                                       "amount": day, "date": f"2024-07-0{day}", "description": "Iter"})
+
+        by_date = self.expense.iter_expenses_by_date({"From": "2024-07-02", "To": "2024-07-06"}, page_size=2)
+        self.assertNotIsInstance(by_date, list)
+        self.assertEqual([row[1] for row in by_date], [f"2024-07-0{day}" for day in range(2, 7)])
+        by_category = list(self.expense.iter_expenses_by_category(category_id, page_size=3))
+        self.assertEqual(by_category, self.expense.get_expenses_by_category(category_id))
+        self.assertEqual(len(by_category), 4)
+        self.assertEqual(list(self.expense.iter_all_expenses(page_size=3)), self.expense.get_all_expenses())
+    def test_rollups_follow_writes(self): # Expense.get_category_totals / get_daily_totals / get_monthly_totals
+        category_id, _ = self.category.add_category('Test Category')
+        other_category_id, _ = self.category.add_category('Other Category')
+        expense_id, _ = self.expense.add_expenses({"category_id": category_id, "amount": 50.0, "date": "2024-07-24", "description": "One"})
+        self.expense.add_expenses({"category_id": category_id, "amount": 25.0, "date": "2024-07-24", "description": "Two"})
+        self.expense.add_expenses_bulk([
+            {"category_id": category_id, "amount": 10.0, "date": "2024-08-01", "description": "Three"},
+            {"category_id": other_category_id, "amount": 5.0, "date": "2024-08-01", "description": "Four"},
+        ])
+        self.expense.soft_delete_expense(expense_id)
+        self.expense.soft_delete_expense(expense_id) # Deleting twice must not subtract twice
+
+        self.assertEqual(self.expense.get_category_totals(), [
+            (category_id, 'Test Category', 35.0, 2),
+            (other_category_id, 'Other Category', 5.0, 1),
+        ])
+        self.assertEqual(self.expense.get_daily_totals({"From": "2024-07-01", "To": "2024-07-31"}),
+                         [("2024-07-24", category_id, 'Test Category', 25.0, 1)])
+        self.assertEqual(self.expense.get_monthly_totals(category_id), [
+            ("2024-07", category_id, 'Test Category', 25.0, 1),
+            ("2024-08", category_id, 'Test Category', 10.0, 1),
+        ])
+        self.assertEqual(self.expense.verify_rollups(), [])
+
+    def test_rebuild_rollups(self): # Expense.rebuild_rollups / verify_rollups
+        category_id, _ = self.category.add_category('Test Category')
+        self.expense.add_expenses({"category_id": category_id, "amount": 50.0, "date": "2024-07-24", "description": "One"})
+        conn = sqlite3.connect(self.test_db_name) # Write that bypasses the Expense write path
+        conn.execute("INSERT INTO Expenses (category_id, amount, date) VALUES (?, 20.0, ?)", (category_id, dates.to_day('2024-07-25')))
+        conn.commit()
+        conn.close()
+
+        mismatches = self.expense.verify_rollups()
+        self.assertEqual({table for table, *_ in mismatches}, set(rollup.ROLLUP_TABLES))
+        self.assertTrue(self.expense.rebuild_rollups())
+        self.assertEqual(self.expense.verify_rollups(), [])
+        self.assertEqual(self.expense.get_category_totals(), [(category_id, 'Test Category', 70.0, 2)])
+    def test_bulk_insert_reports_stored_ids(self): # Expense.add_expenses_bulk
+        category_id, _ = self.category.add_category('Test Category') # Its first CategoryTotals row is an insert
+        result = self.expense.add_expenses_bulk([{"category_id": category_id, "amount": 1.0, "date": "2024-08-01", "description": f"Row {i}"} for i in range(3)])
+        first, last = result["inserted"][0]
+        self.assertEqual([row[0] for row in self.expense.get_expenses_by_category(category_id)], list(range(first, last + 1)))
+    def test_create_table_fills_new_rollups(self): # rollup.create_tables
+        category_id, _ = self.category.add_category('Test Category')
+        self.expense.add_expenses({"category_id": category_id, "amount": 50.0, "date": "2024-07-24", "description": "One"})
+        conn = sqlite3.connect(self.test_db_name) # Database from before the total tables existed
+        for table in rollup.ROLLUP_TABLES:
+            conn.execute(f'DROP TABLE {table}')
+        conn.commit()
+        conn.close()
+
+        self.expense.create_table()
+        self.assertEqual(self.expense.get_category_totals(), [(category_id, 'Test Category', 50.0, 1)])
+        self.assertEqual(self.expense.verify_rollups(), [])
+
+    def test_soft_delete_and_restore_expenses(self): # Expense.soft_delete_expenses / restore_expenses
+        category_id, _ = self.category.add_category('Test Category')
+        other_category_id, _ = self.category.add_category('Other Category')
+        self.expense.add_expenses_bulk([
+            {"category_id": category_id, "amount": 10.0, "date": f"2024-07-{day:02d}", "description": f"Bad import {day}"} for day in range(1, 21)
+        ] + [
+            {"category_id": other_category_id, "amount": 5.0, "date": "2024-07-05", "description": "Bad import 100%"},
+            {"category_id": category_id, "amount": 7.0, "date": "2024-08-01", "description": "Kept"},
+        ])
+        ids = [row[0] for row in self.expense.get_all_expenses()]
+
+        self.assertEqual(self.expense.soft_delete_expenses(from_to={"From": "2024-07-01", "To": "2024-07-10"}, category_id=category_id), 10)
+        self.assertEqual(self.expense.soft_delete_expenses(description='import 100%'), 1)
+        self.assertEqual(self.expense.soft_delete_expenses(description='IMPORT'), 10)
+        self.assertEqual(self.expense.soft_delete_expenses(description='import'), 0) # Already deleted
+        self.assertEqual(self.expense.get_category_totals(), [(category_id, 'Test Category', 7.0, 1)])
+        self.assertEqual(self.expense.search_expenses('import')[0], [])
+
+        self.assertEqual(self.expense.restore_expenses(expense_ids=ids[:3]), 3)
+        self.assertEqual(self.expense.restore_expenses(category_id=other_category_id), 1)
+        self.assertEqual(len(self.expense.search_expenses('import')[0]), 4)
+        self.assertEqual(self.expense.get_category_totals(), [(category_id, 'Test Category', 37.0, 4), (other_category_id, 'Other Category', 5.0, 1)])
+        self.assertEqual(self.expense.verify_rollups(), [])
+        self.assertIsNone(self.expense.soft_delete_expenses()) # Nothing selected is an error, not "everything"
+
+    def test_soft_delete_categories_cascade(self): # Category.soft_delete_categories / restore_categories
+        category_id, _ = self.category.add_category('Test Category')
+        other_category_id, _ = self.category.add_category('Other Category')
+        kept_id, _ = self.category.add_category('Kept Category')
+        self.expense.add_expenses_bulk([
+            {"category_id": category_id, "amount": 10.0, "date": "2024-07-01", "description": "One"},
+            {"category_id": other_category_id, "amount": 5.0, "date": "2024-07-02", "description": "Two"},
+            {"category_id": kept_id, "amount": 1.0, "date": "2024-07-03", "description": "Three"},
+        ])
+        self.assertEqual(self.category.get_category_id_map(), {'Test Category': category_id, 'Other Category': other_category_id, 'Kept Category': kept_id})
+
+        self.assertEqual(self.category.soft_delete_categories([category_id, other_category_id], cascade=True), (2, 2))
+        self.assertEqual(self.category.get_category_id_map(), {'Kept Category': kept_id}) # Cache invalidated
+        self.assertEqual([row[2] for row in self.expense.get_all_expenses()], [kept_id])
+        self.assertEqual(self.expense.get_category_totals(), [(kept_id, 'Kept Category', 1.0, 1)])
+
+        self.assertEqual(self.category.restore_categories([category_id]), (1, 0))
+        self.assertEqual(self.expense.get_category_totals(), [(kept_id, 'Kept Category', 1.0, 1)])
+        self.assertEqual(self.category.restore_categories([other_category_id], cascade=True), (1, 1))
+        self.assertEqual(len(self.category.get_category_id_map()), 3)
+        self.assertEqual(self.expense.verify_rollups(), [])
+
+    def test_dates_are_checked(self): # Expense.add_expenses / dates.CHECK
+        category_id, _ = self.category.add_category('Test Category')
+        for bad in ("2024-007-24", "24/07/2024", "2024-02-30", None):
+            self.assertIsNone(self.expense.add_expenses({"category_id": category_id, "amount": 1.0, "date": bad, "description": "Bad"}))
+        conn = sqlite3.connect(self.test_db_name)
+        try:
+            for bad in ("2024-07-24", 19928.5, 99999999):
+                with self.assertRaises(sqlite3.IntegrityError):
+                    conn.execute("INSERT INTO Expenses (category_id, amount, date) VALUES (?, 1.0, ?)", (category_id, bad))
+        finally:
+            conn.close()
+        self.assertEqual(self.expense.get_all_expenses(), [])
+
+class TestConnectionManager(unittest.TestCase):
+
+    def setUp(self):
+        self.test_db_name = 'test_connection_db.db'
+        self.db = ConnectionManager.for_database(self.test_db_name)
+
+    def tearDown(self):
+        self.db.close()
+        if os.path.exists(self.test_db_name):
+            os.remove(self.test_db_name)
+
+    def test_shared_between_expense_and_category(self): # ConnectionManager.for_database
+        category = Category(self.test_db_name)
+        expense = Expense(self.test_db_name)
+        self.assertIs(category.db, expense.db)
+        self.assertIs(category.db.connection(), expense.db.connection())
+
+    def test_connection_per_thread(self): # ConnectionManager.connection
+        connections = []
+        thread = threading.Thread(target=lambda: connections.append(self.db.connection()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(connections[0], self.db.connection())
+        self.assertIs(self.db.connection(), self.db.connection())
+
+    def test_transaction_rollback(self): # ConnectionManager.transaction
+        category = Category(self.test_db_name)
+        category.create_table()
+        with self.assertRaises(RuntimeError):
+            with self.db.transaction() as conn:
+                conn.execute("INSERT INTO Categories (category_name) VALUES ('Rolled back')")
+                with self.db.transaction() as inner:
+                    inner.execute("INSERT INTO Categories (category_name) VALUES ('Inner')")
+                raise RuntimeError('abort')
+        self.assertIsNone(category.get_all_categories())
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
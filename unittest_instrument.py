@@ -0,0 +1,97 @@
+import unittest
+import glob
+import json
+import os
+import sqlite3
+from category import Category
+from expense import Expense
+from connection import ConnectionManager
+import instrument
+
+
+class TestInstrument(unittest.TestCase):
+
+    def setUp(self):
+        self.test_db_name = 'test_instrument_db.db'
+        self.slow_log = 'test_instrument_db.slow.jsonl'
+        instrument.REGISTRY.reset()
+        instrument.enable(slow_ms=None)
+        self.category = Category(self.test_db_name)
+        self.expense = Expense(self.test_db_name)
+        self.category.create_table()
+        self.expense.create_table()
+        self.food_id, _ = self.category.add_category('Food')
+        for day in ('2024-01-01', '2024-01-02', '2024-01-03'):
+            self.expense.add_expenses({"category_id": self.food_id, "amount": 10.0, "date": day, "description": "Lunch"})
+
+    def tearDown(self):
+        instrument.disable()
+        instrument.REGISTRY.reset()
+        ConnectionManager.for_database(self.test_db_name).close()
+        for path in glob.glob('test_instrument_db.*'):
+            os.remove(path)
+
+    def histogram(self, fragment):
+        matches = [histogram for key, histogram in instrument.REGISTRY.statements.items() if fragment in key]
+        self.assertEqual(len(matches), 1, fragment)
+        return matches[0]
+
+    def test_statement_key(self): # instrument.statement_key
+        self.assertEqual(instrument.statement_key('''
+            SELECT *   FROM Expenses
+            WHERE expense_id IN (?, ?,?)
+        '''), 'SELECT * FROM Expenses WHERE expense_id IN (?, ...)')
+
+    def test_records_statements(self): # InstrumentedCursor
+        self.assertIsInstance(self.expense.db.connection(), instrument.InstrumentedConnection)
+        instrument.REGISTRY.reset()
+        self.assertEqual(len(self.expense.get_all_expenses()), 3)
+        self.assertEqual(len(self.expense.get_all_expenses()), 3)
+        histogram = self.histogram('FROM Expenses E')
+        self.assertEqual(histogram.count, 2)
+        self.assertEqual(histogram.rows, 6)
+        self.assertEqual(histogram.errors, 0)
+        self.assertGreater(histogram.total_ms, 0)
+        self.assertEqual(sum(histogram.counts), 2)
+        self.assertIn('tuple[1]', histogram.param_shapes)
+        self.assertLessEqual(histogram.percentile(50), histogram.max_ms)
+
+    def test_rows_of_iterated_cursor(self): # InstrumentedCursor.__next__
+        instrument.REGISTRY.reset()
+        self.assertEqual(sum(1 for _ in self.expense.iter_all_expenses(page_size=2)), 3)
+        self.assertEqual(sum(histogram.rows for key, histogram in instrument.REGISTRY.statements.items() if 'FROM Expenses E' in key), 3)
+
+    def test_errors(self): # InstrumentedCursor._timed
+        conn = self.expense.db.connection()
+        with self.assertRaises(sqlite3.Error):
+            conn.execute('SELECT * FROM Missing')
+        self.assertEqual(self.histogram('FROM Missing').errors, 1)
+
+    def test_connection_opens(self): # Registry.record_connect
+        ConnectionManager.for_database(self.test_db_name).close()
+        instrument.REGISTRY.reset()
+        self.category.get_all_categories()
+        self.assertEqual(instrument.REGISTRY.connects.count, 1)
+        self.assertGreater(instrument.REGISTRY.connects.total_ms, 0)
+
+    def test_slow_query_log(self): # Registry._log_slow
+        instrument.enable(slow_ms=0, log_file=self.slow_log)
+        self.expense.get_expenses_by_category(self.food_id)
+        entries = [entry for entry in instrument.REGISTRY.slow_queries if 'FROM Expenses E' in entry['sql']]
+        self.assertEqual(len(entries), 1)
+        self.assertTrue(any('idx_expenses_category_date' in detail for detail in entries[0]['plan']))
+        with open(self.slow_log, encoding='utf-8') as file:
+            logged = [json.loads(line) for line in file]
+        self.assertIn(entries[0], logged)
+        self.assertIn('slow queries', instrument.REGISTRY.dump())
+
+    def test_disabled(self): # instrument.disable
+        instrument.disable()
+        ConnectionManager.for_database(self.test_db_name).close()
+        instrument.REGISTRY.reset()
+        self.assertEqual(len(self.expense.get_all_expenses()), 3)
+        self.assertEqual(instrument.REGISTRY.statements, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+import unittest
+import glob
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+from category import Category
+from expense import Expense
+from connection import ConnectionManager
+import partition
+
+# Runs in a child process that ends with a crash (os._exit skips atexit) or a normal exit
+CHILD = '''
+import os, sys
+from connection import ConnectionManager
+from expense import Expense
+db = ConnectionManager.for_database({db!r})
+memory = db.load_into_memory('write-back')
+expense = Expense({db!r})
+expense.add_expenses({{"category_id": {category_id}, "amount": 1.0, "date": '2024-01-01', "description": 'Flushed'}})
+db.flush()
+expense.add_expenses({{"category_id": {category_id}, "amount": 2.0, "date": '2024-01-02', "description": 'Not flushed'}})
+{ending}
+'''
+
+
+class TestMemory(unittest.TestCase):
+
+    def setUp(self):
+        self.test_db_name = 'test_memory_db.db'
+        self.db = ConnectionManager.for_database(self.test_db_name)
+        self.category = Category(self.test_db_name)
+        self.expense = Expense(self.test_db_name)
+        self.category.create_table()
+        self.expense.create_table()
+        self.food_id, _ = self.category.add_category('Food')
+        self.expense.add_expenses({"category_id": self.food_id, "amount": 10.0, "date": '2024-01-01', "description": 'On disk'})
+
+    def tearDown(self):
+        self.db.close()
+        for path in glob.glob('test_memory_db.*'):
+            os.remove(path)
+
+    def on_disk(self): # Descriptions in the file, read past the manager
+        conn = sqlite3.connect(self.test_db_name)
+        try:
+            return [row[0] for row in conn.execute('SELECT description FROM Expenses ORDER BY expense_id')]
+        finally:
+            conn.close()
+
+    def run_child(self, ending):
+        self.db.close()
+        script = CHILD.format(db=self.test_db_name, category_id=self.food_id, ending=ending)
+        return subprocess.run([sys.executable, '-c', script], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+
+    def test_reads_from_memory(self): # ConnectionManager.load_into_memory
+        self.db.load_into_memory('write-through')
+        file = sqlite3.connect(self.test_db_name)
+        file.execute("UPDATE Expenses SET description = 'Changed on disk'")
+        file.commit()
+        file.close()
+        self.assertEqual(self.expense.get_all_expenses()[0][4], 'On disk')
+
+    def test_invalid_mode(self): # ConnectionManager.load_into_memory
+        with self.assertRaises(ValueError):
+            self.db.load_into_memory('write-around')
+        self.assertFalse(self.db.load_into_memory().write_through) # write-through copies the whole file on every commit
+        with self.assertRaises(ValueError):
+            self.db.load_into_memory()
+
+    def test_write_through(self): # MemoryCopy.flush
+        memory = self.db.load_into_memory('write-through')
+        self.expense.add_expenses({"category_id": self.food_id, "amount": 5.0, "date": '2024-01-02', "description": 'Lunch'})
+        self.assertEqual(self.on_disk(), ['On disk', 'Lunch'])
+        self.expense.get_all_expenses() # Reads do not flush
+        self.assertEqual(memory.flushes, 1)
+
+    def test_write_back(self): # ConnectionManager.flush
+        self.db.load_into_memory('write-back')
+        self.expense.add_expenses({"category_id": self.food_id, "amount": 5.0, "date": '2024-01-02', "description": 'Lunch'})
+        self.assertEqual(self.on_disk(), ['On disk'])
+        self.assertTrue(self.db.flush())
+        self.assertEqual(self.on_disk(), ['On disk', 'Lunch'])
+        self.assertFalse(self.db.flush())
+
+    def test_close_flushes(self): # ConnectionManager.close
+        self.db.load_into_memory('write-back')
+        self.expense.add_expenses({"category_id": self.food_id, "amount": 5.0, "date": '2024-01-02', "description": 'Lunch'})
+        self.db.close()
+        self.assertEqual(self.on_disk(), ['On disk', 'Lunch'])
+        self.expense.add_expenses({"category_id": self.food_id, "amount": 6.0, "date": '2024-01-03', "description": 'Dinner'}) # Back on the file
+        self.assertEqual(self.on_disk(), ['On disk', 'Lunch', 'Dinner'])
+
+    def test_periodic_flush(self): # MemoryCopy._run
+        memory = self.db.load_into_memory('write-back', flush_interval=0.01)
+        self.expense.add_expenses({"category_id": self.food_id, "amount": 5.0, "date": '2024-01-02', "description": 'Lunch'})
+        for _ in range(500):
+            if memory.flushes:
+                break
+            threading.Event().wait(0.01)
+        self.assertEqual(self.on_disk(), ['On disk', 'Lunch'])
+
+    def test_refuses_to_overwrite(self): # MemoryCopy.flush
+        self.db.load_into_memory('write-back')
+        self.expense.add_expenses({"category_id": self.food_id, "amount": 5.0, "date": '2024-01-02', "description": 'Lunch'})
+        file = sqlite3.connect(self.test_db_name)
+        file.execute("UPDATE Expenses SET description = 'Changed on disk'")
+        file.commit()
+        file.close()
+        with self.assertRaises(sqlite3.OperationalError):
+            self.db.flush()
+        with self.assertRaises(sqlite3.OperationalError):
+            self.db.close()
+        self.assertEqual(self.on_disk(), ['Changed on disk'])
+
+    def test_crash_loses_only_unflushed_writes(self): # MemoryCopy
+        result = self.run_child('os._exit(1)')
+        self.assertEqual(result.returncode, 1, result.stderr)
+        self.assertEqual(self.on_disk(), ['On disk', 'Flushed'])
+        self.assertEqual(sqlite3.connect(self.test_db_name).execute('PRAGMA integrity_check').fetchone()[0], 'ok')
+
+    def test_exit_flushes(self): # MemoryCopy, atexit
+        result = self.run_child('sys.exit(0)')
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(self.on_disk(), ['On disk', 'Flushed', 'Not flushed'])
+
+    def test_crash_during_flush(self): # MemoryCopy.flush
+        # A copy that dies half way, page by page so there is a half way: the file stays at the last flush
+        result = self.run_child("memory._keeper.backup(memory._disk, pages=1, progress=lambda status, remaining, total: os._exit(1))")
+        self.assertEqual(result.returncode, 1, result.stderr)
+        self.assertEqual(self.on_disk(), ['On disk', 'Flushed'])
+        self.assertEqual(sqlite3.connect(self.test_db_name).execute('PRAGMA integrity_check').fetchone()[0], 'ok')
+
+    def test_concurrent_writers(self): # MemoryCopy
+        self.db.load_into_memory('write-through')
+        errors = []
+        def add(n):
+            for i in range(10):
+                if self.expense.add_expenses({"category_id": self.food_id, "amount": float(i), "date": '2024-01-02', "description": f'Thread {n}'}) is None:
+                    errors.append(n)
+        threads = [threading.Thread(target=add, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(self.on_disk()), 41)
+
+    def test_partitions_next_to_file(self): # partition.close_period
+        self.db.load_into_memory('write-through')
+        self.assertEqual(partition.close_period(self.db, '2024-01', [], today='2024-02-01'), 1)
+        self.assertTrue(os.path.exists('test_memory_db.2024-01.db'))
+        self.assertEqual(self.expense.get_expenses_by_date({"From": "2024-01-01", "To": "2024-01-31"})[0][3], 'On disk')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import unittest
+import glob
+import os
+import sqlite3
+from category import Category
+from expense import Expense
+from connection import ConnectionManager
+import partition
+import dates
+
+
+class TestPartition(unittest.TestCase):
+
+    def setUp(self):
+        self.test_db_name = 'test_partition_db.db'
+        self.category = Category(self.test_db_name)
+        self.expense = Expense(self.test_db_name)
+        self.category.create_table()
+        self.expense.create_table()
+        self.category_id, _ = self.category.add_category('Test Category')
+        for day in ('2022-06-01', '2023-01-15', '2023-12-31', '2024-02-10', '2024-03-05'):
+            self.expense.add_expenses({"category_id": self.category_id, "amount": 10.0, "date": day, "description": day})
+
+    def tearDown(self):
+        ConnectionManager.for_database(self.test_db_name).close()
+        for path in glob.glob('test_partition_db.*'):
+            os.remove(path)
+
+    def test_period_bounds(self): # partition.period_bounds
+        self.assertEqual(partition.period_bounds('2023'), ('2023-01-01', '2023-12-31'))
+        self.assertEqual(partition.period_bounds('2024-02'), ('2024-02-01', '2024-02-29'))
+        for period in ('23', '2023-13', '2023-1', '2023-01-01'):
+            with self.assertRaises(ValueError):
+                partition.period_bounds(period)
+
+    def test_close_partition(self): # Expense.close_partition
+        self.assertEqual(self.expense.close_partition('2023', today='2024-07-01'), 2)
+        self.assertTrue(os.path.exists('test_partition_db.2023.db'))
+        hot = self.expense.db.connection().execute('SELECT date FROM main.Expenses ORDER BY date').fetchall()
+        self.assertEqual([dates.to_text(row[0]) for row in hot], ['2022-06-01', '2024-02-10', '2024-03-05'])
+        self.assertEqual([row[0] for row in self.expense.get_partitions()], ['2023'])
+        self.assertEqual(len(self.expense.get_all_expenses()), 5)
+        self.assertEqual(len(list(self.expense.iter_all_expenses(page_size=2))), 5)
+        self.assertEqual(self.expense.verify_rollups(), [])
+        self.assertTrue(self.expense.rebuild_rollups())
+        self.assertEqual(self.expense.verify_rollups(), [])
+
+    def test_close_partition_rejects(self): # Expense.close_partition
+        self.assertIsNone(self.expense.close_partition('2024-07', today='2024-07-20'))
+        self.assertEqual(self.expense.close_partition('2023-12', today='2024-07-01'), 1)
+        self.assertIsNone(self.expense.close_partition('2023', today='2024-07-01'))
+
+    def test_date_range_prunes_partitions(self): # Expense.get_expenses_by_date
+        self.expense.close_partition('2022', today='2024-07-01')
+        self.expense.close_partition('2023', today='2024-07-01')
+        statements = []
+        conn = self.expense.db.connection()
+        conn.set_trace_callback(statements.append)
+        try:
+            rows = self.expense.get_expenses_by_date({"From": "2023-06-01", "To": "2024-02-28"})
+            page, _ = self.expense.get_expenses_by_date_page({"From": "2023-06-01", "To": "2024-02-28"})
+        finally:
+            conn.set_trace_callback(None)
+        self.assertEqual([row[1] for row in rows], ['2023-12-31', '2024-02-10'])
+        self.assertEqual(page, rows)
+        selects = [sql for sql in statements if 'E.date BETWEEN' in sql]
+        self.assertTrue(selects)
+        for sql in selects:
+            self.assertIn('p_2023.Expenses', sql)
+            self.assertNotIn('p_2022.Expenses', sql)
+
+    def test_unpadded_dates_prune_like_padded(self): # dates.padded
+        self.expense.close_partition('2023', today='2024-07-01')
+        unpadded = {"From": "2023-1-1", "To": "2024-2-9"} # As the menu accepts them
+        rows = self.expense.get_expenses_by_date(unpadded)
+        self.assertEqual([row[1] for row in rows], ['2023-01-15', '2023-12-31'])
+        self.assertEqual(self.expense.get_expenses_by_date_page(unpadded)[0], rows)
+        self.assertEqual(self.expense.get_all_expenses_page(after=('2023-1-1', 0))[0][0][1], '2023-01-15')
+        self.assertEqual(len(self.expense.get_daily_totals({"From": "2023-1-15", "To": "2023-1-15"})), 1)
+
+    def test_partitions_are_read_only(self): # partition.attach
+        self.expense.close_partition('2023', today='2024-07-01')
+        conn = self.expense.db.connection()
+        self.expense.get_all_expenses()
+        with self.assertRaises(sqlite3.OperationalError):
+            conn.execute("UPDATE p_2023.Expenses SET amount = 0")
+        self.assertEqual(conn.execute(f'SELECT COUNT(*) FROM {partition.VIEW_NAME}').fetchone()[0], 5)
+        in_partition = conn.execute('SELECT expense_id FROM p_2023.Expenses').fetchone()[0]
+        self.assertIsNone(self.expense.soft_delete_expense(in_partition)) # Nothing changed, so no success to report
+        self.assertIsNotNone(self.expense.get_expense(in_partition))
+
+    def test_close_partition_archives_deleted(self): # partition.close_period
+        deleted_id = self.expense.get_expenses_by_date({"From": "2023-01-15", "To": "2023-01-15"})[0][0]
+        self.assertEqual(self.expense.soft_delete_expense(deleted_id), deleted_id)
+        self.assertEqual(self.expense.close_partition('2023', today='2024-07-01'), 1)
+        archive = sqlite3.connect('test_partition_db.archive.db')
+        try: # Kept with the rows compaction moves there, rather than dropped
+            self.assertEqual(archive.execute('SELECT expense_id, is_deleted FROM Expenses').fetchall(), [(deleted_id, 1)])
+        finally:
+            archive.close()
+
+    def test_columns_added_after_closing(self): # partition.source
+        self.expense.close_partition('2023', today='2024-07-01')
+        ConnectionManager.for_database(self.test_db_name).close()
+        conn = sqlite3.connect(self.test_db_name) # A later version adds a column the partition file does not have
+        conn.execute("ALTER TABLE Expenses ADD COLUMN note TEXT")
+        conn.commit()
+        conn.close()
+        self.assertEqual(len(self.expense.get_all_expenses()), 5)
+        self.assertEqual(self.expense.verify_rollups(), [])
+        notes = self.expense.db.connection().execute(f'SELECT note FROM {partition.VIEW_NAME}').fetchall()
+        self.assertEqual(notes, [(None,)] * 5)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
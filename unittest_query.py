@@ -0,0 +1,85 @@
+import unittest
+import glob
+import os
+from category import Category
+from expense import Expense
+from connection import ConnectionManager
+import query
+
+
+class TestExpenseQuery(unittest.TestCase):
+
+    def setUp(self):
+        self.test_db_name = 'test_query_db.db'
+        self.category = Category(self.test_db_name)
+        self.expense = Expense(self.test_db_name)
+        self.category.create_table()
+        self.expense.create_table()
+        self.food_id, _ = self.category.add_category('Food')
+        self.travel_id, _ = self.category.add_category('Travel')
+        self.expense.add_expenses_bulk([
+            {"category_id": self.food_id, "amount": 50.0, "date": "2024-01-05", "description": "Coffee beans"},
+            {"category_id": self.food_id, "amount": 120.0, "date": "2024-01-20", "description": "Dinner"},
+            {"category_id": self.food_id, "amount": 300.0, "date": "2024-02-03", "description": "Coffee machine 100%"},
+            {"category_id": self.travel_id, "amount": 80.0, "date": "2024-01-10", "description": "Taxi"},
+            {"category_id": self.travel_id, "amount": 900.0, "date": "2024-02-14", "description": "Train"},
+        ])
+        self.deleted_id, _ = self.expense.add_expenses({"category_id": self.food_id, "amount": 75.0, "date": "2024-01-15", "description": "Lunch"})
+        self.expense.soft_delete_expense(self.deleted_id)
+
+    def tearDown(self):
+        ConnectionManager.for_database(self.test_db_name).close()
+        for path in glob.glob('test_query_db.*'):
+            os.remove(path)
+
+    def test_combined_filters(self): # ExpenseQuery.filter
+        rows = self.expense.query().filter(category_id=self.food_id, from_to={"From": "2024-01-01", "To": "2024-01-31"}, min_amount=60).all()
+        self.assertEqual([(row[1], row[3], row[5]) for row in rows], [("2024-01-20", 'Food', 120.0)])
+        self.assertEqual(len(self.expense.query().filter(max_amount=100, category_id=None).all()), 2)
+        self.assertEqual([row[4] for row in self.expense.query().filter(description='100%').all()], ["Coffee machine 100%"])
+        self.assertEqual([row[4] for row in self.expense.query().filter(search='coffee', category_ids=[self.food_id]).all()],
+                         ["Coffee beans", "Coffee machine 100%"])
+        self.assertEqual(self.expense.query().filter(expense_ids=[self.deleted_id]).all(), [])
+
+    def test_projection_order_and_paging(self): # ExpenseQuery.select / order_by / limit
+        by_amount = self.expense.query().select("amount", "description").order_by("-amount")
+        self.assertEqual(by_amount.limit(2).all(), [(900.0, "Train"), (300.0, "Coffee machine 100%")])
+        self.assertEqual(by_amount.limit(2, offset=2).all(), [(120.0, "Dinner"), (80.0, "Taxi")])
+        self.assertEqual(by_amount.first(), (900.0, "Train"))
+        self.assertEqual(len(by_amount.all()), 5) # The limited queries did not change by_amount
+        sql, _ = by_amount.sql(self.expense.db.connection())
+        self.assertNotIn('JOIN Categories', sql) # No category column, no join
+
+    def test_aggregate(self): # ExpenseQuery.aggregate
+        self.assertEqual(self.expense.query().aggregate("total", "count", by=("month", "category_name")).all(), [
+            ("2024-01", 'Food', 170.0, 2),
+            ("2024-01", 'Travel', 80.0, 1),
+            ("2024-02", 'Food', 300.0, 1),
+            ("2024-02", 'Travel', 900.0, 1),
+        ])
+        self.assertEqual(self.expense.query().filter(category_id=self.travel_id).aggregate("average", "max").all(), [(490.0, 900.0)])
+        by_total = self.expense.query().aggregate("total", by=("category_id",)).order_by("-total").all()
+        self.assertEqual(by_total, [(self.travel_id, 980.0), (self.food_id, 470.0)])
+
+    def test_statement_cache(self): # query.compile_sql
+        query.compile_sql.cache_clear()
+        conn = self.expense.db.connection()
+        first, params = self.expense.query().filter(category_id=self.food_id, min_amount=10).sql(conn)
+        second, other_params = self.expense.query().filter(min_amount=99, category_id=self.travel_id).sql(conn)
+        self.assertEqual(first, second)
+        self.assertNotEqual(params, other_params)
+        self.assertEqual(query.compile_sql.cache_info().hits, 1)
+
+    def test_rejects_unknown_names(self): # ExpenseQuery._check
+        with self.assertRaises(ValueError):
+            self.expense.query().filter(colour='red')
+        with self.assertRaises(ValueError):
+            self.expense.query().select("amount; DROP TABLE Expenses")
+        with self.assertRaises(ValueError):
+            self.expense.query().aggregate("median")
+        with self.assertRaises(ValueError):
+            self.expense.query().filter(search=' ').all()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+import sqlite3
+import os
+import re
+from category import Category
+from expense import Expense, EXPENSE_INDEXES
+from connection import ConnectionManager
+
+FULL_SCAN = re.compile(r'^SCAN E( |$)(?!.*USING (COVERING )?INDEX)')
+
+
+class TestQueryPlan(unittest.TestCase):
+
+    def setUp(self):
+        self.test_db_name = 'test_query_plan_db.db'
+        self.category = Category(self.test_db_name)
+        self.expense = Expense(self.test_db_name)
+        self.category.create_table()
+        self.expense.create_table()
+        self.category_id, _ = self.category.add_category('Test Category')
+        self.expense.add_expenses({"category_id": self.category_id, "amount": 10.0, "date": "2024-07-24", "description": "Plan"})
+
+    def tearDown(self):
+        ConnectionManager.for_database(self.test_db_name).close()
+        if os.path.exists(self.test_db_name):
+            os.remove(self.test_db_name)
+
+    def query_plans(self, read_path, *args): # EXPLAIN QUERY PLAN of every SELECT the read path runs
+        statements = []
+        conn = self.expense.db.connection()
+        conn.set_trace_callback(statements.append)
+        try:
+            result = read_path(*args)
+            if hasattr(result, '__next__'):
+                list(result)
+        finally:
+            conn.set_trace_callback(None)
+        selects = [sql for sql in statements if sql.lstrip().upper().startswith('SELECT') and 'FROM Expenses' in sql]
+        self.assertTrue(selects, f"{read_path.__name__} ran no query on Expenses")
+        return [[row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}')] for sql in selects]
+
+    def assertUsesIndex(self, index_name, read_path, *args):
+        for plan in self.query_plans(read_path, *args):
+            self.assertTrue(any(index_name in detail for detail in plan), f"{read_path.__name__} does not use {index_name}: {plan}")
+            for detail in plan:
+                self.assertIsNone(FULL_SCAN.match(detail), f"{read_path.__name__} scans Expenses: {plan}")
+                self.assertNotIn('TEMP B-TREE FOR ORDER BY', detail, f"{read_path.__name__} sorts in a temp b-tree: {plan}")
+
+    def test_get_all_expenses_plan(self): # Expense.get_all_expenses
+        self.assertUsesIndex('idx_expenses_date', self.expense.get_all_expenses)
+
+    def test_iter_all_expenses_plan(self): # Expense.iter_all_expenses
+        self.assertUsesIndex('idx_expenses_date', self.expense.iter_all_expenses)
+
+    def test_get_expenses_by_date_plan(self): # Expense.get_expenses_by_date
+        self.assertUsesIndex('idx_expenses_date', self.expense.get_expenses_by_date, {"From": "2024-07-01", "To": "2024-07-31"})
+
+    def test_get_expenses_by_category_plan(self): # Expense.get_expenses_by_category
+        self.assertUsesIndex('idx_expenses_category_date', self.expense.get_expenses_by_category, self.category_id)
+
+    def test_get_all_expenses_page_plan(self): # Expense.get_all_expenses_page
+        self.assertUsesIndex('idx_expenses_date', self.expense.get_all_expenses_page, ("2024-07-01", 1))
+
+    def test_get_expenses_by_date_page_plan(self): # Expense.get_expenses_by_date_page
+        self.assertUsesIndex('idx_expenses_date', self.expense.get_expenses_by_date_page,
+                             {"From": "2024-07-01", "To": "2024-07-31"}, ("2024-07-01", 1))
+
+    def test_get_expenses_by_category_page_plan(self): # Expense.get_expenses_by_category_page
+        self.assertUsesIndex('idx_expenses_category_date', self.expense.get_expenses_by_category_page,
+                             self.category_id, ("2024-07-01", 1))
+
+    def test_create_table_migrates_existing_database(self): # Expense.create_indexes
+        ConnectionManager.for_database(self.test_db_name).close()
+        os.remove(self.test_db_name)
+        conn = sqlite3.connect(self.test_db_name) # Database file from before the indexes existed
+        conn.execute('''
+            CREATE TABLE Expenses (
+                expense_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                category_id INTEGER,
+                amount REAL NOT NULL,
+                date TEXT NOT NULL,
+                description TEXT,
+                is_deleted INTEGER DEFAULT 0
+            )
+        ''')
+        conn.execute('CREATE INDEX idx_expenses_date ON Expenses (date)') # Outdated definition
+        conn.commit()
+        conn.close()
+
+        self.expense.create_table()
+        indexes = dict(self.expense.db.connection().execute('''
+            SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'Expenses'
+        ''').fetchall())
+        self.assertEqual(set(indexes), set(EXPENSE_INDEXES))
+        self.assertIn('WHERE is_deleted = 0', indexes['idx_expenses_date'])
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
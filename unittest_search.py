@@ -0,0 +1,78 @@
+import unittest
+import glob
+import os
+from category import Category
+from expense import Expense
+from connection import ConnectionManager
+import search
+
+
+class TestSearch(unittest.TestCase):
+
+    def setUp(self):
+        self.test_db_name = 'test_search_db.db'
+        self.category = Category(self.test_db_name)
+        self.expense = Expense(self.test_db_name)
+        self.category.create_table()
+        self.expense.create_table()
+        self.food_id, _ = self.category.add_category('Food')
+        self.travel_id, _ = self.category.add_category('Travel')
+        self.coffee_id = self.add(self.food_id, '2023-05-01', 'Coffee')
+        self.add(self.food_id, '2024-01-10', 'coffee beans and milk')
+        self.add(self.travel_id, '2024-02-01', 'Train to the coffee farm')
+        self.add(self.travel_id, '2024-02-02', 'Taxi')
+
+    def tearDown(self):
+        ConnectionManager.for_database(self.test_db_name).close()
+        for path in glob.glob('test_search_db.*'):
+            os.remove(path)
+
+    def add(self, category_id, date, description):
+        expense_id, _ = self.expense.add_expenses({"category_id": category_id, "amount": 10.0, "date": date, "description": description})
+        return expense_id
+
+    def descriptions(self, rows):
+        return [row[4] for row in rows]
+
+    def test_match_expression(self): # search.match_expression
+        self.assertEqual(search.match_expression('coffee shop'), '"coffee" "shop"')
+        self.assertEqual(search.match_expression('cof* "x'), '"cof"* """x"')
+        self.assertEqual(search.match_expression(' * '), '')
+
+    def test_search_expenses(self): # Expense.search_expenses
+        rows, after = self.expense.search_expenses('coffee')
+        self.assertEqual(self.descriptions(rows)[0], 'Coffee') # Shortest description ranks first
+        self.assertEqual(len(rows), 3)
+        self.assertIsNone(after)
+        self.assertEqual(self.descriptions(self.expense.search_expenses('coffee milk')[0]), ['coffee beans and milk'])
+        self.assertEqual(self.descriptions(self.expense.search_expenses('tax*')[0]), ['Taxi'])
+        self.assertEqual(self.expense.search_expenses(''), ([], None))
+
+    def test_search_filters_and_pages(self): # Expense.search_expenses
+        rows, _ = self.expense.search_expenses('coffee', from_to={"From": "2024-01-01", "To": "2024-12-31"}, category_id=self.travel_id)
+        self.assertEqual(self.descriptions(rows), ['Train to the coffee farm'])
+        first, after = self.expense.search_expenses('coffee', limit=2)
+        second, last = self.expense.search_expenses('coffee', after=after, limit=2)
+        self.assertEqual(after, 2)
+        self.assertIsNone(last)
+        self.assertEqual(len({row[0] for row in first + second}), 3)
+
+    def test_index_follows_writes(self): # search.index/unindex
+        self.expense.soft_delete_expense(self.coffee_id)
+        self.assertNotIn(self.coffee_id, [row[0] for row in self.expense.search_expenses('coffee')[0]])
+        self.expense.add_expenses_bulk([{"category_id": self.food_id, "amount": 1.0, "date": "2024-03-01", "description": "Bulk espresso"}])
+        self.assertEqual(self.descriptions(self.expense.search_expenses('espresso')[0]), ['Bulk espresso'])
+        new_id, _ = self.category.add_category('New') # Its first total row is an insert, not an update
+        result = self.expense.add_expenses_bulk([{"category_id": new_id, "amount": 1.0, "date": "2024-03-02", "description": f"Bulk latte {i}"} for i in range(3)])
+        first, last = result["inserted"][0]
+        self.assertEqual(sorted(row[0] for row in self.expense.search_expenses('latte')[0]), list(range(first, last + 1)))
+        self.assertEqual([row[4] for row in self.expense.get_expenses_by_category(new_id)], [f"Bulk latte {i}" for i in range(3)])
+        self.assertEqual([row[0] for row in self.expense.get_expenses_by_category(new_id)], list(range(first, last + 1)))
+        self.expense.close_partition('2023', today='2024-07-01')
+        conn = self.expense.db.connection()
+        search.rebuild(conn)
+        conn.commit()
+        self.assertEqual(len(self.expense.search_expenses('coffee')[0]), 2)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
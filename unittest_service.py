@@ -0,0 +1,59 @@
+import unittest
+import os
+import threading
+from unittest import mock
+import service
+from expense import Expense
+from connection import ConnectionManager
+
+
+class TestExpenseService(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.test_db_name = 'test_service_db.db'
+        self.service = service.ExpenseService(self.test_db_name, readers=2)
+        await self.service.categories.create_table()
+        await self.service.expenses.create_table()
+
+    async def asyncTearDown(self):
+        self.service.close()
+        ConnectionManager.for_database(self.test_db_name).close()
+        if os.path.exists(self.test_db_name):
+            os.remove(self.test_db_name)
+
+    async def test_async_methods(self): # ExpenseService.categories / expenses
+        categories, expenses = self.service.categories, self.service.expenses
+        category_id, _ = await categories.add_category('Test Category')
+        added = [await expenses.add_expenses({"category_id": category_id, "amount": float(day), "date": f"2024-07-{day:02d}", "description": "Async"})
+                 for day in range(1, 6)]
+        await expenses.soft_delete_expense(added[0][0])
+
+        self.assertEqual((await categories.get_category(category_id))[1], 'Test Category')
+        self.assertEqual(len(await expenses.get_all_expenses()), 4)
+        self.assertEqual(len(await expenses.get_expenses_by_date({"From": "2024-07-03", "To": "2024-07-31"})), 3)
+        self.assertEqual([row[0] async for row in expenses.iter_expenses_by_category(category_id, page_size=3)],
+                         [expense_id for expense_id, _ in added[1:]])
+        self.assertEqual(await expenses.get_category_totals(), [(category_id, 'Test Category', 14.0, 4)])
+
+    async def test_writes_on_single_writer_thread(self): # ExpenseService writer executor
+        threads = []
+        def add_expenses(expense_self, expense_obj):
+            threads.append(threading.current_thread().name)
+        with mock.patch.object(Expense, 'add_expenses', add_expenses):
+            writer_service = service.ExpenseService(self.test_db_name, readers=2)
+        try:
+            for _ in range(5):
+                await writer_service.expenses.add_expenses({})
+        finally:
+            writer_service.close()
+        self.assertEqual(len(set(threads)), 1)
+        self.assertTrue(threads[0].startswith('expense-writer'))
+
+    async def test_load_test(self): # service.load_test
+        result = await service.load_test(self.test_db_name, duration=0.3, concurrency=8)
+        self.assertGreater(result["requests"], 0)
+        self.assertGreater(result["requests_per_second"], 0)
+        self.assertLessEqual(result["p50_ms"], result["p99_ms"])
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,86 @@
+import unittest
+import os
+import shutil
+import sqlite3
+from category import Category
+from expense import Expense
+from connection import ConnectionManager
+from sharding import ShardRouter
+
+
+class TestShardRouter(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = 'test_shards'
+        self.router = ShardRouter.from_directory(self.test_dir, shards=3)
+
+    def tearDown(self):
+        ConnectionManager.close_all()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def add(self, tenant_id, category_name, *amounts):
+        category, expense = self.router.open(tenant_id)
+        category_id, _ = category.add_category(category_name)
+        for i, amount in enumerate(amounts):
+            expense.add_expenses({"category_id": category_id, "amount": amount, "date": f"2024-0{i + 1}-15", "description": tenant_id})
+        return category_id
+
+    def test_shard_for(self): # ShardRouter.shard_for
+        self.assertEqual(self.router.shard_for('alice'), ShardRouter.from_directory(self.test_dir, shards=3).shard_for('alice'))
+        self.assertIn(self.router.shard_for('bob'), self.router.shard_names)
+        tenants = [f'user{i}' for i in range(300)]
+        self.assertEqual(len({self.router.shard_for(tenant) for tenant in tenants}), 3)
+        pinned = ShardRouter(self.router.shard_names, placements={'alice': self.router.shard_names[0]})
+        self.assertEqual(pinned.shard_for('alice'), self.router.shard_names[0])
+
+    def test_tenants_are_isolated(self): # Category/Expense tenant_id
+        router = ShardRouter([os.path.join(self.test_dir, 'shared.db')])
+        self.router = router
+        alice_category = self.add('alice', 'Food', 10.0, 20.0)
+        self.add('bob', 'Food', 5.0)
+        alice, bob = router.expense('alice'), router.expense('bob')
+        self.assertEqual(len(alice.get_all_expenses()), 2)
+        self.assertEqual(len(bob.get_all_expenses()), 1)
+        self.assertEqual([row[2] for row in alice.get_category_totals()], [30.0])
+        self.assertIsNone(router.category('bob').get_category(alice_category))
+        expense_id = alice.get_all_expenses()[0][0]
+        bob.soft_delete_expense(expense_id)
+        self.assertIsNotNone(alice.get_expense(expense_id))
+        self.assertIsNone(bob.get_expense(expense_id))
+        self.assertIsNone(alice.add_expenses({"category_id": self.add('bob', 'Rent'), "amount": 999.0, "date": "2024-03-15", "description": "alice"}))
+        self.assertEqual([row[2] for row in bob.get_category_totals()], [5.0])
+        self.assertEqual(len(alice.get_all_expenses()), 2)
+
+    def test_aggregate(self): # ShardRouter.aggregate
+        self.add('alice', 'Food', 10.0, 20.0)
+        self.add('bob', 'Food', 5.0)
+        self.add('carol', 'Rent', 100.0)
+        for processes in (0, 2):
+            self.assertEqual(self.router.aggregate('tenant', processes), [('alice', 30.0, 2), ('bob', 5.0, 1), ('carol', 100.0, 1)])
+            self.assertEqual(self.router.aggregate('category', processes), [('Food', 35.0, 3), ('Rent', 100.0, 1)])
+            self.assertEqual(self.router.aggregate('month', processes), [('2024-01', 115.0, 3), ('2024-02', 20.0, 1)])
+        with self.assertRaises(ValueError):
+            self.router.aggregate('day')
+
+    def test_create_table_adds_tenant_column(self): # Expense.create_table on a database without tenants
+        db_name = os.path.join(self.test_dir, 'old.db')
+        conn = sqlite3.connect(db_name)
+        conn.execute('CREATE TABLE Categories (category_id INTEGER PRIMARY KEY AUTOINCREMENT, category_name TEXT NOT NULL, is_deleted INTEGER DEFAULT 0)')
+        conn.execute("INSERT INTO Categories (category_name) VALUES ('Food')")
+        conn.execute('''
+            CREATE TABLE Expenses (
+                expense_id INTEGER PRIMARY KEY AUTOINCREMENT, category_id INTEGER, amount REAL NOT NULL,
+                date TEXT NOT NULL, description TEXT, is_deleted INTEGER DEFAULT 0
+            )
+        ''')
+        conn.execute("INSERT INTO Expenses (category_id, amount, date, description) VALUES (1, 12.5, '2024-07-24', 'Old')")
+        conn.commit()
+        conn.close()
+        category, expense = Category(db_name), Expense(db_name)
+        category.create_table()
+        expense.create_table()
+        self.assertEqual(category.get_category_id_map(), {'Food': 1})
+        self.assertEqual([row[5] for row in expense.get_all_expenses()], [12.5])
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
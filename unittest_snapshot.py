@@ -0,0 +1,81 @@
+import unittest
+import os
+import numpy as np
+import analytics
+import snapshot
+from category import Category
+from expense import Expense
+from connection import ConnectionManager
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.test_db_name = 'test_snapshot_db.db'
+        self.category = Category(self.test_db_name)
+        self.expense = Expense(self.test_db_name)
+        self.category.create_table()
+        self.expense.create_table()
+        self.food_id, _ = self.category.add_category('Food')
+        self.travel_id, _ = self.category.add_category('Travel')
+        self.first_id = self.add(self.food_id, 10.0, '2024-07-01')
+        self.add(self.travel_id, 100.0, '2024-07-03')
+
+    def tearDown(self):
+        snapshot.remove(self.expense)
+        ConnectionManager.for_database(self.test_db_name).close()
+        if os.path.exists(self.test_db_name):
+            os.remove(self.test_db_name)
+
+    def add(self, category_id, amount, date):
+        expense_id, _ = self.expense.add_expenses({"category_id": category_id, "amount": amount, "date": date, "description": None})
+        return expense_id
+
+    def assertMatchesDatabase(self, columns):
+        expected = analytics.load_columns(self.expense, use_snapshot=False)
+        order = np.argsort(columns.expense_ids)
+        self.assertEqual(list(columns.expense_ids[order]), sorted(expected.expense_ids))
+        by_id = dict(zip(expected.expense_ids, expected.amounts))
+        self.assertEqual(list(columns.amounts[order]), [by_id[i] for i in sorted(by_id)])
+        names = columns.category_names[columns.category_codes]
+        expected_names = dict(zip(expected.expense_ids, expected.category_names[expected.category_codes]))
+        self.assertEqual(list(names[order]), [expected_names[i] for i in sorted(expected_names)])
+
+    def test_refresh_appends(self): # snapshot.refresh
+        self.assertEqual(snapshot.refresh(self.expense), {"appended": 2, "rebuilt": True, "rows": 2})
+        self.assertEqual(snapshot.refresh(self.expense), {"appended": 0, "rebuilt": False, "rows": 2})
+        self.add(self.food_id, 20.0, '2024-08-01')
+        self.assertEqual(snapshot.refresh(self.expense), {"appended": 1, "rebuilt": False, "rows": 3})
+        self.assertMatchesDatabase(snapshot.load(self.expense, refresh_first=False))
+
+    def test_refresh_rebuilds_after_delete(self): # snapshot.refresh
+        snapshot.refresh(self.expense)
+        self.add(self.food_id, 20.0, '2024-08-01')
+        self.assertFalse(snapshot.refresh(self.expense)["rebuilt"])
+        self.expense.soft_delete_expense(self.first_id)
+        self.add(self.travel_id, 5.0, '2024-08-02')
+        result = snapshot.refresh(self.expense)
+        self.assertTrue(result["rebuilt"])
+        self.assertEqual(result["rows"], 3)
+        self.assertMatchesDatabase(snapshot.load(self.expense, refresh_first=False))
+        self.assertEqual(len([f for f in os.listdir(snapshot.snapshot_dir(self.expense)) if f.endswith('.bin')]), len(snapshot.COLUMNS))
+
+    def test_refresh_rebuilds_after_swap(self): # snapshot.refresh
+        second_id = self.add(self.food_id, 10.0, '2024-07-05')
+        self.expense.soft_delete_expense(self.first_id)
+        snapshot.refresh(self.expense)
+        # Same count and total as the snapshot, different rows
+        self.expense.soft_delete_expense(second_id)
+        self.expense.restore_expenses([self.first_id])
+        self.assertTrue(snapshot.refresh(self.expense)["rebuilt"])
+        self.assertMatchesDatabase(analytics.load_columns(self.expense))
+
+    def test_load_memory_maps(self): # snapshot.load
+        columns = analytics.load_columns(self.expense)
+        self.assertIsInstance(columns.amounts, np.memmap)
+        self.assertEqual(columns.dates.dtype, np.dtype('datetime64[D]'))
+        self.assertEqual(analytics.monthly_trend(columns).loc['2024-07', 'Travel'], 100.0)
+        self.assertMatchesDatabase(columns)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,42 @@
+import unittest
+import os
+import subprocess
+import sys
+
+HEAVY_MODULES = ('pandas', 'numpy', 'matplotlib')
+STARTUP_BUDGET_US = 250_000 # Generous, the heavy modules alone take several times this
+
+
+def import_times(module): # {module name: cumulative import time in microseconds} from python -X importtime
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=os.path.dirname(os.path.abspath(__file__)), stdin=subprocess.DEVNULL, capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and not line.endswith('| imported package'):
+            _, cumulative, name = line[len('import time:'):].split('|')
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+class TestStartup(unittest.TestCase):
+
+    def assertImportsLazily(self, module):
+        times = import_times(module)
+        eager = sorted(name for name in times if name.split('.')[0] in HEAVY_MODULES)
+        self.assertEqual(eager, [], f"importing {module} eagerly imports heavy modules")
+        self.assertLess(times[module], STARTUP_BUDGET_US, f"importing {module} took {times[module]}us")
+
+    def test_expense_import(self): # expense
+        self.assertImportsLazily('expense')
+
+    def test_category_import(self): # category
+        self.assertImportsLazily('category')
+
+    def test_cli_import(self): # cli
+        self.assertImportsLazily('cli')
+
+    def test_main_import(self): # main, asks for nothing until main() runs
+        self.assertImportsLazily('main')
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
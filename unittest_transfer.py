@@ -0,0 +1,100 @@
+import unittest
+import io
+import os
+import cli
+import transfer
+from connection import ConnectionManager
+
+OFX_STATEMENT = """OFXHEADER:100
+DATA:OFXSGML
+
+<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>
+<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20240724120000<TRNAMT>-50.25<FITID>1<NAME>Grocery<MEMO>Weekly shopping</STMTTRN>
+<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20240725<TRNAMT>1000.00<FITID>2<NAME>Salary</STMTTRN>
+<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20240726<TRNAMT>-12.00<FITID>3<NAME>Coffee</STMTTRN>
+</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>
+"""
+
+class TestTransfer(unittest.TestCase):
+
+    def setUp(self):
+        self.test_db_name = 'test_transfer_db.db'
+        self.category, self.expense = cli.open_database(self.test_db_name)
+
+    def tearDown(self):
+        ConnectionManager.for_database(self.test_db_name).close()
+        if os.path.exists(self.test_db_name):
+            os.remove(self.test_db_name)
+
+    def test_import_csv(self): # transfer.import_csv
+        food_id, _ = self.category.add_category('Food')
+        file = io.StringIO(
+            "date,category,description,amount\n"
+            "2024-07-24,Food,Lunch,120\n"
+            "2024-07-25,Travel,Taxi,80.5\n"
+            "2024-07-26,Travel,Train,40\n"
+            "26/07/2024,Food,Bad date,10\n"
+        )
+        summary = transfer.import_csv(self.expense, self.category, file, chunk_size=2)
+
+        self.assertEqual(summary["inserted"], 3)
+        self.assertEqual(summary["categories_created"], 1) # Only 'Travel' was missing
+        self.assertEqual([line for line, _ in summary["rejected"]], [5])
+        id_map = self.category.get_category_id_map()
+        self.assertEqual(id_map['Food'], food_id)
+        self.assertEqual(len(self.expense.get_expenses_by_category(id_map['Travel'])), 2)
+
+    def test_import_ofx(self): # transfer.import_ofx
+        summary = transfer.import_ofx(self.expense, self.category, io.StringIO(OFX_STATEMENT), category_name='Bank')
+
+        self.assertEqual(summary["inserted"], 2) # The credit is skipped
+        expenses = self.expense.get_all_expenses()
+        self.assertEqual([(exp[1], exp[3], exp[4], exp[5]) for exp in expenses], [
+            ("2024-07-24", 'Bank', "Grocery Weekly shopping", 50.25),
+            ("2024-07-26", 'Bank', "Coffee", 12.0),
+        ])
+
+    def test_ofx_tokens_across_blocks(self): # transfer._ofx_tokens
+        transfer.OFX_READ_SIZE, read_size = 7, transfer.OFX_READ_SIZE
+        try:
+            transactions = list(transfer._ofx_transactions(io.StringIO(OFX_STATEMENT)))
+        finally:
+            transfer.OFX_READ_SIZE = read_size
+        self.assertEqual([t["FITID"] for t in transactions], ['1', '2', '3'])
+
+    def test_export_csv(self): # transfer.export_csv
+        category_id, _ = self.category.add_category('Food')
+        self.expense.add_expenses({"category_id": category_id, "amount": 50.0, "date": "2024-07-24", "description": "Lunch"})
+        file = io.StringIO()
+        count = transfer.export_csv(self.expense, file)
+
+        self.assertEqual(count, 1)
+        self.assertEqual(file.getvalue().splitlines(), [
+            "expense_id,date,category_id,category_name,description,amount",
+            f"1,2024-07-24,{category_id},Food,Lunch,50.0",
+        ])
+
+    def test_cli_round_trip(self): # cli.main import/export
+        csv_name = 'test_transfer_export.csv'
+        try:
+            with open(csv_name, 'w', encoding='utf-8') as file:
+                file.write("date,category,description,amount\n2024-07-24,Food,Lunch,120\n")
+            self.assertEqual(cli.main([self.test_db_name, 'import', csv_name]), 0)
+            self.assertEqual(cli.main([self.test_db_name, 'export', csv_name]), 0)
+            with open(csv_name, encoding='utf-8') as file:
+                self.assertEqual(file.read().splitlines()[1], "1,2024-07-24,1,Food,Lunch,120.0")
+        finally:
+            if os.path.exists(csv_name):
+                os.remove(csv_name)
+
+    def test_cli_delete_open_range(self): # cli.delete_command
+        food_id, _ = self.category.add_category('Food')
+        for date in ('2024-01-15', '2024-02-15'):
+            self.expense.add_expenses({"category_id": food_id, "amount": 1.0, "date": date, "description": date})
+        self.assertEqual(cli.main([self.test_db_name, 'delete', '--to', '2024-01-31']), 0)
+        self.assertEqual([row[4] for row in self.expense.get_all_expenses()], ['2024-02-15'])
+        self.assertEqual(cli.main([self.test_db_name, 'restore', '--from', '2024-01-01']), 0)
+        self.assertEqual(len(self.expense.get_all_expenses()), 2)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)